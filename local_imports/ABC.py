@@ -0,0 +1,201 @@
+"""
+Model selection by approximate Bayesian computation with sequential
+Monte Carlo (ABC-SMC; Toni et al. 2009, with the importance weights of
+Toni and Stumpf 2010).
+
+Each particle is a model index m and a parameter vector theta, with a
+uniform prior over the models and a uniform prior on each model's box
+bounds[m] [k_m, 2]. simulator(m, theta) returns summary statistics, and
+particles are accepted when their distance to the observed summaries is
+below the tolerance of the generation. Later generations resample
+models through a kernel that keeps the model with probability stay, and
+perturb parameters with a gaussian kernel of twice the weighted variance
+of that model's previous particles, redrawn until inside the prior box
+(so the proposal density is normalized by the probability of landing
+inside, which differs between models). Proposals are simulated in batches
+over a process pool. The posterior model probabilities are the summed
+importance weights of each model's particles.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+from scipy.special import ndtr
+
+from .Utilities import pool_map
+
+
+def _simulate(task):
+    """ pool worker: summaries of one particle """
+    simulator, m, theta = task
+    return np.asarray(simulator(m, theta), dtype=float)
+
+def scaled_distance(scale):
+    """ euclidean distance between summaries, each divided by scale """
+    scale = np.asarray(scale, dtype=float)
+    def distance(summaries, observed):
+        return np.sqrt((((summaries - observed)/scale)**2).sum(-1))
+    return distance
+
+
+class ABCSMC(object):
+    """
+    ABC-SMC over len(bounds) models. simulator must be picklable (e.g.
+    an instance of a module-level class with __call__) and distance
+    maps summaries [n, s] and observed [s] to distances [n]. Simulation
+    failures (nan summaries) count as rejections.
+    """
+
+    def __init__(self, simulator, bounds, observed, distance, particles=200,
+                 stay=0.7, batch=None, processes=None, seed=None):
+        self.simulator = simulator
+        self.bounds = [np.asarray(b, dtype=float) for b in bounds]
+        self.observed = np.asarray(observed, dtype=float)
+        self.distance = distance
+        self.particles = particles
+        self.M = len(self.bounds)
+        self.batch = particles if batch is None else batch
+        self.processes = processes
+        self.rng = np.random.RandomState(seed)
+        self.simulations = 0
+        self.generations = []
+
+        # model kernel: stay with probability stay, else move uniformly
+        if self.M > 1:
+            move = (1 - stay)/(self.M - 1)
+            self.model_kernel = (stay*np.eye(self.M)
+                                 + move*(1 - np.eye(self.M)))
+        else: self.model_kernel = np.ones((1, 1))
+
+    def _in_prior(self, m, theta):
+        lo, hi = self.bounds[m].T
+        return np.all((theta >= lo) & (theta <= hi), axis=-1)
+
+    def _propose(self, n):
+        """ n proposals (models, thetas) from the prior or the last
+        generation """
+        if not self.generations:
+            models = self.rng.randint(0, self.M, n)
+            thetas = []
+            for m in models:
+                lo, hi = self.bounds[m].T
+                thetas.append(lo + self.rng.rand(len(lo))*(hi - lo))
+            return models, thetas
+
+        last = self.generations[-1]
+        models = self.rng.choice(self.M, n, p=last['model_proposal'])
+        thetas = []
+        for m in models:
+            pop = last['populations'][m]
+            while True:
+                j = self.rng.choice(len(pop['w']), p=pop['w'])
+                theta = pop['theta'][j] + self.rng.randn(
+                    pop['theta'].shape[1])*np.sqrt(pop['var'])
+                if self._in_prior(m, theta): break
+            thetas.append(theta)
+        return models, thetas
+
+    def _weights(self, models, thetas):
+        """ prior over proposal density of accepted particles """
+        if not self.generations: return np.ones(len(models))
+        last = self.generations[-1]
+        w = np.empty(len(models))
+        for i, (m, theta) in enumerate(zip(models, thetas)):
+            pop = last['populations'][m]
+            kern = np.exp(-0.5*(((theta - pop['theta'])**2)/pop['var'])
+                          .sum(1))/np.sqrt(np.prod(2*np.pi*pop['var']))
+            lo, hi = self.bounds[m].T
+            prior = 1/(self.M*np.prod(hi - lo))
+            w[i] = prior*pop['inside']/(last['model_proposal'][m]*
+                                        pop['w'].dot(kern))
+        return w
+
+    def generation(self, epsilon, max_simulations=np.inf):
+        """
+        Runs one generation at tolerance epsilon, until particles
+        particles are accepted or max_simulations simulations are spent.
+        Returns the generation (also stored in generations). Raises
+        RuntimeError if no particle is accepted.
+        """
+        models, thetas, dists = [], [], []
+        spent = 0
+        while len(models) < self.particles and spent < max_simulations:
+            m, th = self._propose(self.batch)
+            summaries = np.array(pool_map(
+                _simulate, [(self.simulator, mi, t) for mi, t in zip(m, th)],
+                self.processes))
+            d = self.distance(summaries, self.observed)
+            spent += len(m)
+            ok = np.nonzero(np.isfinite(d) & (d <= epsilon))[0]
+            models += [m[i] for i in ok]
+            thetas += [th[i] for i in ok]
+            dists += [d[i] for i in ok]
+        self.simulations += spent
+        if not models:
+            raise RuntimeError("ABC-SMC: no particle accepted at epsilon "
+                               "%g in %d simulations" % (epsilon, spent))
+
+        models = np.array(models[:self.particles], dtype=int)
+        thetas = thetas[:self.particles]
+        dists = np.array(dists[:self.particles])
+        w = self._weights(models, thetas)
+
+        probabilities = np.array([w[models == m].sum()
+                                  for m in range(self.M)])/w.sum()
+        populations = {}
+        for m in range(self.M):
+            if not np.any(models == m): continue
+            th = np.array([t for t, mi in zip(thetas, models) if mi == m])
+            wm = w[models == m]/w[models == m].sum()
+            mean = wm.dot(th)
+            var = 2*np.maximum(wm.dot((th - mean)**2), 1E-12)
+            # probability that a perturbed particle is inside the prior
+            lo, hi = self.bounds[m].T
+            sd = np.sqrt(var)
+            inside = np.prod(ndtr((hi - th)/sd) - ndtr((lo - th)/sd), 1)
+            populations[m] = {'theta' : th, 'w' : wm, 'var' : var,
+                              'inside' : wm.dot(inside)}
+
+        proposal = probabilities.dot(self.model_kernel)
+        proposal[[m for m in range(self.M) if m not in populations]] = 0
+        gen = {'epsilon'        : epsilon,
+               'models'         : models,
+               'thetas'         : thetas,
+               'weights'        : w/w.sum(),
+               'distances'      : dists,
+               'probabilities'  : probabilities,
+               'populations'    : populations,
+               'model_proposal' : proposal/proposal.sum(),
+               'simulations'    : spent,
+               'acceptance'     : len(models)/max(spent, 1)}
+        self.generations.append(gen)
+        return gen
+
+    def run(self, generations=5, epsilons=None, quantile=0.5,
+            budget=np.inf):
+        """
+        Runs generations at the given epsilons, or adaptively at the
+        quantile of the previous generation's distances (the first
+        accepting everything), within a total budget of simulations.
+        Returns the posterior model probabilities of the last complete
+        generation, or None if the budget ran out before the first one
+        was complete.
+        """
+        for g in range(generations):
+            if epsilons is not None: eps = epsilons[g]
+            elif not self.generations: eps = np.inf
+            else:
+                eps = np.percentile(self.generations[-1]['distances'],
+                                    100*quantile)
+            left = budget - self.simulations
+            if left <= 0: break
+            try: gen = self.generation(eps, left)
+            except RuntimeError: break  # budget spent, nothing accepted
+            if len(gen['models']) < self.particles:
+                # budget spent mid-generation: keep the previous one
+                self.generations.pop()
+                break
+        if not self.generations: return None
+        return self.generations[-1]['probabilities']
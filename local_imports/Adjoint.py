@@ -0,0 +1,113 @@
+"""
+Adjoint gradients of trajectory functionals with respect to parameters.
+
+For a functional of the solution of y' = f(t, y, p) on (t0, tf),
+    G = int_t0^tf g(t, y) dt + h(y(tf)),
+the adjoint lambda solves, backwards from lambda(tf) = dh/dy,
+    lambda' = -(df/dy)^T lambda - dg/dy
+and dG/dp = int_t0^tf lambda^T df/dp dt, dG/dy0 = lambda(t0). One forward
+solve (kept as a dense Trajectory) and one backward solve give the whole
+gradient, and the backward system has the size of the state, so the cost
+does not grow with the number of parameters the way the forward
+sensitivities of Oscillator.first_order_sensitivity do. The parameter
+jacobian only enters the quadrature, through lambda^T df/dp.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+
+
+class Functional(object):
+    """
+    G = int g(t, y) dt + h(y(tf)). dgdy(t, y) and dhdy(y) are the
+    gradients of g and h; a term that is None is zero.
+    """
+
+    def __init__(self, g=None, dgdy=None, h=None, dhdy=None):
+        self.g = g
+        self.dgdy = dgdy
+        self.h = h
+        self.dhdy = dhdy
+
+    def running(self, t, y): return 0. if self.g is None else self.g(t, y)
+
+    def final(self, y): return 0. if self.h is None else self.h(y)
+
+
+def linear(c, final=False):
+    """ int c.y dt, or c.y(tf) if final """
+    c = np.asarray(c, dtype=float)
+    if final: return Functional(h=lambda y: c.dot(y), dhdy=lambda y: c)
+    return Functional(lambda t, y: c.dot(y), lambda t, y: c)
+
+def tracking(c, target):
+    """ int (c.y - target(t))^2 dt, the squared distance of a linear
+    readout of the state from a target signal """
+    c = np.asarray(c, dtype=float)
+    def g(t, y): return (c.dot(y) - target(t))**2
+    def dgdy(t, y): return 2*(c.dot(y) - target(t))*c
+    return Functional(g, dgdy)
+
+
+def _jacobians(osc):
+    """ d(ode)/dy (sparse where the model supplies it) and d(ode)/dp, as
+    functions of (t, y) """
+    backend, p = osc.backend, np.asarray(osc.param, dtype=float)
+    if backend.name == 'scipy':
+        model = backend.model
+        return (lambda t, y: model.jac(t, y, p),
+                lambda t, y: np.asarray(model.jacp(t, y, p)))
+    return (lambda t, y: backend.jac_y(y, osc.param, t),
+            lambda t, y: backend.jac_p(y, osc.param, t))
+
+def gradient(osc, functional, tf, y0=None, t0=0., numsteps=1000,
+             abstol=None, reltol=None, method='BDF'):
+    """
+    Value and gradient of functional along the solution of osc from y0
+    (osc.y0 by default) on (t0, tf). Returns a dict with G, dGdp [np],
+    dGdy0 [neq] and the forward Trajectory. Tolerances default to the
+    integration options of osc.
+    """
+    if abstol is None: abstol = osc.intoptions['int_abstol']
+    if reltol is None: reltol = osc.intoptions['int_reltol']
+    traj = osc.trajectory(tf, y0, t0, numsteps, silent=True)
+    jac_y, jac_p = _jacobians(osc)
+    neq, npar = osc.neq, osc.np
+    zero = np.zeros(neq)
+
+    # z = [lambda, mu, q]: mu' = -lambda^T df/dp and q' = -g integrate
+    # dG/dp and the running cost back from zero at tf
+    def fun(t, z):
+        y = traj(t)
+        lam = z[:neq]
+        dgdy = zero if functional.dgdy is None else functional.dgdy(t, y)
+        dlam = -(jac_y(t, y).T.dot(lam)) - dgdy
+        dmu = -jac_p(t, y).T.dot(lam)
+        return np.hstack([dlam, dmu, -functional.running(t, y)])
+
+    def jac(t, z):
+        y = traj(t)
+        J = sp.csr_matrix(jac_y(t, y))
+        P = sp.csr_matrix(jac_p(t, y))
+        Z = sp.csr_matrix((neq + npar + 1, npar + 1))
+        left = sp.vstack([-J.T, -P.T, sp.csr_matrix((1, neq))])
+        return sp.hstack([left, Z], format='csr')
+
+    yf = traj.ys[-1]
+    lamf = zero if functional.dhdy is None else functional.dhdy(yf)
+    zf = np.hstack([lamf, np.zeros(npar + 1)])
+    sol = solve_ivp(fun, (traj.tf, traj.t0), zf, method=method, jac=jac,
+                    rtol=reltol, atol=abstol)
+    if sol.status < 0:
+        raise RuntimeError("solve_ivp: " + sol.message)
+    z0 = sol.y[:, -1]
+
+    return {'G'     : z0[-1] + functional.final(yf),
+            'dGdp'  : z0[neq:neq + npar],
+            'dGdy0' : z0[:neq],
+            'traj'  : traj}
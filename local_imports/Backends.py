@@ -0,0 +1,523 @@
+"""
+Solver backends for the Oscillator class in LimitCycle.
+
+The CasadiBackend wraps a casadi SXFunction and the SUNDIALS solvers
+(cvodes, kinsol), exactly as the Oscillator always has. The ScipyBackend
+drives scipy.integrate.solve_ivp and scipy.optimize.root from a
+NumpyModel, i.e. a vectorized numpy right-hand side with an optional
+(sparse) jacobian. Both expose the same small set of operations, so the
+Oscillator does not need to know which one it is using.
+
+jha
+"""
+
+from __future__ import division
+from time import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+from scipy.optimize import root
+
+from .SolverStats import COUNTERS
+
+try:
+    import casadi as cs
+except ImportError:
+    cs = None
+
+
+class NumpyModel(object):
+    """
+    Numpy counterpart of the casadi SXFunction models. ode(t, y, p)
+    returns dy/dt and, if vectorized, must accept y of shape [neq, k].
+    jac(t, y, p) returns d(ode)/dy, dense or scipy.sparse, and jacp(t, y,
+    p) returns d(ode)/dp. Jacobians that are not supplied are found by
+    complex-step differentiation, so ode must then accept complex input.
+    """
+
+    def __init__(self, ode, ylabels, plabels, jac=None, jacp=None,
+                 vectorized=True, name='numpy model'):
+        self.ode = ode
+        self.ylabels = list(ylabels)
+        self.plabels = list(plabels)
+        self.neq = len(self.ylabels)
+        self.np = len(self.plabels)
+        self._jac = jac
+        self._jacp = jacp
+        self.vectorized = vectorized
+        self.name = name
+
+    def jac(self, t, y, p):
+        """ d(ode)/dy at (t, y, p) """
+        if self._jac is not None: return self._jac(t, y, p)
+        y = np.asarray(y, dtype=float)
+        h = 1E-30
+        if self.vectorized:
+            # one vectorized call, column i perturbed in y[i]
+            yc = y[:,None] + 1j*h*np.eye(self.neq)
+            return np.imag(self.ode(t, yc, p))/h
+        return complex_step(lambda yc: self.ode(t, yc, p), y)
+
+    def jacp(self, t, y, p, index=None):
+        """ d(ode)/dp at (t, y, p), for the parameters in index (all by
+        default) """
+        if self._jacp is not None:
+            if index is None: return self._jacp(t, y, p)
+            return _dense(self._jacp(t, y, p))[:, index]
+        return complex_step(lambda pc: self.ode(t, y, pc), p, index=index)
+
+
+def complex_step(fn, x, h=1E-30, index=None):
+    """ Jacobian of fn at x by complex-step differentiation, one column
+    per entry of x (or of x[index]). Exact to machine precision for
+    analytic fn. """
+    x = np.asarray(x, dtype=float)
+    if index is None: index = range(len(x))
+    cols = []
+    for i in index:
+        xc = x.astype(complex)
+        xc[i] += 1j*h
+        cols += [np.imag(fn(xc))/h]
+    return np.array(cols).T
+
+
+def default_backend(model):
+    """ Backend matching the type of model """
+    if isinstance(model, NumpyModel): return ScipyBackend(model)
+    return CasadiBackend(model)
+
+
+class CasadiBackend(object):
+    """
+    Integration, shooting, sensitivities and root finding through casadi
+    2.3 and SUNDIALS. This is the original Oscillator code path.
+    """
+
+    name = 'casadi'
+
+    def __init__(self, model):
+        self.counters = {}
+        self.model = model
+        self.model.init()
+        self.neq = self.model.input(cs.DAE_X).size()
+        self.np = self.model.input(cs.DAE_P).size()
+
+        self.jacp = self.model.jacobian(cs.DAE_P,0); self.jacp.init()
+        self.jacy = self.model.jacobian(cs.DAE_X,0); self.jacy.init()
+
+        self.ylabels = [self.model.inputExpr(cs.DAE_X)[i].getName()
+                        for i in xrange(self.neq)]
+        self.plabels = [self.model.inputExpr(cs.DAE_P)[i].getName()
+                        for i in xrange(self.np)]
+
+        self.modlT = self._modified_model()
+
+    def _count(self, fn):
+        """ add the solver statistics of an evaluated casadi function to
+        the running counters """
+        try: stats = fn.getStats()
+        except Exception: return
+        for key in COUNTERS:
+            if key in stats:
+                self.counters[key] = self.counters.get(key, 0) + stats[key]
+
+    def _modified_model(self):
+        """
+        Creates a new casadi model with period as a parameter, such that
+        the model has an oscillatory period of 1. Necessary for the
+        exact determinination of the period and initial conditions
+        through the BVP method. (see Wilkins et. al. 2009 SIAM J of Sci
+        Comp)
+        """
+
+        pSX = self.model.inputExpr(cs.DAE_P)
+        T = cs.SX.sym("T")
+        pTSX = cs.vertcat([pSX, T])
+
+        t = self.model.inputExpr(cs.DAE_T)
+        sys = self.model.inputExpr(cs.DAE_X)
+        ode = self.model.outputExpr()[0]*T
+
+        modlT = cs.SXFunction(
+            cs.daeIn(t=t,x=sys,p=pTSX),
+            cs.daeOut(ode=ode)
+            )
+
+        modlT.setOption("name","T-shifted model")
+        return modlT
+
+    def integrate(self, y0, param, ts, abstol, reltol, max_num_steps,
+                  silent=False):
+        """ Solution on the time grid ts, shape [len(ts), neq] """
+
+        self.integrator = cs.Integrator('cvodes',self.model)
+
+        #Set up the tolerances etc.
+        self.integrator.setOption("abstol", abstol)
+        self.integrator.setOption("reltol", reltol)
+        self.integrator.setOption("max_num_steps", max_num_steps)
+        self.integrator.setOption("t0", ts[0])
+        self.integrator.setOption("tf", ts[-1])
+        if silent:
+            self.integrator.setOption("disable_internal_warnings", True)
+
+        #Let's integrate
+        self.integrator.init()
+        self.simulator = cs.Simulator(self.integrator, ts)
+        self.simulator.init()
+        self.simulator.setInput(y0,cs.INTEGRATOR_X0)
+        self.simulator.setInput(param,cs.INTEGRATOR_P)
+        self.simulator.evaluate()
+        self._count(self.integrator)
+
+        return self.simulator.output().toArray().T
+
+    def dense(self, y0, param, t0, tf, abstol, reltol, max_num_steps,
+              numsteps=1000, silent=False):
+        """ Nodes ts and states [len(ts), neq] for dense output. The
+        simulator does not expose cvodes' internal steps, so the nodes
+        are an even grid of numsteps points """
+        ts = np.linspace(t0, tf, numsteps)
+        return ts, self.integrate(y0, param, ts, abstol, reltol,
+                                  max_num_steps, silent)
+
+    def shooting(self, param, abstol, reltol):
+        """ Returns flow(y0, T), the state after integrating y0 for time
+        T, through the period-rescaled model """
+
+        self.bvpint = cs.Integrator('cvodes',self.modlT)
+        self.bvpint.setOption('abstol',abstol)
+        self.bvpint.setOption('reltol',reltol)
+        self.bvpint.setOption('tf',1)
+        self.bvpint.setOption('disable_internal_warnings', True)
+        self.bvpint.setOption('fsens_err_con', True)
+        self.bvpint.init()
+
+        paramset = list(param)
+        def flow(y0, T):
+            self.bvpint.setInput(y0, cs.INTEGRATOR_X0)
+            self.bvpint.setInput(paramset + [T], cs.INTEGRATOR_P)
+            self.bvpint.evaluate()
+            self._count(self.bvpint)
+            return self.bvpint.output().toArray().flatten()
+
+        return flow
+
+    def rhs(self, y, param, t=0.):
+        """ model evaluated at a single state """
+        self.model.setInput(t,cs.DAE_T)
+        self.model.setInput(y,cs.DAE_X)
+        self.model.setInput(param,cs.DAE_P)
+        self.model.evaluate()
+        return self.model.output().toArray().flatten()
+
+    def jac_p(self, y, param, t=0.):
+        """ d(model)/dp at a single state """
+        self.jacp.setInput(t,cs.DAE_T)
+        self.jacp.setInput(y,cs.DAE_X)
+        self.jacp.setInput(param,cs.DAE_P)
+        self.jacp.evaluate()
+        return self.jacp.output().toArray()
+
+    def jac_y(self, y, param, t=0.):
+        """ d(model)/dy at a single state """
+        self.jacy.setInput(t,cs.DAE_T)
+        self.jacy.setInput(y,cs.DAE_X)
+        self.jacy.setInput(param,cs.DAE_P)
+        self.jacy.evaluate()
+        return self.jacy.output().toArray()
+
+    def sensitivity(self, y0, param, tf, abstol, reltol, max_num_steps,
+                    method='staggered', wrt='x0'):
+        """ Jacobian of the state at tf with respect to the initial
+        condition (wrt='x0') or the parameters (wrt='p') """
+
+        integrator = cs.Integrator('cvodes',self.model)
+        integrator.setOption("abstol", abstol)
+        integrator.setOption("reltol", reltol)
+        integrator.setOption("max_num_steps", max_num_steps)
+        integrator.setOption("sensitivity_method", method)
+        integrator.setOption("t0", 0)
+        integrator.setOption("tf", tf)
+        integrator.setOption("fsens_err_con", 1)
+        integrator.setOption("fsens_abstol", abstol)
+        integrator.setOption("fsens_reltol", reltol)
+        integrator.init()
+        integrator.setInput(y0, cs.INTEGRATOR_X0)
+        integrator.setInput(param, cs.INTEGRATOR_P)
+
+        iwrt = cs.INTEGRATOR_X0 if wrt=='x0' else cs.INTEGRATOR_P
+        jac = integrator.jacobian(iwrt, cs.INTEGRATOR_XF)
+        jac.init()
+        jac.setInput(y0,"x0")
+        jac.setInput(param,"p")
+        jac.evaluate()
+        self._count(jac)
+        return jac.output().toArray()
+
+    def average(self, y0, param, T, abstol, reltol, max_num_steps):
+        """ integrals of y and y**2 over [0, T] by cvodes quadrature """
+
+        ffcn_in = self.model.inputExpr()
+        ode = self.model.outputExpr()
+        quad = cs.vertcat([ffcn_in[cs.DAE_X], ffcn_in[cs.DAE_X]**2])
+
+        quadmodel = cs.SXFunction(ffcn_in, cs.daeOut(ode=ode[0], quad=quad))
+
+        qint = cs.Integrator('cvodes',quadmodel)
+        qint.setOption("abstol"        , abstol)
+        qint.setOption("reltol"        , reltol)
+        qint.setOption("max_num_steps" , max_num_steps)
+        qint.setOption("tf",T)
+        qint.init()
+        qint.setInput(y0, cs.INTEGRATOR_X0)
+        qint.setInput(param, cs.INTEGRATOR_P)
+        qint.evaluate()
+        self._count(qint)
+        quad_out = qint.output(cs.INTEGRATOR_QF).toArray().squeeze()
+        return quad_out[:self.neq], quad_out[self.neq:]
+
+    def steady_state(self, guess, param, abstol, positive=True):
+        """ root of the model by kinsol """
+
+        y = self.model.inputExpr(cs.DAE_X)
+        t = self.model.inputExpr(cs.DAE_T)
+        p = self.model.inputExpr(cs.DAE_P)
+        ode = self.model.outputExpr()
+        fn = cs.SXFunction([y,t,p],ode)
+        kfn = cs.ImplicitFunction('kinsol',fn)
+        kfn.setOption("abstol",abstol)
+        if positive:
+            # constain using kinsol to >0, for physical
+            kfn.setOption("constraints",(2,)*self.neq)
+        kfn.setOption("linear_solver_type","dense")
+        kfn.setOption("exact_jacobian",True)
+        kfn.setOption("u_scale",(100/guess).tolist())
+        kfn.setOption("disable_internal_warnings",True)
+        kfn.init()
+        kfn.setInput(param,2)
+        kfn.setInput(guess)
+        kfn.evaluate()
+        self._count(kfn)
+        return kfn.output().toArray()
+
+
+class ScipyBackend(object):
+    """
+    Integration, shooting, sensitivities and root finding through
+    scipy.integrate.solve_ivp and scipy.optimize.root, driven by a
+    NumpyModel. method is any implicit solve_ivp method ('BDF', 'LSODA',
+    'Radau'); the model jacobian is passed on, sparse where the model
+    provides it. max_num_steps has no solve_ivp equivalent and is
+    ignored.
+    """
+
+    name = 'scipy'
+
+    def __init__(self, model, method='BDF'):
+        self.counters = {}
+        self.model = model
+        self.method = method
+        self.neq = model.neq
+        self.np = model.np
+        self.ylabels = model.ylabels
+        self.plabels = model.plabels
+
+    def _solve(self, fun, jac, y0, t_span, t_eval, abstol, reltol,
+               vectorized=False):
+        """ solve_ivp call shared by all operations, returns the solution
+        at t_eval, shape [len(y0), len(t_eval)]. Solver counters are
+        updated; solve_ivp does not report error-test or newton
+        failures. """
+        kwargs = {}
+        if self.method == 'LSODA':
+            # lsoda wants a dense jacobian
+            kwargs['jac'] = lambda t, y: _dense(jac(t, y))
+        elif self.method in ('BDF', 'Radau'):
+            kwargs['jac'] = jac
+        sol = solve_ivp(fun, t_span, y0, method=self.method,
+                        dense_output=True, rtol=reltol, atol=abstol,
+                        vectorized=vectorized, **kwargs)
+        if sol.status < 0:
+            raise RuntimeError("solve_ivp: " + sol.message)
+
+        for key, val in [('nsteps', len(sol.t)-1), ('nfevals', sol.nfev),
+                         ('njevals', sol.njev), ('nlinsetups', sol.nlu)]:
+            self.counters[key] = self.counters.get(key, 0) + val
+        self.last_solution = sol
+
+        return sol.sol(np.asarray(t_eval, dtype=float)).reshape(
+            len(y0), -1)
+
+    def integrate(self, y0, param, ts, abstol, reltol, max_num_steps,
+                  silent=False):
+        """ Solution on the time grid ts, shape [len(ts), neq] """
+        ts = np.asarray(ts, dtype=float)
+        y0 = np.asarray(y0, dtype=float)
+        if ts[-1] == ts[0]: return np.tile(y0, (len(ts), 1))
+        p = np.asarray(param, dtype=float)
+        sol = self._solve(lambda t, y: self.model.ode(t, y, p),
+                          lambda t, y: self.model.jac(t, y, p),
+                          y0, (ts[0], ts[-1]), ts, abstol, reltol,
+                          vectorized=self.model.vectorized)
+        return sol.T
+
+    def dense(self, y0, param, t0, tf, abstol, reltol, max_num_steps,
+              numsteps=None, silent=False):
+        """ Nodes ts and states [len(ts), neq] for dense output: the
+        solver's accepted steps """
+        y0 = np.asarray(y0, dtype=float)
+        p = np.asarray(param, dtype=float)
+        self._solve(lambda t, y: self.model.ode(t, y, p),
+                    lambda t, y: self.model.jac(t, y, p),
+                    y0, (t0, tf), [tf], abstol, reltol,
+                    vectorized=self.model.vectorized)
+        ts = self.last_solution.sol.ts
+        return ts, self.last_solution.sol(ts).T
+
+    def shooting(self, param, abstol, reltol):
+        """ Returns flow(y0, T), the state after integrating y0 for time
+        T """
+        def flow(y0, T):
+            return self.integrate(y0, param, [0, T], abstol, reltol,
+                                  None)[-1]
+        return flow
+
+    def rhs(self, y, param, t=0.):
+        """ model evaluated at a single state """
+        return self.model.ode(t, np.asarray(y, dtype=float),
+                              np.asarray(param, dtype=float))
+
+    def jac_p(self, y, param, t=0.):
+        """ d(model)/dp at a single state """
+        return _dense(self.model.jacp(t, np.asarray(y, dtype=float),
+                                      np.asarray(param, dtype=float)))
+
+    def jac_y(self, y, param, t=0.):
+        """ d(model)/dy at a single state """
+        return _dense(self.model.jac(t, np.asarray(y, dtype=float),
+                                     np.asarray(param, dtype=float)))
+
+    def sensitivity(self, y0, param, tf, abstol, reltol, max_num_steps,
+                    method=None, wrt='x0'):
+        """ Jacobian of the state at tf with respect to the initial
+        condition (wrt='x0') or the parameters (wrt='p'), from the
+        forward variational equations. The newton matrix ignores the
+        second-derivative coupling back to y, which only affects
+        convergence speed, not the solution. """
+
+        p = np.asarray(param, dtype=float)
+        neq = self.neq
+        m = neq if wrt=='x0' else self.np
+        S0 = np.eye(neq) if wrt=='x0' else np.zeros((neq, m))
+
+        def fun(t, z):
+            y = z[:neq]
+            S = z[neq:].reshape(neq, m)
+            J = self.model.jac(t, y, p)
+            dS = J.dot(S)
+            if wrt=='p': dS = dS + _dense(self.model.jacp(t, y, p))
+            return np.hstack([self.model.ode(t, y, p), np.ravel(dS)])
+
+        def jac(t, z):
+            J = sp.csr_matrix(self.model.jac(t, z[:neq], p))
+            # S is stored row-major, so dS = J S acts as kron(J, I)
+            return sp.block_diag([J, sp.kron(J, sp.eye(m))], format='csr')
+
+        z0 = np.hstack([np.asarray(y0, dtype=float), S0.ravel()])
+        sol = self._solve(fun, jac, z0, (0, tf), [tf], abstol, reltol)
+        return sol[neq:,-1].reshape(neq, m)
+
+    def amplitude_response(self, y0, seeds, dphidx, param, avg, scale, tf,
+                           abstol, reltol, max_num_steps):
+        """ ARC quadrature of Oscillator: integral over [0, tf] of
+        2*(S - dphidx*scale*f)*(y - avg), with S the response to
+        perturbations along the columns of seeds [neq, m] and dphidx their
+        phase responses [m]. Returns [neq, m]. As in sensitivity, the
+        newton matrix leaves out the quadrature rows' dependence on y and
+        S. """
+
+        p = np.asarray(param, dtype=float)
+        avg = np.asarray(avg, dtype=float)
+        dphidx = np.atleast_1d(np.asarray(dphidx, dtype=float))
+        seeds = np.asarray(seeds, dtype=float).reshape(self.neq, -1)
+        neq, m = seeds.shape
+
+        def fun(t, z):
+            y = z[:neq]
+            S = z[neq:neq*(m + 1)].reshape(neq, m)
+            f = self.model.ode(t, y, p)
+            dS = self.model.jac(t, y, p).dot(S)
+            quad = 2*(S - scale*np.outer(f, dphidx))*(y - avg)[:, None]
+            return np.hstack([f, np.ravel(dS), np.ravel(quad)])
+
+        def jac(t, z):
+            J = sp.csr_matrix(self.model.jac(t, z[:neq], p))
+            return sp.block_diag([J, sp.kron(J, sp.eye(m)),
+                                  sp.csr_matrix((neq*m, neq*m))],
+                                 format='csr')
+
+        z0 = np.hstack([np.asarray(y0, dtype=float), seeds.ravel(),
+                        np.zeros(neq*m)])
+        sol = self._solve(fun, jac, z0, (0, tf), [tf], abstol, reltol)
+        return sol[neq*(m + 1):, -1].reshape(neq, m)
+
+    def average(self, y0, param, T, abstol, reltol, max_num_steps):
+        """ integrals of y and y**2 over [0, T], as quadrature states """
+
+        p = np.asarray(param, dtype=float)
+        neq = self.neq
+
+        def fun(t, z):
+            y = z[:neq]
+            return np.hstack([self.model.ode(t, y, p), y, y**2])
+
+        def jac(t, z):
+            y = z[:neq]
+            J = sp.csr_matrix(self.model.jac(t, y, p))
+            Z = sp.csr_matrix((neq, 2*neq))
+            return sp.bmat([[J, Z], [sp.eye(neq), Z], [sp.diags(2*y), Z]],
+                           format='csr')
+
+        z0 = np.hstack([np.asarray(y0, dtype=float), np.zeros(2*neq)])
+        sol = self._solve(fun, jac, z0, (0, T), [T], abstol, reltol)
+        zf = sol[:,-1]
+        return zf[neq:2*neq], zf[2*neq:]
+
+    def steady_state(self, guess, param, abstol, positive=True):
+        """ root of the model by scipy.optimize.root """
+        p = np.asarray(param, dtype=float)
+        out = root(lambda y: self.model.ode(0., y, p), guess,
+                   jac=lambda y: _dense(self.model.jac(0., y, p)),
+                   tol=abstol, method='hybr')
+        self.counters['nfevals'] = self.counters.get('nfevals', 0) + out.nfev
+        self.counters['njevals'] = (self.counters.get('njevals', 0) +
+                                    out.get('njev', 0))
+        if not out.success: return np.nan*np.ones(self.neq)
+        return out.x
+
+
+def _dense(mat):
+    """ dense array from a dense or scipy.sparse matrix """
+    if sp.issparse(mat): return mat.toarray()
+    return np.asarray(mat)
+
+
+def fastest_backend(models, param, y0, tf=24., numsteps=100):
+    """
+    Times a short integration of each candidate model and returns the
+    name of the fastest, along with all timings. models is a dict of
+    name -> model, e.g. {'casadi': SXFunction, 'scipy': NumpyModel} for
+    the same equations; which wins depends mostly on model size.
+    """
+    from .LimitCycle import Oscillator
+
+    timings = {}
+    for name, model in models.items():
+        osc = Oscillator(model, param, y0=y0)
+        start = time()
+        osc.int_odes(tf, numsteps=numsteps)
+        timings[name] = time() - start
+
+    return min(timings, key=timings.get), timings
@@ -0,0 +1,131 @@
+"""
+Stroboscopic (circle) maps of a forced phase oscillator.
+
+Over one cycle of a periodic forcing of period Tf, the phase reduction
+    dphi/dt = omega + Z(phi) u(s, phi),   s = t/Tf in (0, 1)
+takes the phase at the start of the cycle to the phase at its end,
+phi -> F(phi). F is the phase transition curve of the whole cycle: the
+composition of the infinitesimal ones, x -> x + Z(x)u dt, along the
+way (compare Utilities.ptc_from_prc for a single pulse). It is tabulated
+once on a grid of phases, for many forcing conditions at once, and then
+iterated by interpolation. A stable fixed point of F - 2pi is 1:1
+entrainment, at the phase it locks to, and F' there is the factor by
+which a phase error shrinks each cycle.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .PhaseReduction import integrate_phases
+
+
+class CircleMap(object):
+    """
+    Maps for P forcing conditions, from a PhaseTable of the oscillator.
+    omega [P] is the free-running angular frequency (rad/h) and period
+    [P] the forcing period in each condition. drive(s, phi) returns the
+    perturbation u for phases phi [P, res] at cycle time s, broadcastable
+    to [P, res]. The map is tabulated on res phases with steps RK4 steps
+    per cycle, through the PRC of state.
+    """
+
+    def __init__(self, table, omega, period, drive, state=0, res=128,
+                 steps=200):
+        self.table = table
+        self.omega = np.atleast_1d(np.asarray(omega, dtype=float))
+        self.period = np.atleast_1d(np.asarray(period, dtype=float))
+        self.omega, self.period = np.broadcast_arrays(self.omega,
+                                                      self.period)
+        self.P = len(self.omega)
+        self.res = res
+        self.phis = np.linspace(0, 2*np.pi, res, endpoint=False)
+
+        prc = table.prc[:, table._index(state)]
+        omega, period = self.omega[:, None], self.period[:, None]
+        shape = (self.P, res)
+
+        # in cycle time s, dphi/ds = Tf*(omega + Z(phi) u)
+        def dphids(s, phi):
+            phi = phi.reshape(shape)
+            u = drive(s, phi)
+            return (period*(omega + table.interp(prc, phi)*u)).ravel()
+
+        phi0 = np.tile(self.phis, self.P)
+        end = integrate_phases(dphids, phi0, 1., 1/steps, steps)[1][-1]
+        # displacement over one cycle, F(phi) - phi
+        self.displacement = end.reshape(shape) - self.phis
+
+    def _displacement(self, phi):
+        """ interpolated displacement at phases phi [P, ...] """
+        x = np.mod(phi, 2*np.pi)*(self.res/(2*np.pi))
+        i0 = x.astype(int) % self.res
+        frac = x - np.floor(x)
+        rows = np.arange(self.P).reshape((-1,) + (1,)*(phi.ndim - 1))
+        d0 = self.displacement[rows, i0]
+        d1 = self.displacement[rows, (i0 + 1) % self.res]
+        return d0 + frac*(d1 - d0)
+
+    def __call__(self, phi):
+        """ F(phi) for phases phi [P, ...] (unwrapped) """
+        phi = np.asarray(phi, dtype=float)
+        return phi + self._displacement(phi)
+
+    def iterate(self, phi0, cycles):
+        """ phases at the start of each of cycles forcing cycles, from
+        phi0 [P, ...]. Returns [cycles + 1, P, ...] """
+        phi = np.asarray(phi0, dtype=float)
+        out = np.empty((cycles + 1,) + phi.shape)
+        out[0] = phi
+        for i in range(cycles):
+            phi = self(phi)
+            out[i+1] = phi
+        return out
+
+    def rotation_number(self, cycles=200, transient=100, starts=4):
+        """ oscillator cycles per forcing cycle, from starts initial
+        phases after transient cycles. [P, starts] """
+        phi0 = np.tile(np.linspace(0, 2*np.pi, starts, endpoint=False),
+                       (self.P, 1))
+        phi = self.iterate(phi0, transient)[-1]
+        end = self.iterate(phi, cycles)[-1]
+        return (end - phi)/(2*np.pi*cycles)
+
+    def fixed_points(self, p=1):
+        """
+        Stable p:1 locked phase of each condition (nan if none) and the
+        multiplier F' there. Fixed points are the downward crossings of
+        the displacement through 2pi*p, located by linear interpolation;
+        the first with |F'| < 1 is returned.
+        """
+        g = self.displacement - 2*np.pi*p
+        g1 = np.roll(g, -1, axis=1)
+        dphi = 2*np.pi/self.res
+        cross = (g > 0) & (g1 <= 0)
+        frac = np.where(cross, g/np.where(cross, g - g1, 1), 0)
+        multiplier = 1 + (g1 - g)/dphi
+        stable = cross & (np.abs(multiplier) < 1)
+
+        found = stable.any(1)
+        first = np.argmax(stable, axis=1)
+        rows = np.arange(self.P)
+        phase = np.mod(self.phis[first] + frac[rows, first]*dphi, 2*np.pi)
+        return (np.where(found, phase, np.nan),
+                np.where(found, multiplier[rows, first], np.nan))
+
+    def predict(self, tol=0.01):
+        """
+        Entrainment of each condition: locked (stable 1:1 fixed point,
+        confirmed by the rotation number within tol), the locked phase
+        at the start of the forcing cycle, its multiplier and the
+        rotation number.
+        """
+        phase, multiplier = self.fixed_points()
+        rotation = self.rotation_number().mean(1)
+        locked = np.isfinite(phase) & (np.abs(rotation - 1) < tol)
+        return {'locked'     : locked,
+                'phase'      : np.where(locked, phase, np.nan),
+                'multiplier' : np.where(locked, multiplier, np.nan),
+                'rotation'   : rotation}
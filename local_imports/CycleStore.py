@@ -0,0 +1,174 @@
+"""
+Persistent store of limit-cycle solutions for Oscillator.
+
+Finding y0 and T (burn-in, approximation and BVP), the PRCs, ARCs and
+averages is repeated for every Oscillator of the same model and
+parameters. A CycleStore keeps them on disk between sessions:
+    path/<model key>/<entry key>.npz
+The model key is a hash of the state and parameter labels and of the
+Oscillator's build, the description of how its model was built (for an
+Experiment, the builder and all of its arguments), so rebuilding a
+model with the same options finds its entries again and models built
+with any different option never share them. The entry key hashes the
+backend, the parameter vector and the solver tolerances (intoptions).
+Entries hold y0, T, the limit-cycle samples (sol), the PRCs (prc_ts,
+sPRC, pPRC), the ARCs (arc_ts, sARC, pARC) and the averages (avg, rms,
+std), whichever have been found.
+
+    store = CycleStore('results/cycles')
+    osc = experiment.oscillator(None, store=store, warm_start=True)
+
+then restores y0 and T (and any stored PRC, ARC or averages) in
+calc_y0 instead of solving for them. On a miss with warm_start, the
+BVP is started from the stored entry of the same model nearest in
+parameters. calc_y0, find_prc, average and findARC_whole add their
+results to the entry.
+
+jha
+"""
+
+from __future__ import division
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# attributes of Oscillator that are stored
+products = ['y0', 'T', 'sol', 'prc_ts', 'sPRC', 'pPRC', 'arc_ts', 'sARC',
+            'pARC', 'avg', 'rms', 'std']
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def _format(values):
+    return ','.join('%.12g' % v for v in np.ravel(values))
+
+def _listed(obj):
+    """ json form of the arrays and functions in a build """
+    if callable(obj):
+        return '%s.%s' % (obj.__module__, getattr(obj, '__name__', obj))
+    return np.asarray(obj).tolist()
+
+def model_key(osc):
+    """ hash of the labels of osc's model and of its build """
+    build = json.dumps(osc.build, sort_keys=True, default=_listed)
+    return _hash('|'.join([','.join(osc.ylabels), ','.join(osc.plabels),
+                           build]))
+
+def entry_key(osc):
+    """ hash of osc's backend, parameters and tolerances """
+    options = sorted(osc.intoptions.items())
+    return _hash('|'.join([osc.backend.name, _format(osc.param),
+                           repr(options)]))
+
+
+class CycleStore(object):
+    """ store of limit-cycle entries under the directory path """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _dir(self, osc):
+        if not hasattr(osc, '_model_key'): osc._model_key = model_key(osc)
+        return os.path.join(self.path, osc._model_key)
+
+    def _file(self, osc):
+        return os.path.join(self._dir(osc), entry_key(osc) + '.npz')
+
+    def _read(self, filename):
+        with np.load(filename) as data:
+            return dict((k, data[k]) for k in data.files)
+
+    def load(self, osc):
+        """ stored entry of osc as a dict (empty if there is none) """
+        filename = self._file(osc)
+        if not os.path.exists(filename): return {}
+        return self._read(filename)
+
+    def save(self, osc):
+        """ adds osc's products to its entry. Written to a temporary file
+        and renamed, so concurrent workers never see partial entries """
+        if not hasattr(osc, 'T'): return
+        entry = self.load(osc)
+        for name in products:
+            if hasattr(osc, name):
+                entry[name] = np.asarray(getattr(osc, name), dtype=float)
+        entry['param'] = np.asarray(osc.param, dtype=float)
+        entry['meta'] = np.array(json.dumps(
+            {'backend' : osc.backend.name, 'ylabels' : osc.ylabels,
+             'plabels' : osc.plabels, 'intoptions' : osc.intoptions,
+             'build' : osc.build}, default=_listed))
+
+        filename = self._file(osc)
+        if not os.path.isdir(self._dir(osc)): os.makedirs(self._dir(osc))
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, **entry)
+        os.rename(tmp, filename)
+
+    def nearest(self, osc):
+        """ stored entry of osc's model with the parameters nearest to
+        osc's (relative distance), or {} """
+        directory = self._dir(osc)
+        if not os.path.isdir(directory): return {}
+        param = np.asarray(osc.param, dtype=float)
+        best, best_dist = {}, np.inf
+        for name in os.listdir(directory):
+            if not name.endswith('.npz'): continue
+            entry = self._read(os.path.join(directory, name))
+            scale = np.maximum(np.maximum(abs(param), abs(entry['param'])),
+                               1E-12)
+            dist = (((param - entry['param'])/scale)**2).sum()
+            if dist < best_dist: best, best_dist = entry, dist
+        return best
+
+    def restore(self, osc, warm_start=False):
+        """
+        Sets osc's stored products and returns True if its entry exists.
+        Otherwise, if warm_start, solves the BVP from the nearest entry's
+        y0 and T, saves the new entry and returns True. Returns False
+        (with osc.y0 unchanged) if neither worked. Called by
+        Oscillator.calc_y0.
+        """
+        entry = self.load(osc)
+        if entry:
+            self._set(osc, entry)
+            return True
+        if not warm_start: return False
+
+        guess = self.nearest(osc)
+        if not guess: return False
+        y0 = np.array(osc.y0)
+        osc.y0, osc.T = np.array(guess['y0']), float(guess['T'])
+        try:
+            osc.solve_bvp()
+            solved = (np.isfinite(osc.T) and osc.T > 0 and
+                      np.all(np.isfinite(osc.y0)))
+        except (RuntimeError, ValueError, ArithmeticError,
+                np.linalg.LinAlgError):
+            # failed solves (casadi raises RuntimeError)
+            solved = False
+        if not solved:
+            osc.y0 = y0
+            return False
+        self.save(osc)
+        return True
+
+    def _set(self, osc, entry):
+        """ products and what is derived from them (interpolants,
+        relative sensitivities) """
+        for name in products:
+            if name in entry: setattr(osc, name, entry[name])
+        osc.T = float(osc.T)
+        if 'sol' in entry:
+            osc.ts = np.linspace(0, osc.T, len(osc.sol))
+            osc.lc = osc.interp_sol(osc.ts, osc.sol.T)
+        if 'sPRC' in entry:
+            osc.rel_pPRC = osc.pPRC*np.array(osc.param)
+            osc.sPRC_interp = osc.interp_sol(osc.prc_ts, osc.sPRC.T)
+            osc.pPRC_interp = osc.interp_sol(osc.prc_ts, osc.pPRC.T)
+        if 'pARC' in entry and 'avg' in entry:
+            osc.rel_pARC = (np.array(osc.param)*osc.pARC /
+                            np.atleast_2d(osc.avg).T)
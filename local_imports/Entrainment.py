@@ -0,0 +1,149 @@
+"""
+Entrainment and synchrony of a parasite population relative to the host,
+computed over the whole (time x parasite) matrix at once:
+
+    hilbert_phase      instantaneous phase from the analytic signal
+    peak_phase         phase interpolated between successive peaks
+    phase_lag          wrapped phase of each parasite relative to the host
+    order_parameter    Kuramoto order parameter R(t) and mean phase
+    entrainment_time   time after which each lag stops drifting
+    last_finite        last defined value of each column
+    analyze            all of the above for one population trajectory
+
+Phases are unwrapped, in radians, with peaks at multiples of 2pi for
+peak_phase. Hilbert phases are smooth, but unreliable within about a
+cycle of either end of the record, which hides late entrainment; the
+peak phases are the default for that reason.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+from scipy.signal import hilbert
+
+
+def _columns(x):
+    x = np.asarray(x, dtype=float)
+    return x[:, None] if x.ndim == 1 else x
+
+def hilbert_phase(x):
+    """ unwrapped instantaneous phase of each column of x [T, N] (or of
+    a single series), with 0 at the peaks """
+    x = _columns(x)
+    return np.unwrap(np.angle(hilbert(x - x.mean(0), axis=0)), axis=0)
+
+def peak_phase(ts, x):
+    """
+    Unwrapped phase of each column of x [T, N], 2pi*k at its k-th peak
+    and linear in time between peaks. Peaks are refined by a parabola
+    through each sample maximum. NaN before the first and after the last
+    peak of a column.
+    """
+    x = _columns(x)
+    ts = np.asarray(ts, dtype=float) - ts[0]
+    N = x.shape[1]
+
+    # sample maxima and their parabolic refinement
+    ym, y0, yp = x[:-2], x[1:-1], x[2:]
+    peak = np.zeros(x.shape, dtype=bool)
+    peak[1:-1] = (y0 > ym) & (y0 >= yp)
+    denom = np.where(peak[1:-1], ym - 2*y0 + yp, -1)
+    shift = np.where(denom != 0, 0.5*(ym - yp)/denom, 0)
+    h = np.where(shift < 0, np.diff(ts)[:-1, None], np.diff(ts)[1:, None])
+    tpeak = np.full(x.shape, np.nan)
+    tpeak[1:-1] = np.where(peak[1:-1], ts[1:-1, None] + shift*h, np.nan)
+
+    if not peak.any(): return np.full(x.shape, np.nan)
+
+    # one interpolation for all columns: column c is offset by c*span,
+    # so its peaks and query times form one increasing sequence
+    span = 2*ts[-1] + 1
+    offset = span*np.arange(N)
+    tp = tpeak.T[peak.T]
+    col = np.nonzero(peak.T)[0]
+    k = np.cumsum(peak, axis=0).T[peak.T] - 1
+    phase = np.interp((ts[:, None] + offset).ravel(), tp + offset[col],
+                      2*np.pi*k).reshape(len(ts), N)
+
+    first = np.nanmin(np.where(peak, tpeak, np.inf), axis=0)
+    last = np.nanmax(np.where(peak, tpeak, -np.inf), axis=0)
+    outside = (ts[:, None] < first) | (ts[:, None] > last)
+    return np.where(outside, np.nan, phase)
+
+def phase_lag(phases, host_phase):
+    """ phase of each parasite column minus the host phase, wrapped to
+    (-pi, pi]. positive lags mean the parasite leads """
+    diff = _columns(phases) - _columns(host_phase)
+    return np.angle(np.exp(1j*diff))
+
+def order_parameter(phases, weights=None):
+    """ Kuramoto order parameter R(t) and mean phase psi(t) of phases
+    [T, N], optionally weighted, over the phases defined at each time
+    (NaN where none is) """
+    z = np.exp(1j*_columns(phases))
+    if weights is None: weights = np.ones(z.shape[1])
+    weights = np.asarray(weights, dtype=float)
+    total = (weights*np.isfinite(z)).sum(1)
+    zbar = np.where(total > 0, np.nansum(z*weights, axis=1) /
+                    np.where(total > 0, total, 1), np.nan)
+    return np.abs(zbar), np.angle(zbar)
+
+def entrainment_time(ts, lag, window, tol=0.1):
+    """
+    Time after which each column of lag [T, N] changes by less than tol
+    (rad) over every interval of length window (e.g. one host period).
+    NaN for columns not steady for at least two windows at the end of
+    the record.
+    """
+    lag = _columns(lag)
+    ts = np.asarray(ts, dtype=float)
+    shift = int(np.searchsorted(ts, ts[0] + window))
+    if shift >= len(ts):
+        return np.full(lag.shape[1], np.nan)
+
+    drift = np.abs(np.angle(np.exp(1j*(lag[shift:] - lag[:-shift]))))
+    valid = np.isfinite(drift)
+    # undefined lags before a column's first phase count as drifting;
+    # after its last they are ignored
+    bad = (drift >= tol) | ~np.logical_or.accumulate(valid, axis=0)
+    last_valid = len(drift) - 1 - np.argmax(valid[::-1], axis=0)
+    # start of the last drifting window, per column; entrainment must
+    # then hold for at least one more window
+    last_bad = len(drift) - 1 - np.argmax(bad[::-1], axis=0)
+    last_bad = np.where(bad.any(0), last_bad, -1)
+    held = valid.any(0) & (last_bad + 1 + shift <= last_valid)
+    return np.where(held, ts[np.clip(last_bad + 1, 0, len(ts) - 1)],
+                    np.nan)
+
+def last_finite(x):
+    """ last finite value of each column of x [T, N] (NaN for columns
+    with none), e.g. the final lag from peak phases, which end at each
+    column's last peak """
+    x = _columns(x)
+    ok = np.isfinite(x)
+    last = len(x) - 1 - np.argmax(ok[::-1], axis=0)
+    return np.where(ok.any(0), x[last, np.arange(x.shape[1])], np.nan)
+
+def analyze(ts, states, weights=None, method='peaks', host_state=0,
+            parasite_state=0, window=24., tol=0.1):
+    """
+    Phases, lags, synchrony and entrainment of a population trajectory
+    states [T, 5 + 4N] in the layout of int_odes: the host clock is
+    states[:, host_state] and the parasites states[:, 5+parasite_state::4].
+    method is 'hilbert' or 'peaks'. Returns a dict of arrays.
+    """
+    phase = {'hilbert' : lambda x: hilbert_phase(x),
+             'peaks'   : lambda x: peak_phase(ts, x)}[method]
+    host = phase(states[:, host_state])[:, 0]
+    parasites = phase(states[:, 5+parasite_state::4])
+    lag = phase_lag(parasites, host)
+    R, psi = order_parameter(parasites, weights)
+    return {'host_phase'       : host,
+            'parasite_phase'   : parasites,
+            'lag'              : lag,
+            'final_lag'        : last_finite(lag),
+            'R'                : R,
+            'psi'              : psi,
+            'entrainment_time' : entrainment_time(ts, lag, window, tol)}
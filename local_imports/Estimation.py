@@ -0,0 +1,90 @@
+"""
+Least-squares parameter estimation with many starts.
+
+    forward_sensitivities   states and their parameter derivatives on a
+                            time grid, for the jacobian of the residuals
+    latin_hypercube         spread-out starting points
+    multistart              scipy least_squares from each start, over a
+                            process pool
+
+A least-squares fit has one residual per data point, so its jacobian
+comes from forward sensitivities for the (few) fitted parameters rather
+than from one adjoint solve per residual.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+from scipy.optimize import least_squares
+
+from .Backends import _dense
+from .Utilities import pool_map
+
+
+def forward_sensitivities(model, param, y0, ts, index=None, t0=0.,
+                          abstol=1E-8, reltol=1E-6, method='BDF'):
+    """
+    Solution of a NumpyModel from y0 at t0, at the times ts, and its
+    derivatives with respect to param[index] (all by default). Returns
+    states [len(ts), neq] and sensitivities [len(ts), neq, len(index)].
+    """
+    p = np.asarray(param, dtype=float)
+    neq = model.neq
+    index = list(range(model.np) if index is None else index)
+    k = len(index)
+
+    def fun(t, z):
+        y = z[:neq]
+        if not k: return model.ode(t, y, p)
+        S = z[neq:].reshape(neq, k)
+        dS = model.jac(t, y, p).dot(S) + _dense(model.jacp(t, y, p, index))
+        return np.hstack([model.ode(t, y, p), np.ravel(dS)])
+
+    def jac(t, z):
+        J = sp.csr_matrix(model.jac(t, z[:neq], p))
+        if not k: return J
+        return sp.block_diag([J, sp.kron(J, sp.eye(k))], format='csr')
+
+    ts = np.asarray(ts, dtype=float)
+    z0 = np.hstack([np.asarray(y0, dtype=float), np.zeros(neq*k)])
+    sol = solve_ivp(fun, (t0, ts[-1]), z0, method=method, jac=jac,
+                    t_eval=ts, rtol=reltol, atol=abstol)
+    if sol.status < 0:
+        raise RuntimeError("solve_ivp: " + sol.message)
+    z = sol.y.T
+    return z[:, :neq], z[:, neq:].reshape(len(ts), neq, k)
+
+def latin_hypercube(n, k, seed=None):
+    """ n points of a Latin hypercube in the unit cube, [n, k] """
+    rng = np.random.RandomState(seed)
+    strata = np.array([rng.permutation(n) for i in range(k)]).T
+    return (strata + rng.rand(n, k))/n
+
+def _fit(task):
+    """ pool worker: least_squares from one start """
+    problem, x0, options = task
+    try:
+        res = least_squares(problem.residuals, x0, jac=problem.jacobian,
+                            bounds=problem.bounds, **options)
+    except (RuntimeError, ValueError) as err:
+        return {'x0' : x0, 'x' : x0, 'cost' : np.inf, 'success' : False,
+                'message' : str(err), 'nfev' : 0}
+    return {'x0' : x0, 'x' : res.x, 'cost' : res.cost,
+            'success' : res.success, 'message' : res.message,
+            'nfev' : res.nfev}
+
+def multistart(problem, starts, processes=None, **options):
+    """
+    Minimizes the sum of squares of problem.residuals(x) from each row of
+    starts with scipy least_squares (options), over a pool. problem is
+    a picklable object with residuals(x), jacobian(x) and bounds. Fits
+    that fail to integrate get infinite cost. Returns the results
+    sorted by cost.
+    """
+    tasks = [(problem, x0, options) for x0 in starts]
+    return sorted(pool_map(_fit, tasks, processes),
+                  key=lambda r: r['cost'])
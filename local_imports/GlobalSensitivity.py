@@ -0,0 +1,135 @@
+"""
+Global sensitivity analysis of model outputs over a box of parameters.
+
+    morris_plan, morris_indices   elementary-effects screening (Morris
+                                  1991, with mu* of Campolongo 2007)
+    sobol_plan, sobol_indices     first-order and total Sobol indices
+                                  (Saltelli 2010 sampling, Saltelli and
+                                  Jansen estimators)
+    evaluate                      outputs of each sample over a pool
+
+Plans are drawn in the unit cube and mapped onto bounds [k, 2] by scale,
+linearly or, for positive rates and constants spanning a multiplicative
+range, in log space. Outputs are arrays [N, m] (one row per sample, m
+outputs), so every index is computed for all outputs at once. Samples
+whose outputs are nan (e.g. the oscillation was lost) are left out of
+the estimators that need them.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .Utilities import pool_map
+
+
+def scale(U, bounds, log=False):
+    """ maps unit-cube samples U [N, k] onto bounds [k, 2] """
+    lo, hi = np.asarray(bounds, dtype=float).T
+    if log: return np.exp(np.log(lo) + U*(np.log(hi) - np.log(lo)))
+    return lo + U*(hi - lo)
+
+def _evaluate(task):
+    """ pool worker: outputs of one sample """
+    function, x, kwargs = task
+    return np.asarray(function(x, **kwargs), dtype=float)
+
+def evaluate(function, X, processes=None, **kwargs):
+    """ outputs function(x, **kwargs) of each sample row of X, [N, m].
+    function must be a module-level function """
+    out = pool_map(_evaluate, [(function, x, kwargs) for x in X],
+                   processes)
+    return np.atleast_2d(np.array(out).reshape(len(X), -1))
+
+
+def morris_plan(k, trajectories=10, levels=4, seed=None):
+    """
+    Unit-cube Morris plan for k factors: trajectories random one-at-a-
+    time paths of k + 1 points on a grid of levels levels, each step
+    moving one factor by delta = levels/(2(levels - 1)). Returns the
+    samples [trajectories*(k + 1), k].
+    """
+    rng = np.random.RandomState(seed)
+    delta = levels/(2*(levels - 1))
+    r = trajectories
+
+    # B* = (x* + delta/2((2B - 1)D* + 1))P*, all trajectories at once
+    B = np.tril(np.ones((k + 1, k)), -1)
+    start = rng.randint(0, levels//2, (r, 1, k))/(levels - 1)
+    D = rng.choice([-1., 1.], (r, 1, k))
+    P = np.array([np.eye(k)[rng.permutation(k)] for i in range(r)])
+    steps = delta/2*((2*B - 1)*D + 1)
+    X = np.einsum('rij,rjl->ril', start + steps, P)
+    return X.reshape(r*(k + 1), k)
+
+def morris_indices(X, Y, trajectories):
+    """
+    Elementary effects of a Morris plan X (unit cube) with outputs Y
+    [N, m]: mu, mu* and sigma of each factor and output, [k, m], in
+    output units per unit of the (scaled) factor range.
+    """
+    r = trajectories
+    k = X.shape[1]
+    Y = np.asarray(Y, dtype=float).reshape(len(X), -1)
+    X = X.reshape(r, k + 1, k)
+    Y = Y.reshape(r, k + 1, -1)
+
+    dX = np.diff(X, axis=1)                      # [r, k, k]
+    factor = np.argmax(np.abs(dX), axis=2)       # factor moved each step
+    step = dX[np.arange(r)[:, None], np.arange(k)[None, :], factor]
+    effects = np.diff(Y, axis=1)/step[..., None]  # [r, k, m]
+
+    # reorder each trajectory's effects by factor
+    order = np.argsort(factor, axis=1)
+    effects = effects[np.arange(r)[:, None], order]
+
+    return {'mu'      : np.nanmean(effects, 0),
+            'mu_star' : np.nanmean(np.abs(effects), 0),
+            'sigma'   : np.nanstd(effects, 0, ddof=1),
+            'effects' : effects}
+
+
+def sobol_plan(k, n=256, seed=None):
+    """
+    Unit-cube Saltelli plan for k factors: matrices A and B of n random
+    samples each, then A with column i taken from B for each i. Returns
+    the samples [n*(k + 2), k], in that order.
+    """
+    rng = np.random.RandomState(seed)
+    A, B = rng.rand(n, k), rng.rand(n, k)
+    AB = np.repeat(A[None], k, 0)
+    AB[np.arange(k), :, np.arange(k)] = B.T
+    return np.vstack([A, B, AB.reshape(k*n, k)])
+
+def _sobol(YA, YB, YAB):
+    """ S1 and ST [k, m] from outputs YA, YB [n, m] and YAB [k, n, m] """
+    var = np.nanvar(np.concatenate([YA, YB]), 0)
+    S1 = np.nanmean(YB*(YAB - YA), 1)/var
+    ST = 0.5*np.nanmean((YA - YAB)**2, 1)/var
+    return S1, ST
+
+def sobol_indices(Y, k, resamples=100, seed=None):
+    """
+    First-order (S1) and total (ST) Sobol indices [k, m] from the
+    outputs Y [n*(k + 2), m] of a sobol_plan, with bootstrap 95%
+    half-widths from resamples resamplings of the n base samples.
+    """
+    Y = np.asarray(Y, dtype=float)
+    Y = Y.reshape(len(Y), -1)
+    n = len(Y)//(k + 2)
+    YA, YB = Y[:n], Y[n:2*n]
+    YAB = Y[2*n:].reshape(k, n, -1)
+    # a base sample is dropped from an index if any of its runs failed
+    bad = ~np.isfinite(YA) | ~np.isfinite(YB)
+    YAB = np.where(bad | ~np.isfinite(YAB), np.nan, YAB)
+
+    S1, ST = _sobol(YA, YB, YAB)
+    out = {'S1' : S1, 'ST' : ST}
+    if resamples:
+        rows = np.random.RandomState(seed).randint(0, n, (resamples, n))
+        boot = [_sobol(YA[i], YB[i], YAB[:, i]) for i in rows]
+        out['S1_conf'] = 1.96*np.nanstd([b[0] for b in boot], 0)
+        out['ST_conf'] = 1.96*np.nanstd([b[1] for b in boot], 0)
+    return out
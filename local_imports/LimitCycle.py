@@ -10,50 +10,80 @@ solving models. Any general methods will be here.
 """
 
 from __future__ import division
-import cPickle as pickle
 import numpy as np
-import casadi as cs
-import pylab as pl
-import matplotlib.pyplot as plt
 import Utilities as jha
-import pdb
-from scipy import signal
+import Backends as bk
+from SolverStats import SolverStats, instrumented
+from Trajectory import Trajectory
 from scipy.interpolate import splrep, splev, UnivariateSpline
 
+try:
+    import casadi as cs
+except ImportError:
+    cs = None
+
 
 class Oscillator(object):
     """
     This circadian oscillator class is for deterministic ODE simulations.
     """
 
-    def __init__(self, model, param, y0=None, period_guess=24.):
+    def __init__(self, model, param, y0=None, period_guess=24.,
+                 adaptive_burn=False, backend=None, stats=None, store=None,
+                 warm_start=False, build=None):
         """
         Setup the required information.
         ----
-        model : casadi.sxfunction
+        model : casadi.sxfunction or Backends.NumpyModel
             model equations, sepecified through an integrator-ready
-            casadi sx function
+            casadi sx function, or a vectorized numpy model for the
+            scipy backend
         paramset : iterable
             parameters for the model provided. Must be the correct length.
         y0 : optional iterable
             Initial conditions, specifying where d(y[0])/dt = 0
             (maximum) for the first state variable.
+        period_guess : optional float
+            Approximate period, used to scale transient burn-in.
+        adaptive_burn : optional bool
+            If y0 is not given, burn transients cycle by cycle until
+            convergence rather than for a fixed time.
+        backend : optional Backends solver backend
+            Defaults to the CasadiBackend for casadi models and the
+            ScipyBackend for numpy models.
+        stats : optional SolverStats.SolverStats
+            Collects timing and solver metrics of each operation; may be
+            shared between oscillators. A new one is created if None.
+        store : optional CycleStore.CycleStore
+            Persistent store of limit-cycle solutions. calc_y0 restores
+            y0, T and any stored PRC, ARC and averages from it instead
+            of solving, and new results are added to it.
+        warm_start : optional bool
+            On a store miss, calc_y0 first solves the BVP from the
+            stored solution nearest in parameters.
+        build : optional
+            How model was built, e.g. the builder and its arguments (see
+            Simulation.Experiment.build), as json-serializable values
+            and arrays. Required with a store, whose entries it keys.
         """
         self.model = model
-        self.modifiedModel()
-        self.neq = self.model.input(cs.DAE_X).size()
-        self.np = self.model.input(cs.DAE_P).size()
+        if stats is None: stats = SolverStats()
+        self.stats = stats
+        self.period_guess = period_guess
+        if backend is None: backend = bk.default_backend(model)
+        self.backend = backend
+        self.neq = self.backend.neq
+        self.np = self.backend.np
 
-        self.model.init()
         self.param = param
 
-        self.jacp = self.model.jacobian(cs.DAE_P,0); self.jacp.init()
-        self.jacy = self.model.jacobian(cs.DAE_X,0); self.jacy.init()
+        if self.backend.name == 'casadi':
+            self.modlT = self.backend.modlT
+            self.jacp = self.backend.jacp
+            self.jacy = self.backend.jacy
 
-        self.ylabels = [self.model.inputExpr(cs.DAE_X)[i].getName()
-                        for i in xrange(self.neq)]
-        self.plabels = [self.model.inputExpr(cs.DAE_P)[i].getName()
-                        for i in xrange(self.np)]
+        self.ylabels = list(self.backend.ylabels)
+        self.plabels = list(self.backend.plabels)
 
         self.pdict = {}
         self.ydict = {}
@@ -79,6 +109,10 @@ class Oscillator(object):
             'transabstol'      : 1E-6,
             'transreltol'      : 1E-6,
             'transmaxnumsteps' : 5000,
+            'burn_tol'         : 1E-3,
+            'burn_maxcycles'   : 60,
+            'burn_res'         : 200,
+            'approx_res'       : 200,
             'lc_abstol'        : 1E-11,
             'lc_reltol'        : 1E-9,
             'lc_maxnumsteps'   : 40000,
@@ -89,86 +123,128 @@ class Oscillator(object):
             'constraints'      : 'positive'
                 }
 
+        self.store = store
+        self.warm_start = warm_start
+        self.build = build
+        if store is not None and build is None:
+            raise ValueError("a store needs the build of the model")
         if y0 is None:
             self.y0 = 5*np.ones(self.neq)
-            self.calc_y0(25*period_guess)
+            self.calc_y0(25*period_guess, adaptive=adaptive_burn)
         else: self.y0 = np.asarray_chkfinite(y0)
 
     # shortcuts
+    def _save(self):
+        if self.store is not None: self.store.save(self)
     def _phi_to_t(self, phi): return phi*self.T/(2*np.pi)
     def _t_to_phi(self, t): return (2*np.pi)*t/self.T
 
-
-    def modifiedModel(self):
-        """
-        Creates a new casadi model with period as a parameter, such that
-        the model has an oscillatory period of 1. Necessary for the
-        exact determinination of the period and initial conditions
-        through the BVP method. (see Wilkins et. al. 2009 SIAM J of Sci
-        Comp)
-        """
-
-        pSX = self.model.inputExpr(cs.DAE_P)
-        T = cs.SX.sym("T")
-        pTSX = cs.vertcat([pSX, T])
-
-        t = self.model.inputExpr(cs.DAE_T)
-        sys = self.model.inputExpr(cs.DAE_X)
-        ode = self.model.outputExpr()[0]*T
-
-        self.modlT = cs.SXFunction(
-            cs.daeIn(t=t,x=sys,p=pTSX),
-            cs.daeOut(ode=ode)
-            )
-
-        self.modlT.setOption("name","T-shifted model")
-
-
+    @instrumented('int_odes')
     def int_odes(self, tf, y0=None, numsteps=10000, return_endpt=False, ts=0,
                     silent=False):
         """
         This function integrates the ODEs until well past the transients.
-        This uses Casadi's simulator class, C++ wrapped in swig. Inputs:
+        This uses the solver backend (casadi's simulator class, C++
+        wrapped in swig, or scipy's solve_ivp). Inputs:
             tf          -   the final time of integration.
             numsteps    -   the number of steps in the integration is the second argument
         """
         if y0 is None: y0 = self.y0
 
-        self.integrator = cs.Integrator('cvodes',self.model)
-
-        #Set up the tolerances etc.
-        self.integrator.setOption("abstol", self.intoptions['int_abstol'])
-        self.integrator.setOption("reltol", self.intoptions['int_reltol'])
-        self.integrator.setOption("max_num_steps",
-            self.intoptions['int_maxstepcount'])
-        self.integrator.setOption("tf",tf)
-        if silent:
-            self.integrator.setOption("disable_internal_warnings", True)
-
-        #Let's integrate
-        self.integrator.init()
         self.ts = np.linspace(ts,tf, numsteps, endpoint=True)
-        self.simulator = cs.Simulator(self.integrator, self.ts)
-        self.simulator.init()
-        self.simulator.setInput(y0,cs.INTEGRATOR_X0)
-        self.simulator.setInput(self.param,cs.INTEGRATOR_P)
-        self.simulator.evaluate()
-
-        sol = self.simulator.output().toArray().T
+        sol = self.backend.integrate(y0, self.param, self.ts,
+                                     self.intoptions['int_abstol'],
+                                     self.intoptions['int_reltol'],
+                                     self.intoptions['int_maxstepcount'],
+                                     silent=silent)
 
         if return_endpt==True:
             return sol[-1]
         else:
             return self.ts, sol
 
-    def burn_trans(self,tf=500.):
+    @instrumented('trajectory')
+    def trajectory(self, tf, y0=None, ts=0, numsteps=1000, silent=False):
         """
-        integrate the solution until tf, return only the endpoint
+        Integrates from ts to tf and returns a Trajectory.Trajectory, the
+        dense solution through the solver's steps (or an even grid of
+        numsteps nodes, for the casadi backend), which can be evaluated
+        at any time and searched for peaks and crossings directly.
         """
-        self.y0 = self.int_odes(tf, return_endpt=True)
+        if y0 is None: y0 = self.y0
 
+        nodes, ys = self.backend.dense(y0, self.param, ts, tf,
+                                       self.intoptions['int_abstol'],
+                                       self.intoptions['int_reltol'],
+                                       self.intoptions['int_maxstepcount'],
+                                       numsteps=numsteps, silent=silent)
+        dys = np.array([self.backend.rhs(y, self.param, t)
+                        for t, y in zip(nodes, ys)])
+        return Trajectory(nodes, ys, dys, self.ylabels)
 
+    def burn_trans(self,tf=500., adaptive=False):
+        """
+        integrate the solution until tf, return only the endpoint. if
+        adaptive, tf is ignored and transients are burned cycle by cycle
+        until convergence (see burn_trans_adaptive).
+        """
+        if adaptive:
+            return self.burn_trans_adaptive()
+        self.y0 = self.int_odes(tf, return_endpt=True)
 
+    def burn_trans_adaptive(self, ref_mol=0, tol=None, max_cycles=None):
+        """
+        Integrates one period_guess at a time, tracking the peaks of
+        ref_mol. Stops as soon as successive peak-to-peak periods and peak
+        amplitudes agree to within the relative tol (or, if the solution
+        has stopped oscillating, when the state no longer changes over a
+        cycle). Stores the endpoint in self.y0 and returns the number of
+        cycles used, also kept in self.burn_cycles.
+        """
+        if tol is None: tol = self.intoptions['burn_tol']
+        if max_cycles is None: max_cycles = self.intoptions['burn_maxcycles']
+        res = self.intoptions['burn_res']
+        dt = self.period_guess
+
+        t0 = 0.
+        y0 = np.array(self.y0)
+        tail_t, tail_y = [], [] # previous sample, so no peak is missed
+        peak_ts, peak_ys = [], []
+        self.burn_converged = False
+        cycle = 0
+        for cycle in xrange(1, max_cycles+1):
+            ts, sol = self.int_odes(t0+dt, y0=y0, numsteps=res, ts=t0,
+                                    silent=True)
+            ref = np.hstack([tail_y, sol[:,ref_mol]])
+            tref = np.hstack([tail_t, ts])
+            tpk, ypk = jha.local_maxima(ref, tref)
+            peak_ts += tpk.tolist()
+            peak_ys += ypk.tolist()
+            tail_t, tail_y = [ts[-2]], [sol[-2,ref_mol]]
+
+            yend = sol[-1]
+            if len(peak_ts) >= 3:
+                periods = np.diff(peak_ts[-3:])
+                amps = peak_ys[-2:]
+                if (np.abs(periods[1]-periods[0]) < tol*periods[1] and
+                    np.abs(amps[1]-amps[0]) < tol*np.abs(amps[1])):
+                    self.burn_converged = True
+            if (len(tpk) == 0 and
+                np.linalg.norm(yend-y0) < tol*np.linalg.norm(yend)):
+                # damped to a fixed point
+                self.burn_converged = True
+
+            t0 += dt
+            y0 = yend
+            if self.burn_converged: break
+
+        self.y0 = y0
+        self.burn_cycles = cycle
+        return cycle
+
+
+
+    @instrumented('solve_bvp')
     def solve_bvp(self, method='scipy', backup='casadi'):
         """
         Chooses between available solver methods to solve the boundary
@@ -200,30 +276,21 @@ class Oscillator(object):
         paramset = list(self.param)
 
 
-        # Here we create and initialize the integrator SXFunction
-        self.bvpint = cs.Integrator('cvodes',self.modlT)
-        self.bvpint.setOption('abstol',self.intoptions['bvp_abstol'])
-        self.bvpint.setOption('reltol',self.intoptions['bvp_reltol'])
-        self.bvpint.setOption('tf',1)
-        self.bvpint.setOption('disable_internal_warnings', True)
-        self.bvpint.setOption('fsens_err_con', True)
-        self.bvpint.init()
+        # Here we create and initialize the shooting integrator
+        flow = self.backend.shooting(paramset,
+                                     self.intoptions['bvp_abstol'],
+                                     self.intoptions['bvp_reltol'])
 
         def bvp_minimize_function(x):
             """ Minimization objective. X = [y0,T] """
             # perhaps penalize in try/catch?
             if all([self.intoptions['constraints']=='positive',
-                   np.any(x < 0)]): return np.ones(3)
-            self.bvpint.setInput(x[:-1], cs.INTEGRATOR_X0)
-            self.bvpint.setInput(paramset + [x[-1]], cs.INTEGRATOR_P)
-            self.bvpint.evaluate()
-            out = x[:-1] - self.bvpint.output().toArray().flatten()
+                   np.any(x < 0)]): return np.ones(self.neq + 1)
+            out = x[:-1] - flow(x[:-1], x[-1])
             out = out.tolist()
 
-            self.modlT.setInput(x[:-1], cs.DAE_X)
-            self.modlT.setInput(paramset + [x[-1]], 2)
-            self.modlT.evaluate()
-            out += self.modlT.output()[0].toArray()[0].tolist()
+            # slope of state 0 in the period-rescaled model
+            out += [x[-1]*self.backend.rhs(x[:-1], paramset)[0]]
             return np.array(out)
 
         from scipy.optimize import root
@@ -252,8 +319,11 @@ class Oscillator(object):
         problem using a single-shooting method with automatic differen-
         tiation.
 
-        Related to PCSJ code.
+        Related to PCSJ code. Without a casadi model, the same shooting
+        problem is solved by scipy's Levenberg-Marquardt instead.
         """
+        if self.backend.name != 'casadi':
+            return self.solve_bvp_scipy(root_method='lm')
 
         self.bvpint = cs.Integrator('cvodes',self.modlT)
         self.bvpint.setOption('abstol',self.intoptions['bvp_abstol'])
@@ -306,17 +376,11 @@ class Oscillator(object):
             out = []
             for yi in y:
                 assert len(yi) == self.neq
-                self.model.setInput(yi,cs.DAE_X)
-                self.model.setInput(self.param,cs.DAE_P)
-                self.model.evaluate()
-                out += [self.model.output().toArray().flatten()]
+                out += [self.backend.rhs(yi, self.param)]
             return np.array(out)
 
         except (AssertionError, TypeError):
-            self.model.setInput(y,cs.DAE_X)
-            self.model.setInput(self.param,cs.DAE_P)
-            self.model.evaluate()
-            return self.model.output().toArray().flatten()
+            return self.backend.rhs(y, self.param)
 
 
     def dfdp(self,y,p=None):
@@ -329,17 +393,11 @@ class Oscillator(object):
             out = []
             for yi in y:
                 assert len(yi) == self.neq
-                self.jacp.setInput(yi,cs.DAE_X)
-                self.jacp.setInput(p,cs.DAE_P)
-                self.jacp.evaluate()
-                out += [self.jacp.output().toArray()]
+                out += [self.backend.jac_p(yi, p)]
             return np.array(out)
 
         except (AssertionError, TypeError):
-            self.jacp.setInput(y,cs.DAE_X)
-            self.jacp.setInput(p,cs.DAE_P)
-            self.jacp.evaluate()
-            return self.jacp.output().toArray()
+            return self.backend.jac_p(y, p)
 
 
     def dfdy(self,y,p=None):
@@ -351,58 +409,74 @@ class Oscillator(object):
             out = []
             for yi in y:
                 assert len(yi) == self.neq
-                self.jacy.setInput(yi,cs.DAE_X)
-                self.jacy.setInput(p,cs.DAE_P)
-                self.jacy.evaluate()
-                out += [self.jacy.output().toArray()]
+                out += [self.backend.jac_y(yi, p)]
             return np.array(out)
 
         except (AssertionError, TypeError):
-            self.jacy.setInput(y,cs.DAE_X)
-            self.jacy.setInput(p,cs.DAE_P)
-            self.jacy.evaluate()
-            return self.jacy.output().toArray()
+            return self.backend.jac_y(y, p)
 
 
     def approx_y0_T(self, tout=300, burn_trans=True, tol=1e-1, ref_mol=0, 
-                    trans=500):
+                    trans=500, method='parabolic'):
         """
-        Approximates the period and y0 to the given tol, by integrating,
-        creating a spline representation, and comparing the max values using
-        state 0.
+        Approximates the period and y0 to the given tol, by integrating
+        and comparing the max values using state 0. method 'parabolic'
+        refines the sample maxima with a parabola and reads all states at
+        the first peak by local interpolation, sampled at approx_res
+        points per period_guess. method 'spline' fits splines to a
+        30000-point trajectory instead, and method 'dense' finds the peaks
+        on the solver's own interpolant (Oscillator.trajectory).
         """
 
         if burn_trans==True:
             self.burn_trans(trans)
 
-        time, states = self.int_odes(tout, numsteps=30000)
-        ref_state = states[:,ref_mol]
-
-        # create a spline representation of the first state, k=4 so deriv k=3
-        spl = UnivariateSpline(time, ref_state, k=4, s=0)
-        time_spl = np.arange(0,tout,30000)
-
-        #finds roots of splines
-        roots = spl.derivative(n=1).roots() #der of spline
+        if method == 'spline':
+            time, states = self.int_odes(tout, numsteps=30000)
+            peaks = self._spline_peaks(time, states[:,ref_mol])
+        elif method == 'dense':
+            traj = self.trajectory(tout)
+            peaks = traj.peaks(ref_mol)[0]
+        else:
+            numsteps = int(np.ceil(
+                tout/self.period_guess*self.intoptions['approx_res'])) + 1
+            time, states = self.int_odes(tout, numsteps=numsteps)
+            peaks = jha.local_maxima(states[:,ref_mol], time)[0]
 
-        # gives y0 and period by finding second deriv.
-        peaks_of_roots = np.where(spl.derivative(n=2)(roots) < 0)
-        peaks = roots[peaks_of_roots]
         periods = np.diff(peaks)
         if len(peaks) > 2:
             if np.sum(np.abs(np.diff(periods))) < tol:
                 self.T = np.mean(periods)
 
-                #calculating the y0 for each state witha  cubic spline
-                self.y0 = np.zeros(self.neq)
-                for i in range(self.neq):
-                    spl = UnivariateSpline(time, states[:,i], k=3, s=0)
-                    self.y0[i] = spl(peaks[0])
+                if method == 'dense':
+                    self.y0 = traj(peaks[0])
+                elif method == 'spline':
+                    #calculating the y0 for each state witha  cubic spline
+                    self.y0 = np.zeros(self.neq)
+                    for i in range(self.neq):
+                        spl = UnivariateSpline(time, states[:,i], k=3, s=0)
+                        self.y0[i] = spl(peaks[0])
+                else:
+                    self.y0 = jha.interp_rows(time, states, peaks[0])
 
             else:
                 self.T = -1
         else: self.T = -1
 
+    def _spline_peaks(self, time, ref_state):
+        """ peaks of ref_state from the roots of a quartic spline
+        derivative """
+
+        # create a spline representation of the first state, k=4 so deriv k=3
+        spl = UnivariateSpline(time, ref_state, k=4, s=0)
+
+        #finds roots of splines
+        roots = spl.derivative(n=1).roots() #der of spline
+
+        # gives y0 and period by finding second deriv.
+        peaks_of_roots = np.where(spl.derivative(n=2)(roots) < 0)
+        return roots[peaks_of_roots]
+
     def corestationary(self,guess=None,contstraints='positive'):
         """
         find stationary solutions that satisfy ydot = 0 for stability
@@ -411,26 +485,11 @@ class Oscillator(object):
         guess=None
         if guess is None: guess = np.array(self.y0)
         else: guess = np.array(guess)
-        y = self.model.inputExpr(cs.DAE_X)
-        t = self.model.inputExpr(cs.DAE_T)
-        p = self.model.inputExpr(cs.DAE_P)
-        ode = self.model.outputExpr()
-        fn = cs.SXFunction([y,t,p],ode)
-        kfn = cs.ImplicitFunction('kinsol',fn)
         abstol = 1E-10
-        kfn.setOption("abstol",abstol)
-        if self.intoptions['constraints']=='positive':
-            # constain using kinsol to >0, for physical
-            kfn.setOption("constraints",(2,)*self.neq)
-        kfn.setOption("linear_solver_type","dense")
-        kfn.setOption("exact_jacobian",True)
-        kfn.setOption("u_scale",(100/guess).tolist())
-        kfn.setOption("disable_internal_warnings",True)
-        kfn.init()
-        kfn.setInput(self.param,2)
-        kfn.setInput(guess)
-        kfn.evaluate()
-        y0out = kfn.output().toArray()
+        y0out = self.backend.steady_state(
+            guess, self.param, abstol,
+            positive=self.intoptions['constraints']=='positive')
+        y0out = np.asarray(y0out)
 
         if any(np.isnan(y0out)):
             raise RuntimeError("findstationary: KINSOL failed to find \
@@ -466,6 +525,7 @@ class Oscillator(object):
 
         except Exception: return -1
 
+    @instrumented('limit_cycle')
     def limit_cycle(self):
         """
         integrate the solution for one period, remembering each of time
@@ -474,20 +534,10 @@ class Oscillator(object):
 
         self.ts = np.linspace(0, self.T, self.intoptions['lc_res'])
 
-        intlc = cs.Integrator('cvodes',self.model)
-        intlc.setOption("abstol"       , self.intoptions['lc_abstol'])
-        intlc.setOption("reltol"       , self.intoptions['lc_reltol'])
-        intlc.setOption("max_num_steps", self.intoptions['lc_maxnumsteps'])
-        intlc.setOption("tf"           , self.T)
-
-        intsim = cs.Simulator(intlc, self.ts)
-        intsim.init()
-
-        # Input Arguments
-        intsim.setInput(self.y0, cs.INTEGRATOR_X0)
-        intsim.setInput(self.param, cs.INTEGRATOR_P)
-        intsim.evaluate()
-        self.sol = intsim.output().toArray().T
+        self.sol = self.backend.integrate(self.y0, self.param, self.ts,
+                                          self.intoptions['lc_abstol'],
+                                          self.intoptions['lc_reltol'],
+                                          self.intoptions['lc_maxnumsteps'])
 
         # create interpolation object
         self.lc = self.interp_sol(self.ts, self.sol.T)
@@ -499,16 +549,22 @@ class Oscillator(object):
 
         return jha.MultivariatePeriodicSpline(tin, yin, period=self.T)
 
-    def calc_y0(self, trans=300, bvp_method='scipy'):
+    @instrumented('calc_y0')
+    def calc_y0(self, trans=300, bvp_method='scipy', adaptive=False):
         """
         meta-function to call each calculation function in order for
-        unknown y0. Invoked when initial condition is unknown.
+        unknown y0. Invoked when initial condition is unknown. If adaptive,
+        transients are burned until convergence instead of for trans.
+        With a store, a stored solution is restored instead.
         """
         try: del self.pClass
         except AttributeError: pass
-        self.burn_trans(trans)
-        self.approx_y0_T(trans/3.)
+        if (self.store is not None and
+            self.store.restore(self, self.warm_start)): return
+        self.burn_trans(trans, adaptive=adaptive)
+        self.approx_y0_T(trans/3., burn_trans=not adaptive)
         self.solve_bvp(method=bvp_method)
+        self._save()
         #self.roots()
 
     def check_monodromy(self):
@@ -517,27 +573,11 @@ class Oscillator(object):
         eigenvalues of the monodromy matrix
         """
 
-        integrator = cs.Integrator('cvodes', self.model)
-        integrator.setOption("abstol", self.intoptions['sensabstol'])
-        integrator.setOption("reltol", self.intoptions['sensreltol'])
-        integrator.setOption("max_num_steps", self.intoptions['int_maxstepcount'])
-        integrator.setOption("sensitivity_method",
-                             self.intoptions['sensmethod']);
-        integrator.setOption("t0", 0)
-        integrator.setOption("tf", self.T)
-        integrator.setOption("fsens_err_con", 1)
-        integrator.setOption("fsens_abstol", self.intoptions['sensabstol'])
-        integrator.setOption("fsens_reltol", self.intoptions['sensreltol'])
-        integrator.init()
-        integrator.setInput(self.y0, cs.INTEGRATOR_X0)
-        integrator.setInput(self.param, cs.INTEGRATOR_P)
-
-        intdyfdy0 = integrator.jacobian(cs.INTEGRATOR_X0, cs.INTEGRATOR_XF)
-        intdyfdy0.init()
-        intdyfdy0.setInput(self.y0,"x0")
-        intdyfdy0.setInput(self.param,"p")
-        intdyfdy0.evaluate()
-        monodromy = intdyfdy0.output().toArray()
+        monodromy = self.backend.sensitivity(
+            self.y0, self.param, self.T, self.intoptions['sensabstol'],
+            self.intoptions['sensreltol'],
+            self.intoptions['int_maxstepcount'],
+            method=self.intoptions['sensmethod'], wrt='x0')
 
         self.monodromy = monodromy
 
@@ -562,34 +602,13 @@ class Oscillator(object):
         self.check_monodromy()
         monodromy = self.monodromy
 
-        integrator = cs.Integrator('cvodes',self.model)
-        integrator.setOption("abstol", self.intoptions['sensabstol'])
-        integrator.setOption("reltol", self.intoptions['sensreltol'])
-        integrator.setOption("max_num_steps",
-                             self.intoptions['sensmaxnumsteps'])
-        integrator.setOption("sensitivity_method",
-                             self.intoptions['sensmethod']);
-        integrator.setOption("t0", 0)
-        integrator.setOption("tf", self.T)
-        integrator.setOption("fsens_err_con", 1)
-        integrator.setOption("fsens_abstol", self.intoptions['sensabstol'])
-        integrator.setOption("fsens_reltol", self.intoptions['sensreltol'])
-        integrator.init()
-        integrator.setInput(self.y0,cs.INTEGRATOR_X0)
-        integrator.setInput(self.param,cs.INTEGRATOR_P)
-
-        intdyfdp = integrator.jacobian(cs.INTEGRATOR_P, cs.INTEGRATOR_XF)
-        intdyfdp.init()
-        intdyfdp.setInput(self.y0,"x0")
-        intdyfdp.setInput(self.param,"p")
-        intdyfdp.evaluate()
-        s0 = intdyfdp.output().toArray()
-
-        self.model.init()
-        self.model.setInput(self.y0,cs.DAE_X)
-        self.model.setInput(self.param,cs.DAE_P)
-        self.model.evaluate()
-        ydot0 = self.model.output().toArray().squeeze()
+        s0 = self.backend.sensitivity(
+            self.y0, self.param, self.T, self.intoptions['sensabstol'],
+            self.intoptions['sensreltol'],
+            self.intoptions['sensmaxnumsteps'],
+            method=self.intoptions['sensmethod'], wrt='p')
+
+        ydot0 = self.dydt(self.y0)
 
         LHS = np.zeros([(self.neq + 1), (self.neq + 1)])
         LHS[:-1,:-1] = monodromy - np.eye(len(monodromy))
@@ -605,6 +624,7 @@ class Oscillator(object):
         self.dTdp = unk[-1]
         self.reldTdp = self.dTdp*self.param/self.T
 
+    @instrumented('find_prc')
     def find_prc(self, res=100, num_cycles=20):
         """ Function to calculate the phase response curve with
         specified resolution """
@@ -617,34 +637,16 @@ class Oscillator(object):
         state_ind = 1
         while np.abs(self.dydt(self.y0)[state_ind]) < 1E-5: state_ind += 1
 
-        integrator = cs.Integrator('cvodes',self.model)
-        integrator.setOption("abstol", self.intoptions['sensabstol'])
-        integrator.setOption("reltol", self.intoptions['sensreltol'])
-        integrator.setOption("max_num_steps",
-                             self.intoptions['sensmaxnumsteps'])
-        integrator.setOption("sensitivity_method",
-                             self.intoptions['sensmethod']);
-        integrator.setOption("t0", 0)
-        integrator.setOption("tf", num_cycles*self.T)
-        #integrator.setOption("numeric_jacobian", True)
-        integrator.setOption("fsens_err_con", 1)
-        integrator.setOption("fsens_abstol", self.intoptions['sensabstol'])
-        integrator.setOption("fsens_reltol", self.intoptions['sensreltol'])
-        integrator.init()
         seed = np.zeros(self.neq)
         seed[state_ind] = 1.
-        integrator.setInput(self.y0, cs.INTEGRATOR_X0)
-        integrator.setInput(self.param, cs.INTEGRATOR_P)
-        #adjseed = (seed, cs.INTEGRATOR_XF)
-        integrator.evaluate()#0, 1)
-
-        monodromy = integrator.jacobian(cs.INTEGRATOR_X0,cs.INTEGRATOR_XF)
-        monodromy.init()
-        monodromy.setInput(self.y0,"x0")
-        monodromy.setInput(self.param,"p")
-        monodromy.evaluate()
+
+        monodromy = self.backend.sensitivity(
+            self.y0, self.param, num_cycles*self.T,
+            self.intoptions['sensabstol'], self.intoptions['sensreltol'],
+            self.intoptions['sensmaxnumsteps'],
+            method=self.intoptions['sensmethod'], wrt='x0')
         # initial state is Kcross(T,T) = I
-        adjsens = monodromy.getOutput().toArray().T.dot(seed)
+        adjsens = monodromy.T.dot(seed)
 
         from scipy.integrate import odeint
         def adj_func(y, t):
@@ -670,6 +672,7 @@ class Oscillator(object):
         # Create interpolation object for the state phase response curve
         self.sPRC_interp = self.interp_sol(self.prc_ts, self.sPRC.T) #phi units
         self.pPRC_interp = self.interp_sol(self.prc_ts, self.pPRC.T) #phi units
+        self._save()
 
     def _create_ARC_model(self, numstates=1):
         """ Create model with quadrature for amplitude sensitivities
@@ -704,28 +707,53 @@ class Oscillator(object):
         return ffcn
 
 
-    def _sarc_single_time(self, time, seed):
-        """ Calculate the state amplitude response to an infinitesimal
-        perturbation in the direction of seed, at specified time. """
+    def _create_ARC_integrator(self, numstates, trans):
+        """ Set up the quadrature integrator of the ARC model over trans
+        periods (casadi backend only; the other backends integrate the
+        quadrature in _sarc_single_time). """
+        if self.backend.name != 'casadi': return
 
-        # Initialize model and sensitivity states
-        x0 = np.zeros(2*self.neq)
-        x0[:self.neq] = self.lc(time)
-        x0[self.neq:] = seed
+        self.sarc_int = cs.Integrator('cvodes',
+            self._create_ARC_model(numstates=numstates))
+        self.sarc_int.setOption("abstol", self.intoptions['sensabstol'])
+        self.sarc_int.setOption("reltol", self.intoptions['sensreltol'])
+        self.sarc_int.setOption("max_num_steps",
+                             self.intoptions['sensmaxnumsteps'])
+        self.sarc_int.setOption("t0", 0)
+        self.sarc_int.setOption("tf", trans*self.T)
+        #self.sarc_int.setOption("numeric_jacobian", True)
+        self.sarc_int.init()
+
+    def _sarc_single_time(self, time, seeds, trans=3):
+        """ Calculate the state amplitude response to infinitesimal
+        perturbations in the directions of the columns of seeds
+        [neq, numstates], at specified time. Returns [neq, numstates]. """
 
-        # Add dphi/dt from seed perturbation
-        param = np.zeros(self.np + 1)
-        param[:self.np] = self.param
-        param[-1] = self.sPRC_interp(time).dot(seed)
+        seeds = np.asarray(seeds, dtype=float).reshape(self.neq, -1)
 
-        # Evaluate model
-        self.sarc_int.setInput(x0, cs.INTEGRATOR_X0)
-        self.sarc_int.setInput(param, cs.INTEGRATOR_P)
-        self.sarc_int.evaluate()
-        amp_change = self.sarc_int.output(cs.INTEGRATOR_QF).toArray()
-        self.sarc_int.reset()
+        # dphi/dt from seed perturbation
+        dphidx = self.sPRC_interp(time).dot(seeds)
 
-        amp_change *= (2*np.pi)/(self.T)
+        if self.backend.name == 'casadi':
+            # Initialize model and sensitivity states (column-major, as
+            # the casadi reshape)
+            x0 = np.hstack([self.lc(time), seeds.flatten('F')])
+            param = np.hstack([self.param, dphidx])
+
+            # Evaluate model
+            self.sarc_int.setInput(x0, cs.INTEGRATOR_X0)
+            self.sarc_int.setInput(param, cs.INTEGRATOR_P)
+            self.sarc_int.evaluate()
+            amp_change = self.sarc_int.output(cs.INTEGRATOR_QF).toArray()
+            self.sarc_int.reset()
+        else:
+            amp_change = self.backend.amplitude_response(
+                self.lc(time), seeds, dphidx, self.param, self.avg,
+                self.T/(2*np.pi), trans*self.T,
+                self.intoptions['sensabstol'], self.intoptions['sensreltol'],
+                self.intoptions['sensmaxnumsteps'])
+
+        amp_change = amp_change.reshape(self.neq, -1)*(2*np.pi)/(self.T)
 
         return amp_change
 
@@ -736,21 +764,11 @@ class Oscillator(object):
         if not hasattr(self, 'avg'): self.average()
         if not hasattr(self, 'sPRC'): self.find_prc(res)
 
-        # Set up quadrature integrator
-        self.sarc_int = cs.Integrator('cvodes',self._create_ARC_model())
-        self.sarc_int.setOption("abstol", self.intoptions['sensabstol'])
-        self.sarc_int.setOption("reltol", self.intoptions['sensreltol'])
-        self.sarc_int.setOption("max_num_steps",
-                             self.intoptions['sensmaxnumsteps'])
-        self.sarc_int.setOption("t0", 0)
-        self.sarc_int.setOption("tf", trans*self.T)
-        #self.sarc_int.setOption("numeric_jacobian", True)
-
-        self.sarc_int.init()
+        self._create_ARC_integrator(1, trans)
 
-        t_arc = np.linspace(0, self.yT, res)
-        arc = np.array([self._sarc_single_time(t, seed) for t, seed in
-                        zip(t_arc, seeds)]).squeeze()
+        t_arc = np.linspace(0, self.T, res)
+        arc = np.array([self._sarc_single_time(t, seed, trans) for t, seed
+                        in zip(t_arc, seeds)]).squeeze()
         return t_arc, arc
 
     def findSARC(self, state, res=100, trans=3):
@@ -767,6 +785,7 @@ class Oscillator(object):
         if rel: arc *= self.param[param]/self.avg
         return t_arc, arc
 
+    @instrumented('findARC_whole')
     def findARC_whole(self, res=100, trans=3):
         """ Calculate entire sARC matrix, which will be faster than
         calcualting for each parameter """
@@ -775,40 +794,13 @@ class Oscillator(object):
         if not hasattr(self, 'avg'): self.average()
         if not hasattr(self, 'sPRC'): self.find_prc(res)
 
-        # Set up quadrature integrator
-        self.sarc_int = cs.Integrator('cvodes',
-            self._create_ARC_model(numstates=self.neq))
-        self.sarc_int.setOption("abstol", self.intoptions['sensabstol'])
-        self.sarc_int.setOption("reltol", self.intoptions['sensreltol'])
-        self.sarc_int.setOption("max_num_steps",
-                             self.intoptions['sensmaxnumsteps'])
-        self.sarc_int.setOption("t0", 0)
-        self.sarc_int.setOption("tf", trans*self.T)
-        #self.sarc_int.setOption("numeric_jacobian", True)
-        self.sarc_int.init()
+        self._create_ARC_integrator(self.neq, trans)
 
         self.arc_ts = np.linspace(0, self.T, res)
 
-        amp_change = []
-        for t in self.arc_ts:
-            # Initialize model and sensitivity states
-            x0 = np.zeros(self.neq*(self.neq + 1))
-            x0[:self.neq] = self.lc(t)
-            x0[self.neq:] = np.eye(self.neq).flatten()
-
-            # Add dphi/dt from seed perturbation
-            param = np.zeros(self.np + self.neq)
-            param[:self.np] = self.param
-            param[self.np:] = self.sPRC_interp(t)
-
-            # Evaluate model
-            self.sarc_int.setInput(x0, cs.INTEGRATOR_X0)
-            self.sarc_int.setInput(param, cs.INTEGRATOR_P)
-            self.sarc_int.evaluate()
-            out = self.sarc_int.output(cs.INTEGRATOR_QF).toArray()
-            # amp_change += [out]
-            amp_change += [out*2*np.pi/self.T]
-
+        # seeds: every state at once
+        amp_change = [self._sarc_single_time(t, np.eye(self.neq), trans)
+                      for t in self.arc_ts]
 
         #[time, state_out, state_in]
         self.sARC = np.array(amp_change)
@@ -818,6 +810,7 @@ class Oscillator(object):
 
         self.rel_pARC = (np.array(self.param) * self.pARC /
                          np.atleast_2d(self.avg).T)
+        self._save()
 
     def _cos_components(self):
         """ return the phases and amplitudes associated with the first
@@ -832,37 +825,27 @@ class Oscillator(object):
         comp = 2./n*dft_sol[1]
         return np.abs(comp), np.angle(comp), baseline
 
+    @instrumented('average')
     def average(self):
         """
         integrate the solution with quadrature to find the average
         species concentration. outputs to self.avg
         """
 
-        ffcn_in = self.model.inputExpr()
-        ode = self.model.outputExpr()
-        quad = cs.vertcat([ffcn_in[cs.DAE_X], ffcn_in[cs.DAE_X]**2])
-
-        quadmodel = cs.SXFunction(ffcn_in, cs.daeOut(ode=ode[0], quad=quad))
-
-        qint = cs.Integrator('cvodes',quadmodel)
-        qint.setOption("abstol"        , self.intoptions['lc_abstol'])
-        qint.setOption("reltol"        , self.intoptions['lc_reltol'])
-        qint.setOption("max_num_steps" , self.intoptions['lc_maxnumsteps'])
-        qint.setOption("tf",self.T)
-        qint.init()
-        qint.setInput(self.y0, cs.INTEGRATOR_X0)
-        qint.setInput(self.param, cs.INTEGRATOR_P)
-        qint.evaluate()
-        quad_out = qint.output(cs.INTEGRATOR_QF).toArray().squeeze()
-        self.avg = quad_out[:self.neq]/self.T
-        self.rms = np.sqrt(quad_out[self.neq:]/self.T)
+        quad_y, quad_y2 = self.backend.average(
+            self.y0, self.param, self.T, self.intoptions['lc_abstol'],
+            self.intoptions['lc_reltol'], self.intoptions['lc_maxnumsteps'])
+        self.avg = quad_y/self.T
+        self.rms = np.sqrt(quad_y2/self.T)
         self.std = np.sqrt(self.rms**2 - self.avg**2)
+        self._save()
 
     def lc_phi(self, phi):
         """ interpolate the selc.lc interpolation object using a time on
         (0,2*pi) """
         return self.lc(self._phi_to_t(phi%(2*np.pi)))
 
+    @instrumented('phase_of_point')
     def phase_of_point(self, point, error=False, tol=1E-3):
         """ Finds the phase at which the distance from the point to the
         limit cycle is minimized. phi=0 corresponds to the definition of
@@ -870,6 +853,8 @@ class Oscillator(object):
         cycle """
 
         point = np.asarray(point)
+        if self.backend.name != 'casadi':
+            return self._phase_of_point_lc(point, tol)
 
         #set up integrator so we only have to once...
         intr = cs.Integrator('cvodes',self.model)
@@ -924,6 +909,31 @@ class Oscillator(object):
 
         raise RuntimeError("Point failed to converge to limit cycle")
 
+    def _phase_of_point_lc(self, point, tol=1E-3):
+        """ phase_of_point without casadi: the squared distance from the
+        point to the limit-cycle samples is minimized, refined between
+        the neighboring samples on the interpolant, and the point is
+        advanced by one cycle until it is within tol """
+        from scipy.optimize import minimize_scalar
+
+        if not hasattr(self, 'lc'): self.limit_cycle()
+        dt = self.ts[1] - self.ts[0]
+        for i in xrange(100):
+            t0 = self.ts[np.argmin(((self.sol - point)**2).sum(1))]
+            out = minimize_scalar(
+                lambda t: ((self.lc(t) - point)**2).sum(),
+                bounds=(t0 - dt, t0 + dt), method='bounded')
+
+            if out.fun < tol:
+                return self._t_to_phi(out.x % self.T)
+
+            point = self.backend.integrate(
+                point, self.param, [0, self.T], self.intoptions['bvp_abstol'],
+                self.intoptions['bvp_reltol'],
+                self.intoptions['transmaxnumsteps'])[-1]
+
+        raise RuntimeError("Point failed to converge to limit cycle")
+
     def roots(self, res=500):
         """
         Mediocre reproduction of Peter's roots fcn. Returns full max/min
@@ -954,48 +964,3 @@ class Oscillator(object):
                         for i,d1 in enumerate(der1s)])
         self.ymin = np.array([spi(self.tmin[i]) for i,spi in enumerate(sps)])
 
-
-if __name__ == "__main__":
-
-    from Models.tyson_model import model, param, EqCount
-
-    lap = jha.laptimer()
-
-    # initialize with 1s
-    tyson = Oscillator(model(), param, np.ones(EqCount))
-    print tyson.y0, 'setup time = %0.3f' %(lap() )
-
-    # find a spot on LC
-    tyson.y0 = np.ones(EqCount)
-    tyson.burn_trans()
-    print tyson.y0, 'y0 burn time = %0.3f' %(lap() )
-
-    # or find a max and the approximate period
-    tyson.approx_y0_T()
-    print tyson.y0, tyson.T, 'y0 approx time = %0.3f' %(lap() )
-
-    # find the period and y0 using a BVP solution
-    tyson.solve_bvp(method='scipy')
-    print tyson.y0, tyson.T, 'y0 scipy bvp time = %0.3f' %(lap() )
-
-    # find the period and y0 using a BVP solution
-    tyson.solve_bvp(method='casadi')
-    print tyson.y0, tyson.T, 'y0 casadi bvp time = %0.3f' %(lap() )
-
-    # find steady state soln (fixed pt)
-    tyson.find_stationary()
-    print tyson.ss, 'stationary time = %0.3f' %(lap() )
-        # or perform everything all at once
-    tyson = Oscillator(model(), param, np.ones(EqCount))
-    tyson.calc_y0()
-    print tyson.y0, tyson.T, 'y0 start-finish = %0.3f' %(lap() )
-
-    # adiitional analysis tools
-    tyson.limit_cycle()
-    tyson.first_order_sensitivity()
-    intg = tyson.find_prc()
-
-
-
-
-
@@ -0,0 +1,105 @@
+"""
+Phase reduction of an oscillator about its limit cycle.
+
+A weakly perturbed oscillator is represented by its phase alone,
+    dphi/dt = omega + Z(phi).p(t, phi)
+where Z is the state phase response curve (Oscillator.sPRC, radians per
+unit of state) and p the perturbation to the vector field. The limit
+cycle and the PRC are tabulated on a uniform phase grid so both can be
+interpolated for whole arrays of phases at once, and the phase equations
+of a population are stepped together with a fixed-step RK4.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class PhaseTable(object):
+    """
+    Limit cycle and state PRC of an Oscillator on res uniformly spaced
+    phases of (0, 2pi). find_prc is called if it has not been already.
+    """
+
+    def __init__(self, osc, res=1000):
+        if not hasattr(osc, 'sPRC_interp'): osc.find_prc()
+
+        self.T = osc.T
+        self.res = res
+        self.ylabels = list(osc.ylabels)
+        self.phis = np.linspace(0, 2*np.pi, res, endpoint=False)
+
+        ts = osc._phi_to_t(self.phis)
+        self.lc = np.atleast_2d(osc.lc(ts))
+        self.prc = np.atleast_2d(osc.sPRC_interp(ts))
+
+    def _index(self, state):
+        if isinstance(state, str): return self.ylabels.index(state)
+        return state
+
+    def bracket(self, phi):
+        """ grid indices either side of phases phi and the fraction of the
+        way between them, for reuse across several tables """
+        x = np.mod(phi, 2*np.pi)*(self.res/(2*np.pi))
+        i0 = x.astype(int)
+        frac = x - i0
+        i0 %= self.res
+        return i0, (i0 + 1) % self.res, frac
+
+    def interp(self, table, phi, bracket=None):
+        """ periodic linear interpolation of table [res, ...] at phases
+        phi, of any shape """
+        i0, i1, frac = self.bracket(phi) if bracket is None else bracket
+        if table.ndim > 1: frac = frac[..., None]
+        return table[i0] + frac*(table[i1] - table[i0])
+
+    def lc_state(self, phi, state=0):
+        """ limit cycle value of state (index or label) at phases phi """
+        return self.interp(self.lc[:, self._index(state)], phi)
+
+    def prc_state(self, phi, state=0):
+        """ PRC of state (index or label) at phases phi """
+        return self.interp(self.prc[:, self._index(state)], phi)
+
+    def nearest_phase(self, point):
+        """ phase of the tabulated limit cycle point closest to point. a
+        cheap stand-in for the isochron phase near the limit cycle """
+        dist = ((self.lc - np.asarray(point))**2).sum(1)
+        return self.phis[np.argmin(dist)]
+
+
+def integrate_phases(dphidt, phi0, tf, dt=0.1, save_every=1, t0=0.,
+                     dtype=np.float64):
+    """
+    Steps phi' = dphidt(t, phi) with fixed-step RK4 from t0 to tf for an
+    array of phases phi0. Phases are not wrapped, so they count cycles.
+    Returns the saved times and phases [len(ts), len(phi0)], stored
+    every save_every steps (and at the start and end). dt is shortened
+    slightly if needed so the last step lands on tf.
+    """
+
+    numsteps = int(np.ceil((tf - t0)/dt - 1E-9))
+    dt = (tf - t0)/numsteps
+    saved = range(0, numsteps + 1, save_every)
+    if saved[-1] != numsteps: saved = list(saved) + [numsteps]
+
+    phi = np.array(phi0, dtype=float)
+    phases = np.empty((len(saved), phi.size), dtype=dtype)
+    ts = t0 + dt*np.array(saved, dtype=float)
+    phases[0] = phi
+
+    out = 1
+    for step in range(1, numsteps + 1):
+        t = t0 + dt*(step - 1)
+        k1 = dphidt(t, phi)
+        k2 = dphidt(t + dt/2, phi + dt/2*k1)
+        k3 = dphidt(t + dt/2, phi + dt/2*k2)
+        k4 = dphidt(t + dt, phi + dt*k3)
+        phi = phi + dt/6*(k1 + 2*k2 + 2*k3 + k4)
+        if out < len(saved) and step == saved[out]:
+            phases[out] = phi
+            out += 1
+
+    return ts, phases
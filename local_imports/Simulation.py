@@ -0,0 +1,251 @@
+"""
+Simulation layer above the Oscillator: shared pre-experiment phases and
+forked continuations.
+
+An Experiment is a picklable recipe for an Oscillator (a module-level
+model builder, its arguments and the parameters), so it can be rebuilt in
+worker processes. A Snapshot holds the full state and time of a run.
+Experiments that share their early dynamics (the same mouse under
+different light/feeding protocols, a genotype switch, a schedule shift)
+integrate the common phase once with run_to_snapshot, and fork continues
+every variant from the snapshot in parallel.
+
+A Simulation is a long run that keeps its current state and time. extend
+continues it from the endpoint and appends the output, and checkpoints
+written to disk along the way let a run be resumed or lengthened later
+without repeating what is done. A checkpointed run appends each chunk of
+output to a Storage.TrajectoryStore in the checkpoint directory, next to
+a small file with the state needed to resume, so checkpoints never
+rewrite the output already on disk.
+
+jha
+"""
+
+from __future__ import division
+
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import numpy as np
+
+from .LimitCycle import Oscillator
+from .Storage import TrajectoryStore
+from .Utilities import pool_map
+
+
+class Experiment(object):
+    """
+    builder(*args, **kwargs) gives the model (or a tuple whose first
+    element is the model, as the malaria builders return), simulated with
+    param. builder must be a module-level function to be used in fork.
+    """
+
+    def __init__(self, builder, args=(), kwargs=None, param=None):
+        self.builder = builder
+        self.args = tuple(args)
+        self.kwargs = {} if kwargs is None else dict(kwargs)
+        self.param = param
+
+    def model(self):
+        model = self.builder(*self.args, **self.kwargs)
+        return model[0] if isinstance(model, tuple) else model
+
+    def build(self):
+        """ the builder and its arguments, the build of the Oscillator
+        (which keys CycleStore entries) """
+        return {'builder' : '%s.%s' % (self.builder.__module__,
+                                       self.builder.__name__),
+                'args'    : list(self.args),
+                'kwargs'  : self.kwargs}
+
+    def oscillator(self, y0, **kwargs):
+        """ Oscillator of the model from y0; kwargs go to Oscillator """
+        kwargs.setdefault('build', self.build())
+        return Oscillator(self.model(), self.param, y0=y0, **kwargs)
+
+    def __repr__(self):
+        return 'Experiment(%s, %s)' % (self.builder.__name__,
+                                       ', '.join(map(str, self.args)))
+
+
+class Snapshot(object):
+    """ full state y of a run at time t, and the experiment it came
+    from """
+
+    def __init__(self, t, y, experiment=None):
+        self.t = t
+        self.y = np.array(y, dtype=float)
+        self.experiment = experiment
+
+    def __repr__(self):
+        return 'Snapshot(t=%g, %d states)' % (self.t, len(self.y))
+
+
+def run_to_snapshot(experiment, y0, t, t0=0., numsteps=1000):
+    """ integrates experiment from y0 at t0 to t. Returns the Snapshot at
+    t and the trajectory ts, sol of the shared phase """
+    osc = experiment.oscillator(y0)
+    ts, sol = osc.int_odes(t, numsteps=numsteps, ts=t0)
+    return Snapshot(t, sol[-1], experiment), ts, sol
+
+def continue_from(snapshot, experiment, tf, numsteps=1000):
+    """ integrates experiment from the snapshot state and time to tf """
+    osc = experiment.oscillator(snapshot.y)
+    if osc.neq != len(snapshot.y):
+        raise ValueError("%r has %d states, snapshot has %d"
+                         % (experiment, osc.neq, len(snapshot.y)))
+    return osc.int_odes(tf, numsteps=numsteps, ts=snapshot.t)
+
+def _continue(task):
+    """ pool worker for fork """
+    return continue_from(*task)
+
+def fork(snapshot, continuations, tf, numsteps=1000, processes=None):
+    """
+    Continues each of the continuations (a dict of name: Experiment) from
+    snapshot to tf, in a pool of processes. Returns a dict of name:
+    (ts, sol).
+    """
+    names = sorted(continuations.keys())
+    tasks = [(snapshot, continuations[name], tf, numsteps)
+             for name in names]
+    return dict(zip(names, pool_map(_continue, tasks, processes)))
+
+
+class Simulation(object):
+    """
+    Run of experiment from y0 at t0 that can be extended. Output is kept
+    every output_dt. If checkpoint is a directory, the output is written
+    to a TrajectoryStore there (so the model must have the population
+    layout, 5 host + 4 per parasite states) instead of being kept in
+    memory, the state is saved after every checkpoint_every hours of
+    simulated time (and at the end of each extend), and the run can be
+    picked up again with Simulation.resume.
+    """
+
+    state_file = 'simulation.pkl'
+
+    def __init__(self, experiment, y0, t0=0., output_dt=0.2,
+                 checkpoint=None, checkpoint_every=None):
+        self.experiment = experiment
+        self.t = t0
+        self.y = np.array(y0, dtype=float)
+        self.output_dt = output_dt
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self._ts = [np.array([t0])]
+        self._sol = [self.y[None, :]]
+
+        self.store = None
+        if checkpoint is not None:
+            num_parasites, rest = divmod(len(self.y) - 5, 4)
+            if rest or num_parasites < 0:
+                raise ValueError("checkpoints store population models, "
+                                 "not %d states" % len(self.y))
+            self.store = TrajectoryStore.create(checkpoint, num_parasites,
+                                                1)
+            self.store.write(self._ts[0], self._sol[0])
+            self.save()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, experiment=None, **kwargs):
+        """ simulation continuing from snapshot, with its experiment
+        unless another is given """
+        if experiment is None: experiment = snapshot.experiment
+        return cls(experiment, snapshot.y, snapshot.t, **kwargs)
+
+    @property
+    def ts(self):
+        if self.store is not None: return self.store.ts[:len(self.store)]
+        if len(self._ts) > 1: self._ts = [np.hstack(self._ts)]
+        return self._ts[0]
+
+    @property
+    def sol(self):
+        if self.store is not None: return self.store.to_states()
+        if len(self._sol) > 1: self._sol = [np.vstack(self._sol)]
+        return self._sol[0]
+
+    def snapshot(self):
+        return Snapshot(self.t, self.y, self.experiment)
+
+    def _oscillator(self):
+        if not hasattr(self, 'osc'):
+            self.osc = self.experiment.oscillator(self.y)
+        return self.osc
+
+    def extend(self, duration):
+        """ continues the run from its endpoint for duration (h) and
+        appends the output. Returns the new ts, sol """
+
+        osc = self._oscillator()
+        chunk = duration if self.checkpoint_every is None else \
+                self.checkpoint_every
+        start = len(self.ts)
+        tf = self.t + duration
+
+        # (t0, t1, numsteps) of each chunk
+        chunks, t0 = [], self.t
+        while tf - t0 > 1E-9:
+            t1 = min(t0 + chunk, tf)
+            chunks.append((t0, t1,
+                           max(int(round((t1 - t0)/self.output_dt)), 1) + 1))
+            t0 = t1
+
+        if self.store is not None:
+            rows = len(self.store) + sum(n - 1 for _, _, n in chunks)
+            if rows > self.store.numsteps: self.store.resize(rows)
+
+        for t0, t1, numsteps in chunks:
+            ts, sol = osc.int_odes(t1, y0=self.y, numsteps=numsteps, ts=t0)
+            self.t, self.y = t1, sol[-1]
+            if self.store is None:
+                self._ts.append(ts[1:])
+                self._sol.append(sol[1:])
+            else:
+                self.store.write(ts[1:], sol[1:])
+                self.save()
+
+        if self.store is not None:
+            return (self.ts[start:],
+                    self.store.to_states(slice(start, len(self.store))))
+        return self.ts[start:], self.sol[start:]
+
+    def save(self):
+        """ writes the state needed to resume the run (not the output,
+        which is already in the store) to the checkpoint directory,
+        replacing the previous one only once the new file is complete """
+        state = {'experiment'       : self.experiment,
+                 't'                : self.t,
+                 'y'                : self.y,
+                 'output_dt'        : self.output_dt,
+                 'checkpoint_every' : self.checkpoint_every,
+                 'filled'           : len(self.store)}
+        filename = os.path.join(self.checkpoint, self.state_file)
+        with open(filename + '.tmp', 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.tmp', filename)
+
+    @classmethod
+    def resume(cls, checkpoint, keep_checkpointing=True):
+        """ run saved in the checkpoint directory. Further output goes to
+        the same store unless keep_checkpointing is False, in which case
+        the output so far is loaded into memory """
+        with open(os.path.join(checkpoint, cls.state_file), 'rb') as f:
+            state = pickle.load(f)
+        store = TrajectoryStore(checkpoint,
+                                'r+' if keep_checkpointing else 'r')
+        # output written after the last saved state is overwritten
+        store.meta['filled'] = state['filled']
+        sim = cls(state['experiment'], state['y'], state['t'],
+                  state['output_dt'],
+                  checkpoint_every=state['checkpoint_every'])
+        if keep_checkpointing:
+            sim.checkpoint, sim.store = checkpoint, store
+        else:
+            sim._ts = [np.array(store.ts[:len(store)])]
+            sim._sol = [store.to_states()]
+        return sim
@@ -0,0 +1,134 @@
+"""
+Structured timing and solver metrics for Oscillator operations.
+
+Each instrumented Oscillator method adds one record to the oscillator's
+SolverStats object: wall time, the solver counters accumulated by the
+backend during the call (steps, rhs and jacobian evaluations, error-test
+and newton failures, where the backend reports them), and the memory of
+the arrays it returned or stored. Records carry a scenario tag so one
+stats object can be shared across a whole run and queried afterwards.
+
+jha
+"""
+
+from __future__ import division
+import json
+from functools import wraps
+
+import numpy as np
+
+from .Utilities import laptimer
+
+
+# counters a backend may report, summed over each operation
+COUNTERS = ['nsteps', 'nfevals', 'njevals', 'nlinsetups', 'netfails',
+            'nniters', 'nncfails']
+
+
+class SolverStats(object):
+    """
+    Collection of per-operation records. If log is a filename, every
+    record is also appended to it as one line of JSON.
+    """
+
+    def __init__(self, log=None, scenario=None):
+        self.records = []
+        self.log = log
+        self.scenario = scenario
+        self._stack = []
+
+    def record(self, operation, **metrics):
+        """ add a record for operation, tagged with the current scenario
+        and the enclosing operation, if any """
+        rec = {'operation' : operation,
+               'scenario'  : self.scenario,
+               'parent'    : self._stack[-1] if self._stack else None}
+        rec.update(metrics)
+        self.records.append(rec)
+        if self.log is not None:
+            with open(self.log, 'a') as f:
+                f.write(json.dumps(rec) + '\n')
+        return rec
+
+    def query(self, operation=None, scenario=None, toplevel=False):
+        """ records matching operation and scenario. if toplevel, only
+        operations not called from within another operation """
+        return [r for r in self.records
+                if (operation is None or r['operation'] == operation)
+                and (scenario is None or r['scenario'] == scenario)
+                and (not toplevel or r['parent'] is None)]
+
+    def total(self, key='wall_time', operation=None, scenario=None,
+              toplevel=True):
+        """ sum of key over the matching records. Nested operations are
+        already included in the operations that called them, so only
+        toplevel records are summed unless toplevel is False """
+        return sum(r.get(key, 0)
+                   for r in self.query(operation, scenario, toplevel))
+
+    def summary(self, by='operation', toplevel=True):
+        """ dict of totals grouped by 'operation' or 'scenario', over the
+        toplevel records (as in total) unless toplevel is False """
+        out = {}
+        for r in self.query(toplevel=toplevel):
+            group = out.setdefault(r[by], {'calls' : 0, 'wall_time' : 0.})
+            group['calls'] += 1
+            for key in ['wall_time', 'output_bytes'] + COUNTERS:
+                if key in r: group[key] = group.get(key, 0) + r[key]
+        return out
+
+    def to_json(self, filename):
+        """ write all records to filename """
+        with open(filename, 'w') as f:
+            json.dump(self.records, f, indent=1)
+
+    def clear(self):
+        self.records = []
+
+
+def _array_nbytes(obj):
+    """ memory of the numpy arrays in obj, looking inside tuples/lists """
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    if isinstance(obj, (tuple, list)):
+        return sum(_array_nbytes(o) for o in obj)
+    return 0
+
+
+def instrumented(operation):
+    """
+    Decorator for Oscillator methods. Records wall time, backend solver
+    counter deltas, and the bytes of arrays returned or newly stored on
+    the oscillator, into self.stats (if the oscillator has one).
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = getattr(self, 'stats', None)
+            if stats is None: return method(self, *args, **kwargs)
+
+            counters = getattr(self.backend, 'counters', {})
+            before = dict(counters)
+            attrs = dict((k, id(v)) for k, v in self.__dict__.items())
+
+            stats._stack.append(operation)
+            lap = laptimer()
+            try:
+                out = method(self, *args, **kwargs)
+            finally:
+                wall = lap()
+                stats._stack.pop()
+
+            stored = sum(_array_nbytes(v) for k, v in self.__dict__.items()
+                         if attrs.get(k) != id(v))
+            metrics = {'wall_time' : wall,
+                       'output_bytes' : _array_nbytes(out) + stored}
+            for key in COUNTERS:
+                if key in counters:
+                    metrics[key] = counters[key] - before.get(key, 0)
+            stats.record(operation, **metrics)
+            return out
+
+        return wrapper
+
+    return decorator
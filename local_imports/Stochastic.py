@@ -0,0 +1,99 @@
+"""
+Stochastic integrators for systems in which every state has one birth
+and one death reaction, with propensities given in concentration units
+for a system volume. birth(t, x) and death(t, x) return arrays shaped
+like x, so a whole block of independent oscillators (e.g. parasites x
+states) is stepped at once.
+
+    chemical_langevin : Euler-Maruyama on the chemical Langevin equation
+    tau_leap          : Poisson tau-leaping on molecule counts
+
+Each realization takes its own seed. run_realizations maps a worker over
+tasks in a process pool, and realization_seeds gives reproducible,
+distinct seeds for a set of realizations.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .Utilities import pool_map
+
+
+def _fixed_steps(t0, tf, dt, save_every):
+    """ number of steps, step size landing on tf, indices of saved
+    steps (including the first and last) and their times """
+    numsteps = int(np.ceil((tf - t0)/dt - 1E-9))
+    dt = (tf - t0)/numsteps
+    saved = list(range(0, numsteps + 1, save_every))
+    if saved[-1] != numsteps: saved.append(numsteps)
+    return numsteps, dt, saved, t0 + dt*np.array(saved, dtype=float)
+
+def chemical_langevin(birth, death, x0, tf, dt=0.01, volume=1000.,
+                      seed=None, save_every=100, t0=0.):
+    """
+    Euler-Maruyama integration of
+        dx = (b - d) dt + sqrt((b + d)/volume) dW
+    from t0 to tf. States are kept non-negative. Returns the saved times
+    and states [len(ts), x0.shape].
+    """
+
+    rng = np.random.RandomState(seed)
+    numsteps, dt, saved, ts = _fixed_steps(t0, tf, dt, save_every)
+
+    x = np.array(x0, dtype=float)
+    out = np.empty((len(saved),) + x.shape)
+    out[0] = x
+    si = 1
+    for step in range(1, numsteps + 1):
+        t = t0 + dt*(step - 1)
+        b = birth(t, x)
+        d = death(t, x)
+        x = x + (b - d)*dt + np.sqrt((b + d)*(dt/volume))*rng.standard_normal(
+            x.shape)
+        np.maximum(x, 0, out=x)
+        if si < len(saved) and step == saved[si]:
+            out[si] = x
+            si += 1
+
+    return ts, out
+
+def tau_leap(birth, death, x0, tf, tau=0.01, volume=1000., seed=None,
+             save_every=100, t0=0.):
+    """
+    Tau-leaping with fixed leap tau: over each leap, Poisson numbers of
+    birth and death events with means volume*b*tau and volume*d*tau act
+    on the molecule counts volume*x. Counts are kept non-negative.
+    Returns the saved times and concentrations [len(ts), x0.shape].
+    """
+
+    rng = np.random.RandomState(seed)
+    numsteps, tau, saved, ts = _fixed_steps(t0, tf, tau, save_every)
+
+    n = np.round(np.asarray(x0, dtype=float)*volume)
+    out = np.empty((len(saved),) + n.shape)
+    out[0] = n/volume
+    si = 1
+    for step in range(1, numsteps + 1):
+        t = t0 + tau*(step - 1)
+        x = n/volume
+        n = n + rng.poisson(volume*tau*birth(t, x)) \
+              - rng.poisson(volume*tau*death(t, x))
+        np.maximum(n, 0, out=n)
+        if si < len(saved) and step == saved[si]:
+            out[si] = n/volume
+            si += 1
+
+    return ts, out
+
+def realization_seeds(seed, num_realizations):
+    """ distinct, reproducible seeds for num_realizations realizations """
+    return np.random.RandomState(seed).randint(0, 2**31 - 1,
+                                               num_realizations)
+
+def run_realizations(worker, tasks, processes=None):
+    """ worker(task) for each task, over a pool of processes (serially
+    if processes is 1). worker must be a module-level function """
+    return pool_map(worker, tasks, processes)
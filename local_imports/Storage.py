@@ -0,0 +1,166 @@
+"""
+Memory-mapped trajectory storage for population models.
+
+A store is a directory of .npy files opened as memory maps:
+    ts.npy        [T]          output times
+    host.npy      [5, T]       host states X1-X4, B1
+    parasites.npy [N, 4, T]    parasite states M1-M4, parasite-major
+so one parasite's trajectory is contiguous on disk, and per-state or
+per-parasite slices are views that only touch the pages they need.
+float32 storage halves the footprint. Stores pickle as their path, so
+worker processes reopen the same files instead of receiving copies.
+
+jha
+"""
+
+from __future__ import division
+
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+HOST_STATES = 5
+PARASITE_STATES = 4
+
+
+class TrajectoryStore(object):
+    """
+    Store at path. Use TrajectoryStore.create for a new one; opening an
+    existing store maps it with mode ('r' read-only, 'r+' writable).
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.ts = self._open('ts')
+        self.host = self._open('host')
+        self.parasites = self._open('parasites')
+        self.num_parasites, _, self.numsteps = self.parasites.shape
+
+    def _open(self, name):
+        return np.load(os.path.join(self.path, name + '.npy'),
+                       mmap_mode=self.mode)
+
+    @classmethod
+    def create(cls, path, num_parasites, numsteps, dtype=np.float64,
+               **meta):
+        """ new store for numsteps output times of num_parasites
+        parasites. meta (e.g. the experiment) is saved alongside """
+        if not os.path.isdir(path): os.makedirs(path)
+        shapes = {'ts'        : (numsteps,),
+                  'host'      : (HOST_STATES, numsteps),
+                  'parasites' : (num_parasites, PARASITE_STATES, numsteps)}
+        for name, shape in shapes.items():
+            open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                        dtype=np.float64 if name == 'ts' else dtype,
+                        shape=shape).flush()
+        meta.update(dtype=np.dtype(dtype).name, filled=0)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(path, 'r+')
+
+    def __getstate__(self): return {'path' : self.path, 'mode' : self.mode}
+
+    def __setstate__(self, state): self.__init__(**state)
+
+    def __len__(self): return self.meta['filled']
+
+    def write(self, ts, states, start=None):
+        """ writes output times ts and states [len(ts), 5 + 4N], in the
+        layout of int_odes, from output index start (default: after what
+        is already filled) """
+        if start is None: start = self.meta['filled']
+        stop = start + len(ts)
+        self.ts[start:stop] = ts
+        self.host[:, start:stop] = states[:, :HOST_STATES].T
+        self.parasites[:, :, start:stop] = states[:, HOST_STATES:].reshape(
+            len(ts), self.num_parasites, PARASITE_STATES).transpose(1, 2, 0)
+        self.meta['filled'] = int(max(self.meta['filled'], stop))
+        self.flush()
+
+    def flush(self):
+        for arr in (self.ts, self.host, self.parasites): arr.flush()
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    def resize(self, numsteps):
+        """ room for numsteps output times, keeping the filled ones. The
+        files are rewritten, so reserve what a run needs at once rather
+        than growing step by step """
+        filled = min(len(self), numsteps)
+        for name in ('ts', 'host', 'parasites'):
+            old = getattr(self, name)
+            tmp = os.path.join(self.path, name + '.tmp.npy')
+            new = open_memmap(tmp, mode='w+', dtype=old.dtype,
+                              shape=old.shape[:-1] + (numsteps,))
+            new[..., :filled] = old[..., :filled]
+            new.flush()
+            del new, old
+            setattr(self, name, None)
+            os.rename(tmp, os.path.join(self.path, name + '.npy'))
+        self.meta['filled'] = filled
+        self._write_meta()
+        self.__init__(self.path, self.mode)
+
+    def state(self, state=0):
+        """ lazy [N, T] view of parasite state (0-3 for M1-M4) """
+        return self.parasites[:, state, :len(self)]
+
+    def parasite(self, index):
+        """ lazy [4, T] view of one parasite """
+        return self.parasites[index, :, :len(self)]
+
+    def host_state(self, state=0):
+        """ lazy [T] view of host state (0-4 for X1-X4, B1) """
+        return self.host[state, :len(self)]
+
+    def mean(self, state=0, weights=None, chunk=1024):
+        """ (weighted) population mean of parasite state over time,
+        accumulated over chunks of parasites """
+        if weights is None: weights = np.ones(self.num_parasites)
+        weights = np.asarray(weights, dtype=float)
+        total = np.zeros(len(self))
+        for i in range(0, self.num_parasites, chunk):
+            block = self.parasites[i:i+chunk, state, :len(self)]
+            total += weights[i:i+chunk].dot(block)
+        return total/weights.sum()
+
+    def to_states(self, rows=slice(None)):
+        """ [T, 5 + 4N] array in the layout of int_odes, for output rows
+        (a slice of time points). Loads the data """
+        n = len(range(*rows.indices(len(self))))
+        host = self.host[:, :len(self)][:, rows].T
+        par = self.parasites[:, :, :len(self)][:, :, rows]
+        return np.hstack([host, par.transpose(2, 0, 1).reshape(n, -1)])
+
+
+def integrate_to_store(osc, tf, path, numsteps=10000, chunks=10,
+                       dtype=np.float32, y0=None, t0=0., **meta):
+    """
+    Integrates a population Oscillator from t0 to tf in chunks, writing
+    each to a new store at path, so the whole trajectory is never held
+    in memory. Returns the store.
+    """
+    if y0 is None: y0 = osc.y0
+    num_parasites = (osc.neq - HOST_STATES)//PARASITE_STATES
+    store = TrajectoryStore.create(path, num_parasites, numsteps, dtype,
+                                   **meta)
+
+    ts = np.linspace(t0, tf, numsteps)
+    bounds = np.linspace(0, numsteps - 1, chunks + 1).astype(int)
+    y = np.asarray(y0, dtype=float)
+    store.write(ts[:1], y[None, :])
+    for i0, i1 in zip(bounds[:-1], bounds[1:]):
+        if i1 == i0: continue
+        sol = osc.int_odes(ts[i1], y0=y, numsteps=i1 - i0 + 1,
+                           ts=ts[i0])[1]
+        store.write(ts[i0+1:i1+1], sol[1:], i0 + 1)
+        y = sol[-1]
+    return store
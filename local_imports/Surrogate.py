@@ -0,0 +1,146 @@
+"""
+Gaussian-process emulation of expensive model outputs.
+
+GaussianProcess regresses outputs [n, m] on inputs in the unit cube
+[n, k] with an anisotropic squared-exponential kernel. The length scales
+and the noise are shared by all outputs and set by maximizing the summed
+marginal likelihood. Each output is standardized, so it keeps its own
+scale. A prediction is a few small matrix products, well under a
+millisecond for a design of a few hundred runs, and comes with a
+standard deviation.
+
+Emulator trains one on a Latin hypercube design of simulations over a
+parameter box and answers queries from it. Queries whose predicted
+standard deviation exceeds a tolerance are simulated instead, and the
+runs are added to the design.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+
+from .Estimation import latin_hypercube
+from .GlobalSensitivity import evaluate, scale
+
+
+class GaussianProcess(object):
+    """ GP fit to X [n, k] (unit cube) and Y [n, m]. Rows with nan
+    outputs are dropped """
+
+    def __init__(self, X, Y, noise=1E-6, optimize=True):
+        X, Y = np.atleast_2d(X), np.asarray(Y, dtype=float)
+        Y = Y.reshape(len(X), -1)
+        keep = np.isfinite(Y).all(1)
+        self.X, self.Y = X[keep], Y[keep]
+        self.length = 0.3*np.ones(X.shape[1])
+        self.noise = noise
+        if optimize: self.optimize()
+        else: self._factor()
+
+    def _kernel(self, A, B, length=None):
+        if length is None: length = self.length
+        d = (A[:, None, :] - B[None, :, :])/length
+        return np.exp(-0.5*(d**2).sum(-1))
+
+    def _standardize(self):
+        self.mu = self.Y.mean(0)
+        self.sd = self.Y.std(0)
+        self.sd[self.sd == 0] = 1.
+        return (self.Y - self.mu)/self.sd
+
+    def _nll(self, log_theta):
+        """ negative log marginal likelihood, summed over outputs """
+        length, noise = np.exp(log_theta[:-1]), np.exp(log_theta[-1])
+        K = self._kernel(self.X, self.X, length) + noise*np.eye(len(self.X))
+        try: L = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError: return np.inf
+        Z = self._standardize()
+        alpha = cho_solve(L, Z)
+        logdet = 2*np.log(np.diag(L[0])).sum()
+        return 0.5*(Z*alpha).sum() + 0.5*Z.shape[1]*logdet
+
+    def optimize(self):
+        """ sets the length scales and noise by maximum likelihood """
+        x0 = np.log(np.hstack([self.length, self.noise]))
+        bounds = [(np.log(1E-2), np.log(1E1))]*len(self.length) + \
+                 [(np.log(1E-10), np.log(1E-1))]
+        res = minimize(self._nll, x0, method='L-BFGS-B', bounds=bounds)
+        self.length, self.noise = np.exp(res.x[:-1]), np.exp(res.x[-1])
+        self._factor()
+
+    def _factor(self):
+        K = self._kernel(self.X, self.X) + self.noise*np.eye(len(self.X))
+        self.L = cho_factor(K, lower=True)
+        self.alpha = cho_solve(self.L, self._standardize())
+
+    def add(self, X, Y):
+        """ adds runs to the data, keeping the hyperparameters """
+        Y = np.asarray(Y, dtype=float).reshape(len(X), -1)
+        keep = np.isfinite(Y).all(1)
+        self.X = np.vstack([self.X, np.atleast_2d(X)[keep]])
+        self.Y = np.vstack([self.Y, Y[keep]])
+        self._factor()
+
+    def predict(self, X):
+        """ mean and standard deviation [n, m] at X [n, k] """
+        X = np.atleast_2d(X)
+        Ks = self._kernel(X, self.X)
+        mean = Ks.dot(self.alpha)
+        v = cho_solve(self.L, Ks.T)
+        var = np.maximum(1 + self.noise - (Ks*v.T).sum(1), 0)
+        return (self.mu + self.sd*mean,
+                self.sd*np.sqrt(var)[:, None])
+
+
+class Emulator(object):
+    """
+    GaussianProcess of simulate(x, **kwargs) over bounds [k, 2] (in log
+    space if log), trained on samples runs evaluated over a process
+    pool. simulate must be a module-level function returning the
+    outputs of one parameter vector.
+    """
+
+    def __init__(self, simulate, bounds, samples=64, log=False, seed=None,
+                 processes=None, **kwargs):
+        self.simulate = simulate
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.log = log
+        self.processes = processes
+        self.kwargs = kwargs
+        U = latin_hypercube(samples, len(self.bounds), seed)
+        Y = evaluate(simulate, scale(U, self.bounds, log), processes,
+                     **kwargs)
+        self.gp = GaussianProcess(U, Y)
+
+    def _unit(self, X):
+        lo, hi = self.bounds.T
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if self.log: X, lo, hi = np.log(X), np.log(lo), np.log(hi)
+        return (X - lo)/(hi - lo)
+
+    def predict(self, X):
+        """ emulated mean and standard deviation [n, m] at X [n, k] """
+        return self.gp.predict(self._unit(X))
+
+    def __call__(self, X, tol=None):
+        """
+        Outputs at X [n, k]: emulated, except where the standard
+        deviation of any output exceeds tol (scalar or per output),
+        where the model is simulated and the run added to the design.
+        Returns the values, their standard deviations (0 where
+        simulated) and which rows were simulated.
+        """
+        mean, std = self.predict(X)
+        simulated = np.zeros(len(mean), dtype=bool)
+        if tol is not None:
+            simulated = (std > tol).any(1)
+            if simulated.any():
+                X = np.atleast_2d(X)[simulated]
+                Y = evaluate(self.simulate, X, self.processes, **self.kwargs)
+                self.gp.add(self._unit(X), Y)
+                mean[simulated], std[simulated] = Y, 0.
+        return mean, std, simulated
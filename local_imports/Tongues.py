@@ -0,0 +1,111 @@
+"""
+Adaptive maps of entrainment regions (Arnold tongues) over two
+parameters.
+
+evaluate(x, y, **kwargs) classifies one point, returning a dict with at
+least 'locked' (bool). The map starts from a coarse grid of cells and
+repeatedly splits only the cells whose corners disagree on 'locked',
+so the evaluations concentrate along the tongue boundaries. Each round
+of new points is evaluated in a process pool.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .Utilities import pool_map
+
+
+def _evaluate(task):
+    """ pool worker: evaluate(x, y, **kwargs) """
+    evaluate, x, y, kwargs = task
+    return evaluate(x, y, **kwargs)
+
+
+class TongueMap(object):
+    """
+    Map of evaluate over xlim x ylim, from an n0 x n0 grid of cells
+    refined max_level times near the boundaries. evaluate must be a
+    module-level function so it can be sent to the pool.
+    """
+
+    def __init__(self, evaluate, xlim, ylim, n0=8, max_level=3,
+                 processes=None, **kwargs):
+        self.evaluate = evaluate
+        self.xlim = xlim
+        self.ylim = ylim
+        self.n0 = n0
+        self.max_level = max_level
+        self.processes = processes
+        self.kwargs = kwargs
+        self.points = {}
+        self.cells = []
+
+    def _key(self, x, y): return (round(x, 10), round(y, 10))
+
+    def _run_points(self, points):
+        """ evaluate the points not already known, in parallel """
+        new = sorted(set(self._key(x, y) for x, y in points)
+                     - set(self.points))
+        tasks = [(self.evaluate, x, y, self.kwargs) for x, y in new]
+        for key, res in zip(new, pool_map(_evaluate, tasks,
+                                          self.processes)):
+            self.points[key] = res
+
+    def _corners(self, cell):
+        x0, x1, y0, y1 = cell
+        return [(x0, y0), (x1, y0), (x0, y1), (x1, y1)]
+
+    def _boundary(self, cell):
+        locked = [bool(self.points[self._key(*c)]['locked'])
+                  for c in self._corners(cell)]
+        return any(locked) and not all(locked)
+
+    def run(self):
+        """ evaluates the coarse grid, then refines boundary cells """
+        xs = np.linspace(self.xlim[0], self.xlim[1], self.n0 + 1)
+        ys = np.linspace(self.ylim[0], self.ylim[1], self.n0 + 1)
+        self.cells = [(xs[i], xs[i+1], ys[j], ys[j+1])
+                      for i in range(self.n0) for j in range(self.n0)]
+        self._run_points([(x, y) for x in xs for y in ys])
+
+        for level in range(self.max_level):
+            split = [c for c in self.cells if self._boundary(c)]
+            if not split: break
+            children = []
+            for x0, x1, y0, y1 in split:
+                xm, ym = (x0 + x1)/2, (y0 + y1)/2
+                children += [(x0, xm, y0, ym), (xm, x1, y0, ym),
+                             (x0, xm, ym, y1), (xm, x1, ym, y1)]
+            self._run_points([p for c in children for p in self._corners(c)])
+            split = set(split)
+            self.cells = [c for c in self.cells if c not in split] + children
+        return self
+
+    def as_arrays(self, key=None):
+        """ xs, ys and locked (or the result entry key) of every
+        evaluated point """
+        keys = sorted(self.points)
+        xs = np.array([k[0] for k in keys])
+        ys = np.array([k[1] for k in keys])
+        vals = np.array([self.points[k]['locked' if key is None else key]
+                         for k in keys])
+        return xs, ys, vals
+
+    def grid(self, nx=100, ny=100, key='locked'):
+        """ nearest evaluated point on a regular nx x ny grid, for
+        plotting. Returns xs, ys and values [ny, nx] """
+        px, py, vals = self.as_arrays(key)
+        gx = np.linspace(self.xlim[0], self.xlim[1], nx)
+        gy = np.linspace(self.ylim[0], self.ylim[1], ny)
+        sx = (px - self.xlim[0])/(self.xlim[1] - self.xlim[0])
+        sy = (py - self.ylim[0])/(self.ylim[1] - self.ylim[0])
+        X, Y = np.meshgrid((gx - self.xlim[0])/(self.xlim[1]-self.xlim[0]),
+                           (gy - self.ylim[0])/(self.ylim[1]-self.ylim[0]))
+        out = np.empty(X.shape, dtype=vals.dtype)
+        for i in range(ny):
+            d = (X[i][:, None] - sx)**2 + (Y[i][:, None] - sy)**2
+            out[i] = vals[np.argmin(d, axis=1)]
+        return gx, gy, out
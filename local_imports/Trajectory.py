@@ -0,0 +1,147 @@
+"""
+Dense trajectories: the solution kept at the solver's nodes with the
+vector field there, and evaluated anywhere by piecewise cubic Hermite
+interpolation. Peaks and threshold crossings are located on the
+interpolant itself, segment by segment, so they need no oversampled
+grid and no refitted splines.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class Trajectory(object):
+    """
+    Solution through nodes ts [n] with states ys [n, neq] and
+    derivatives dys [n, neq]. Evaluate with traj(t) for any t in
+    (ts[0], ts[-1]), scalar or array.
+    """
+
+    def __init__(self, ts, ys, dys, ylabels=None):
+        self.ts = np.asarray(ts, dtype=float)
+        self.ys = np.atleast_2d(ys)
+        self.dys = np.atleast_2d(dys)
+        self.ylabels = ylabels
+        self.t0, self.tf = self.ts[0], self.ts[-1]
+        self.neq = self.ys.shape[1]
+
+    def __len__(self): return len(self.ts)
+
+    def _state(self, state):
+        if isinstance(state, str): return self.ylabels.index(state)
+        return state
+
+    def _segments(self, t):
+        """ segment index, segment length and normalized position of
+        times t """
+        t = np.asarray(t, dtype=float)
+        i = np.clip(np.searchsorted(self.ts, t, side='right') - 1, 0,
+                    len(self.ts) - 2)
+        h = self.ts[i+1] - self.ts[i]
+        return i, h, (t - self.ts[i])/h
+
+    def _coefficients(self, state):
+        """ power-basis coefficients a + b s + c s^2 + d s^3 of each
+        segment, s in (0, 1), for one state """
+        j = self._state(state)
+        h = np.diff(self.ts)
+        y0, y1 = self.ys[:-1, j], self.ys[1:, j]
+        m0, m1 = h*self.dys[:-1, j], h*self.dys[1:, j]
+        return y0, m0, 3*(y1 - y0) - 2*m0 - m1, 2*(y0 - y1) + m0 + m1
+
+    def __call__(self, t, state=None):
+        """ states at times t, [len(t), neq] (or [len(t)] for one
+        state) """
+        i, h, s = self._segments(t)
+        h00 = (1 + 2*s)*(1 - s)**2
+        h10 = s*(1 - s)**2
+        h01 = s**2*(3 - 2*s)
+        h11 = s**2*(s - 1)
+        cols = slice(None) if state is None else self._state(state)
+        y0, y1 = self.ys[i][..., cols], self.ys[i+1][..., cols]
+        m0, m1 = self.dys[i][..., cols], self.dys[i+1][..., cols]
+        if state is None:
+            h00, h10, h01, h11, h = [x[..., None] for x in
+                                     (h00, h10, h01, h11, h)]
+        return h00*y0 + h*h10*m0 + h01*y1 + h*h11*m1
+
+    def sample(self, numsteps=1000, state=None):
+        """ ts, states on an even grid of numsteps points """
+        ts = np.linspace(self.t0, self.tf, numsteps)
+        return ts, self(ts, state)
+
+    def extrema(self, state=0, kind='max'):
+        """ times and values of the local maxima (or minima, kind='min')
+        of state, from the roots of the derivative of each segment's
+        cubic """
+        a, b, c, d = self._coefficients(state)
+        seg = np.arange(len(a))
+
+        # roots of b + 2c s + 3d s^2 in (0, 1]
+        roots, where = [], []
+        quad = np.abs(d) > 1E-14*(np.abs(b) + np.abs(c) + 1E-300)
+        disc = (2*c)**2 - 12*d*b
+        ok = quad & (disc >= 0)
+        sq = np.sqrt(np.where(ok, disc, 0))
+        for sign in (1, -1):
+            r = np.where(ok, (-2*c + sign*sq)/np.where(quad, 6*d, 1), np.nan)
+            roots.append(r); where.append(seg)
+        lin = ~quad & (c != 0)
+        roots.append(np.where(lin, -b/np.where(c != 0, 2*c, 1), np.nan))
+        where.append(seg)
+        roots, where = np.hstack(roots), np.hstack(where)
+
+        # a peak on a node rounds to just outside both of its segments:
+        # take it at the start of the later one
+        keep = (roots > -1E-9) & (roots <= 1 + 1E-9)
+        roots, where = np.clip(roots[keep], 0, 1), where[keep]
+        end = (roots == 1) & (where < len(a) - 1)
+        roots, where = np.where(end, 0, roots), where + end
+        curv = 2*c[where] + 6*d[where]*roots
+        keep = curv < 0 if kind == 'max' else curv > 0
+        roots, where = roots[keep], where[keep]
+
+        times = self.ts[where] + roots*np.diff(self.ts)[where]
+        order = np.argsort(times)
+        times = times[order]
+        # a peak exactly on a node is found from both of its segments
+        if len(times):
+            times = times[np.hstack([True, np.diff(times) > 1E-12])]
+        return times, self(times, state)
+
+    def peaks(self, state=0):
+        """ times and values of the local maxima of state """
+        return self.extrema(state, 'max')
+
+    def crossings(self, state, level, direction=0, iterations=60):
+        """
+        Times at which state crosses level: upward (direction=1),
+        downward (-1) or both (0). Each crossing is bracketed by the
+        nodes on either side and refined by bisection on the segment
+        cubic, so two crossings within one solver step are missed.
+        """
+        a, b, c, d = self._coefficients(state)
+        y = self.ys[:, self._state(state)] - level
+        up = (y[:-1] < 0) & (y[1:] >= 0)
+        down = (y[:-1] > 0) & (y[1:] <= 0)
+        cross = up if direction > 0 else down if direction < 0 else up|down
+        seg = np.nonzero(cross)[0]
+
+        a, b, c, d = a[seg] - level, b[seg], c[seg], d[seg]
+        sign0 = np.sign(a)
+        lo, hi = np.zeros(len(seg)), np.ones(len(seg))
+        for it in range(iterations):
+            mid = (lo + hi)/2
+            val = a + mid*(b + mid*(c + mid*d))
+            same = np.sign(val) == sign0
+            lo = np.where(same, mid, lo)
+            hi = np.where(same, hi, mid)
+
+        return self.ts[seg] + (lo + hi)/2*np.diff(self.ts)[seg]
+
+    def period(self, state=0):
+        """ mean interval between the peaks of state """
+        return np.mean(np.diff(self.peaks(state)[0]))
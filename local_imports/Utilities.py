@@ -8,15 +8,11 @@ jha
 #import modules
 from __future__ import division
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.interpolate import (splrep, splint, fitpack, splev,
                                UnivariateSpline, dfitpack,
                                InterpolatedUnivariateSpline)
-from matplotlib.colors import LinearSegmentedColormap
-import matplotlib.pyplot as plt
-from .ColorMapCreator import ColorMapCreator
 from time import time
-import pdb
+from multiprocessing import Pool
 
 def roots(data,times=None):
     """
@@ -33,6 +29,67 @@ def roots(data,times=None):
 
     return s.roots()
 
+def local_maxima(data, times=None):
+    """
+    Finds the local maxima of sampled data. Each sample maximum is refined
+    by fitting a parabola through it and its two neighbors, so the peak
+    times are accurate well below the sampling interval. Returns the
+    refined times and values of the peaks.
+    """
+
+    data = np.asarray(data)
+    if times is None:
+        #time intervals set to one
+        times = np.arange(len(data))
+    times = np.asarray(times)
+
+    # interior samples that are at least as large as both neighbors
+    ind = np.where((data[1:-1] > data[:-2]) & (data[1:-1] >= data[2:]))[0]+1
+
+    ym = data[ind-1]
+    y0 = data[ind]
+    yp = data[ind+1]
+    curv = ym - 2*y0 + yp
+    curv[curv == 0] = -np.inf # flat top, no refinement
+    delta = 0.5*(ym - yp)/curv
+
+    # local sample spacing, allows for uneven grids
+    dt = np.where(delta > 0, times[ind+1] - times[ind],
+                  times[ind] - times[ind-1])
+    tpeak = times[ind] + delta*dt
+    ypeak = y0 - 0.25*(ym - yp)*delta
+
+    return tpeak, ypeak
+
+def interp_rows(times, data, t):
+    """
+    Reads every column of data (shape [len(times), n]) at time(s) t by
+    local cubic Lagrange interpolation over the four surrounding samples.
+    All columns are handled at once, so this is far cheaper than fitting
+    a spline to each state. Returns shape [n] for scalar t, else
+    [len(t), n].
+    """
+
+    times = np.asarray(times)
+    data = np.asarray(data)
+    tt = np.atleast_1d(t)
+
+    # leftmost of the four stencil points, kept inside the data
+    i0 = np.clip(np.searchsorted(times, tt) - 2, 0, len(times)-4)
+    stencil = i0[:,None] + np.arange(4)[None,:]
+    ts = times[stencil]
+
+    # lagrange weights, shape [len(t), 4]
+    weights = np.ones(ts.shape)
+    for j in range(4):
+        for m in range(4):
+            if m != j:
+                weights[:,j] *= (tt - ts[:,m])/(ts[:,j] - ts[:,m])
+
+    out = np.einsum('ij,ij...->i...', weights, data[stencil])
+    if np.ndim(t) == 0: return out[0]
+    return out
+
 class laptimer:
     """
     Whenever you call it, it times laps.
@@ -52,6 +109,20 @@ class laptimer:
     def __repr__(self):
         return "%.3E"%self()
 
+def pool_map(worker, tasks, processes=None):
+    """
+    worker(task) for each task, over a pool of processes (serially if
+    processes is 1). worker must be a module-level function and the
+    tasks picklable.
+    """
+    if processes == 1: return [worker(task) for task in tasks]
+    pool = Pool(processes)
+    try:
+        return pool.map(worker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
 class spline:
     """ Periodic data interpolation object used by Collocation. Probably
     could stand an update """
@@ -103,6 +174,7 @@ def corrsort(mat):
 
 
 def bode(G,f=np.arange(.01,100,.01),desc=None,color=None):
+    import matplotlib.pyplot as plt # plotting only, kept out of imports
 
     jw = 2*np.pi*f*1j
     y = np.polyval(G.num, jw) / np.polyval(G.den, jw)
@@ -0,0 +1,5 @@
+"""
+Numerical modules for the models. None of them import matplotlib, so
+they load quickly in pool workers; plotting is in PlotOptions and
+ColorMapCreator, imported only by the figure scripts.
+"""
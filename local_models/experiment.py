@@ -0,0 +1,159 @@
+"""
+Experiment setup shared by the malaria model builders: the mouse
+genotype, signal and parasite constants of an experiment, and its light
+and feeding schedules as casadi or numpy functions of time. The single
+and population models, casadi and numpy, all build from here, so their
+experiments cannot drift apart.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+try:
+    import casadi as cs
+except ImportError:
+    cs = None
+
+# mouse periods (h)
+WT_period = 23.7
+FB_period = 25.7
+
+
+def setup(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
+          malaria_intrinsic, mouse_period=None, forcing=0.01,
+          brain_coupling=None, cycles=10, malaria_hill=None,
+          light_edits=None, feeding_edits=None):
+    """
+    Translates the experiment description into the model constants and
+    the light and feeding waveforms. Waveforms are (amplitude, time on,
+    cycle period, cycles[, offset]) square waves, starting at offset (0),
+    or (value, None, None, cycles) for a constant.
+
+    The remaining options override the experiment for parameter sweeps:
+    mouse_period replaces the genotype's period, forcing the light and
+    feeding amplitude (constant feeding is half of it), brain_coupling
+    the brain signal weight bs, cycles the number of forcing cycles and
+    malaria_hill the parasite Hill coefficient nm. light_edits and
+    feeding_edits are lists of (start, end, waveform) schedule edits:
+    from start to end (None for the rest of the run) the signal follows
+    waveform instead. Later edits take precedence. Pulses, schedule
+    shifts and feeding windows are built this way (see
+    malaria_perturbation).
+    """
+
+    period_override = mouse_period
+
+    # set up signaling in model
+    if mouse_signal=='food':
+        feed_signal=1
+        brain_signal = bs =0
+    elif mouse_signal=='brain':
+        brain_signal = bs = 1
+        feed_signal = 0
+
+    # set up oscillator in malaria
+    if malaria_intrinsic==True:
+        nm = 4
+    elif malaria_intrinsic==False:
+        nm = 2
+
+    # set up mouse genotype
+    if mouse_genotype=='WT':
+        n = 4
+        cryko = 1.
+        mouse_period = WT_period
+    elif mouse_genotype=='FB':
+        n = 4
+        cryko = 1.
+        mouse_period = FB_period
+    elif mouse_genotype=='YY':
+        n = 4
+        cryko = 0.
+        bs = 0 # since we are averaging we don't want to average in the brain signal if there is none!
+        mouse_period = WT_period
+
+    if period_override is not None: mouse_period = period_override
+    if brain_coupling is not None and bs: bs = brain_coupling
+    if malaria_hill is not None: nm = malaria_hill
+
+    # set up light schedule - 10 days
+    if light_schedule=='DD':
+        light = (0, None, None, cycles)
+    elif light_schedule=='LD':
+        light = (forcing, 12, 24, cycles)
+
+    # set up light schedule - 10 days
+    if mouse_feeding=='AdLib':
+        # if dd, mouse feeds on its own period
+        if light_schedule=='DD':
+            if mouse_genotype=="YY":
+                feeding = (forcing/2, None, None, cycles)
+            else:
+                feeding = (forcing, mouse_period/2, mouse_period, cycles)
+        # if ld, mouse feeds on light-dark period
+        elif light_schedule=='LD':
+            feeding = (forcing, 24/2, 24, cycles)
+
+    elif mouse_feeding=='SpreadOut':
+        assert light_schedule=='LD', "Light schedule must be LD for ultradian feeding."
+        feeding = (forcing/2, None, None, cycles)
+
+    return {'feed_signal' : feed_signal,
+            'bs'          : bs,
+            'nm'          : nm,
+            'n'           : n,
+            'cryko'       : cryko,
+            'mouse_period': mouse_period,
+            'light'       : light,
+            'feeding'     : feeding,
+            'light_edits'  : list(light_edits or []),
+            'feeding_edits': list(feeding_edits or [])}
+
+
+def forcing_cycles(tf, light_schedule, mouse_signal, mouse_feeding,
+                   mouse_genotype, malaria_intrinsic, mouse_period=None):
+    """ cycles option for a run to tf: enough cycles of the shortest
+    light or feeding period of the experiment (the mouse period or 24 h)
+    to cover tf, plus one """
+    waves = setup(light_schedule, mouse_signal, mouse_feeding,
+                  mouse_genotype, malaria_intrinsic, mouse_period)
+    periods = [w[2] for w in (waves['light'], waves['feeding'])
+               if w[2] is not None]
+    if not periods: return 1
+    return int(np.ceil(tf/min(periods))) + 1
+
+
+def square_wave_cs(t, amp, t1, t2, cycles=10, offset=0.):
+    """ casadi square wave: amp for t1 of every t2, for cycles cycles
+    from offset """
+    if t1 is None: return amp
+    return amp*sum([cs.heaviside(t-offset-t2*i)
+                    - cs.heaviside(t-offset-t1-t2*i)
+                    for i in range(cycles)])
+
+def square_wave_np(t, amp, t1, t2, cycles=10, offset=0.):
+    """ numpy square wave: amp for t1 of every t2, for cycles cycles
+    from offset """
+    t = np.asarray(t, dtype=float) - offset
+    if t1 is None: return amp*np.ones(t.shape)
+    return amp*((t >= 0) & (t < t2*cycles) & (np.mod(t, t2) < t1))
+
+def schedule_cs(t, wave, edits):
+    """ casadi waveform wave with the (start, end, waveform) edits """
+    out = square_wave_cs(t, *wave)
+    for start, end, edit in edits:
+        on = cs.heaviside(t-start)
+        if end is not None: on = on - cs.heaviside(t-end)
+        out = out + on*(square_wave_cs(t, *edit) - out)
+    return out
+
+def schedule_np(t, wave, edits):
+    """ numpy waveform wave with the (start, end, waveform) edits """
+    t = np.asarray(t, dtype=float)
+    out = square_wave_np(t, *wave)
+    for start, end, edit in edits:
+        on = (t >= start) if end is None else (t >= start) & (t < end)
+        out = np.where(on, square_wave_np(t, *edit), out)
+    return out
@@ -0,0 +1,152 @@
+"""
+Circle-map prediction of parasite entrainment in DD, as a fast screen
+in place of malaria_tongues.entrainment_cell.
+
+The free-running parasite is reduced to its phase as in
+malaria_phase_model, and the stroboscopic map over one mouse cycle is
+tabulated for every (mouse period, signal strength, parasite period) at
+once. The forcing is, per cycle of the mouse, starting at s = 0
+    food : strength for the first half of the cycle (feeding onset)
+    brain: (gonze_period/Ti)*(b/(1+b))*(g(B1(s)) - g(M4(phi))), b the
+           strength, with B1 the free-running host signal from an X1
+           peak
+The host cycle has the same shape in cycle time for any period, so it is
+simulated once. verify() checks a sample of the predictions against full
+simulations.
+
+    pred = predict_entrainment(np.linspace(20, 28, 200)[:, None],
+                               np.linspace(0, 0.02, 100))
+    pred['locked'].shape  # (200, 100)
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import LimitCycle as lc
+from local_imports import Entrainment as en
+from local_imports.CircleMap import CircleMap
+from local_imports.Utilities import pool_map
+from local_models import malaria_model as mm
+from local_models import malaria_phase_model as mph
+from local_models import malaria_tongues as mt
+
+_tables = {}
+
+
+def parasite_table(param=mm.param, res=1000):
+    """ PhaseTable of the free-running parasite, cached per process """
+    key = (tuple(param), res)
+    if key not in _tables: _tables[key] = mph.free_parasite(param, res)[1]
+    return _tables[key]
+
+def host_signal(param=mm.param, res=200, cycles=10):
+    """ B1 of the free-running WT host over one cycle from an X1 peak,
+    on res points of cycle time (0, 1) """
+    model = mm.malaria_model_numpy('DD', 'brain', 'AdLib', 'WT', True)[0]
+    osc = lc.Oscillator(model, param, y0=mm.y0in)
+    tf = cycles*mm.WT_period
+    ts, sol = osc.int_odes(tf, numsteps=int(20*tf) + 1)
+    phase = en.peak_phase(ts, sol[:, 0])[:, 0]
+    last = np.nanmax(phase)//(2*np.pi)
+    cycle = (phase >= 2*np.pi*(last - 1)) & (phase < 2*np.pi*last)
+    s = np.linspace(0, 1, res, endpoint=False)
+    return np.interp(s, phase[cycle]/(2*np.pi) - (last - 1),
+                     sol[cycle, 4], period=1)
+
+def circle_map(mouse_periods, strengths, parasite_periods=mm.malaria_period,
+               signal='food', res=128, steps=200, param=mm.param):
+    """
+    CircleMap over the broadcast of mouse_periods, strengths and
+    parasite_periods (flattened), and the broadcast shape.
+    """
+    mouse, strength, parasite = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in
+          (mouse_periods, strengths, parasite_periods)])
+    shape = mouse.shape
+    mouse, strength, parasite = [x.ravel() for x in
+                                 (mouse, strength, parasite)]
+
+    table = parasite_table(param)
+    omega = (2*np.pi/table.T)*mm.malaria_period/parasite
+
+    if signal == 'food':
+        amp = strength[:, None]
+        def drive(s, phi): return amp*(s < 0.5)
+    else:
+        vc, Kc, K = param[13], param[14], param[15]
+        def g(x): return vc*K*x/(Kc + K*x)
+        weight = (mm.gonze_period/parasite*strength/(1 + strength))[:, None]
+        g_b1 = g(host_signal(param))
+        g_m4 = g(table.lc[:, 3])
+        def drive(s, phi):
+            gB1 = np.interp(s, np.linspace(0, 1, len(g_b1), endpoint=False),
+                            g_b1, period=1)
+            return weight*(gB1 - table.interp(g_m4, phi))
+
+    cmap = CircleMap(table, omega, mouse, drive, 0, res, steps)
+    cmap.mouse_periods = mouse
+    return cmap, shape
+
+def predict_entrainment(mouse_periods, strengths,
+                        parasite_periods=mm.malaria_period, signal='food',
+                        res=128, steps=200, param=mm.param):
+    """
+    Predicted entrainment over the broadcast of the arguments: locked,
+    lag (h from the start of the mouse cycle to the parasite M1 peak),
+    multiplier (per-cycle contraction of phase errors) and rotation
+    (parasite cycles per mouse cycle), each of the broadcast shape.
+    """
+    cmap, shape = circle_map(mouse_periods, strengths, parasite_periods,
+                             signal, res, steps, param)
+    pred = cmap.predict()
+    table = cmap.table
+    peak = table.phis[np.argmax(table.lc[:, 0])]
+    pred['lag'] = np.mod(peak - pred['phase'], 2*np.pi)/(2*np.pi)*\
+        cmap.mouse_periods
+    return dict((k, v.reshape(shape)) for k, v in pred.items())
+
+def _simulate(task):
+    """ pool worker: full simulation of one condition """
+    mouse, strength, parasite, options = task
+    return mt.entrainment_cell(mouse, strength, parasite_period=parasite,
+                               **options)
+
+def verify(mouse_periods, strengths, parasite_periods=mm.malaria_period,
+           signal='food', sample=10, seed=None, processes=None,
+           **cell_options):
+    """
+    Predictions for all conditions and full simulations
+    (malaria_tongues.entrainment_cell, options cell_options) for a
+    random sample of them. Returns a dict with the flat indices of the
+    sample, the predicted and simulated locking and lags, and the
+    fraction of the sample where the locking agrees. Simulated lags run
+    from the mouse X1 peak. Predicted lags run from the start of the
+    mouse cycle, which is the X1 peak for brain but the feeding onset for
+    food, so predicted_lag is None for food.
+    """
+    pred = predict_entrainment(mouse_periods, strengths, parasite_periods,
+                               signal)
+    mouse, strength, parasite = [np.broadcast_to(x, pred['locked'].shape)
+                                 .ravel() for x in
+                                 (mouse_periods, strengths,
+                                  parasite_periods)]
+    index = np.sort(np.random.RandomState(seed).choice(
+        len(mouse), min(sample, len(mouse)), replace=False))
+
+    cell_options['signal'] = signal
+    tasks = [(mouse[i], strength[i], parasite[i], cell_options)
+             for i in index]
+    sims = pool_map(_simulate, tasks, processes)
+
+    predicted = pred['locked'].ravel()[index]
+    simulated = np.array([s['locked'] for s in sims])
+    return {'index'           : index,
+            'predicted'       : predicted,
+            'simulated'       : simulated,
+            'predicted_lag'   : (pred['lag'].ravel()[index]
+                                 if signal == 'brain' else None),
+            'simulated_lag'   : np.array([s['lag'] for s in sims]),
+            'agreement'       : np.mean(predicted == simulated)}
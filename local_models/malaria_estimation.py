@@ -0,0 +1,205 @@
+"""
+Fitting malaria_pop_model to host and parasite time series.
+
+Problem fits any subset of the kinetic parameters (plabels), the
+parasite period distribution (period_mean, period_sd) and the coupling
+strengths (forcing, brain_coupling) of one model structure in one
+experiment. The parasites are a quadrature population
+(mpm.quadrature_periods), and data are
+    data = {'ts'       : sample times (h, > 0),
+            'host'     : host state host_state (optional),
+            'parasite' : population mean of parasite_state (optional),
+            'host_sigma', 'parasite_sigma' : standard errors (optional)}
+in model units. Values are fitted in log space. The jacobian of the
+kinetic parameters comes from forward sensitivities; the others change
+the model itself and are differenced. fit_models fits Models 1-4 of
+run_population with many starts each over a process pool, and reuses
+built models within each worker.
+
+    res = fit_models(data, ('DD', 'AdLib', 'WT'), starts=16, processes=4)
+    res['Model 4']['values'], res['Model 4']['aic']
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import Estimation as es
+from local_models import experiment as ex
+from local_models import malaria_model as mm
+from local_models import malaria_pop_model as mpm
+
+plabels = ['v1', 'K1', 'v2', 'K2', 'k3', 'v4', 'K4', 'k5', 'v6', 'K6',
+           'k7', 'v8', 'K8', 'vc', 'Kc', 'K']
+structural = ['period_mean', 'period_sd', 'forcing', 'brain_coupling']
+
+# model type     signal   malaria intrinsic, as in run_population
+models = {"Model 1": ['food', False],
+          "Model 2": ['brain', False],
+          "Model 3": ['food', True],
+          "Model 4": ['brain', True]}
+
+_models = {}
+
+
+def _build(key):
+    """ population model for key, cached per process """
+    if key not in _models:
+        if len(_models) > 64: _models.clear()
+        (light, signal, feeding, geno, intrinsic, periods, forcing,
+         brain_coupling, cycles) = key
+        _models[key] = mpm.malaria_model_numpy(
+            light, signal, feeding, geno, intrinsic, periods=list(periods),
+            forcing=forcing, brain_coupling=brain_coupling,
+            cycles=cycles)[0]
+    return _models[key]
+
+
+class Problem(object):
+    """
+    Fit of the names in fit to data for the model structure
+    (mouse_signal, malaria_intrinsic) in experiment (light_schedule,
+    mouse_feeding, mouse_genotype). Other values are held at their
+    defaults. Fitted values are bounded within a factor of factor of
+    their starting values.
+    """
+
+    def __init__(self, data, fit, mouse_signal='food',
+                 malaria_intrinsic=True, experiment=('DD', 'AdLib', 'WT'),
+                 num_parasites=5, param=mm.param, forcing=0.01,
+                 brain_coupling=1., period_mean=mpm.period_mean,
+                 period_sd=mpm.period_sd, host_state=0, parasite_state=0,
+                 factor=2., abstol=1E-10, reltol=1E-8):
+
+        for name in fit:
+            if name not in plabels + structural:
+                raise ValueError("cannot fit " + str(name))
+        self.data = data
+        self.fit = list(fit)
+        self.signal = mouse_signal
+        self.intrinsic = malaria_intrinsic
+        self.experiment = tuple(experiment)
+        self.num_parasites = num_parasites
+        self.host_state = host_state
+        self.parasite_state = parasite_state
+        self.tolerances = (abstol, reltol)
+
+        self.values = dict(zip(plabels, param))
+        self.values.update(period_mean=period_mean, period_sd=period_sd,
+                           forcing=forcing, brain_coupling=brain_coupling)
+        self.x0 = np.log([self.values[name] for name in self.fit])
+        self.bounds = (self.x0 - np.log(factor), self.x0 + np.log(factor))
+
+        self.ts = np.asarray(data['ts'], dtype=float)
+        self.observed = [key for key in ('host', 'parasite')
+                         if data.get(key) is not None]
+        self.sigma = dict((key, data.get(key + '_sigma', 1.))
+                          for key in self.observed)
+        light, feeding, geno = self.experiment
+        self.cycles = ex.forcing_cycles(self.ts[-1], light, self.signal,
+                                        feeding, geno, self.intrinsic)
+
+    def __len__(self):
+        return len(self.ts)*len(self.observed)
+
+    def values_at(self, x):
+        """ all values, with the fitted ones at x """
+        values = dict(self.values)
+        values.update(zip(self.fit, np.exp(x)))
+        return values
+
+    def _solve(self, x, sensitivities=False):
+        """ readouts [len(observed), len(ts)] at x and, if asked, their
+        derivatives with respect to the fitted kinetic parameters """
+        v = self.values_at(x)
+        periods, weights = mpm.quadrature_periods(
+            self.num_parasites, v['period_mean'], v['period_sd'])
+        light, feeding, geno = self.experiment
+        model = _build((light, self.signal, feeding, geno, self.intrinsic,
+                        tuple(periods), v['forcing'], v['brain_coupling'],
+                        self.cycles))
+
+        readout = {'host'     : np.eye(model.neq)[self.host_state],
+                   'parasite' : mpm.mean_readout(self.num_parasites,
+                                                 weights,
+                                                 self.parasite_state)}
+        C = np.array([readout[key] for key in self.observed])
+        index = [plabels.index(n) for n in self.fit if n in plabels]
+        states, S = es.forward_sensitivities(
+            model, [v[n] for n in plabels],
+            mpm.population_y0(self.num_parasites), self.ts,
+            index if sensitivities else [], 0., *self.tolerances)
+        return C.dot(states.T), np.einsum('ij,tjk->itk', C, S)
+
+    def residuals(self, x):
+        """ weighted residuals of all observed series, concatenated """
+        out = self._solve(x)[0]
+        return np.hstack([(out[i] - self.data[key])/self.sigma[key]
+                          for i, key in enumerate(self.observed)])
+
+    def jacobian(self, x, step=1E-4):
+        """ d(residuals)/dx: kinetic parameters from the sensitivities
+        (chain rule through the log), the rest by forward differences """
+        out, dout = self._solve(x, True)
+        r = np.hstack([(out[i] - self.data[key])/self.sigma[key]
+                       for i, key in enumerate(self.observed)])
+        sigma = np.hstack([self.sigma[key]*np.ones(len(self.ts))
+                           for key in self.observed])
+        J = np.empty((len(r), len(x)))
+        values = np.exp(x)
+        k = 0
+        for j, name in enumerate(self.fit):
+            if name in plabels:
+                J[:, j] = dout[:, :, k].ravel()*values[j]/sigma
+                k += 1
+            else:
+                dx = np.zeros(len(x)); dx[j] = step
+                J[:, j] = (self.residuals(x + dx) - r)/step
+        return J
+
+    def starts(self, num, seed=None):
+        """ x0 and num - 1 Latin hypercube points within the bounds """
+        lo, hi = self.bounds
+        U = es.latin_hypercube(num - 1, len(self.x0), seed)
+        return np.vstack([self.x0, lo + U*(hi - lo)])
+
+
+def default_fit(mouse_signal, malaria_intrinsic):
+    """ the coupling constants, the strength of the signal and, for
+    intrinsic parasites, their mean period """
+    fit = ['vc', 'Kc', 'K']
+    fit += ['forcing' if mouse_signal == 'food' else 'brain_coupling']
+    if malaria_intrinsic: fit += ['period_mean']
+    return fit
+
+def fit_model(data, mouse_signal, malaria_intrinsic,
+              experiment=('DD', 'AdLib', 'WT'), fit=None, starts=16,
+              processes=None, seed=None, problem_options=None, **options):
+    """
+    Multi-start fit of one model structure. Returns a dict with the
+    problem, all results sorted by cost, the best fitted values, its
+    cost and an AIC for comparing structures.
+    """
+    if fit is None: fit = default_fit(mouse_signal, malaria_intrinsic)
+    if problem_options is None: problem_options = {}
+    problem = Problem(data, fit, mouse_signal, malaria_intrinsic,
+                      experiment, **problem_options)
+    results = es.multistart(problem, problem.starts(starts, seed),
+                            processes, **options)
+    best = results[0]
+    n = len(problem)
+    return {'problem' : problem,
+            'results' : results,
+            'values'  : dict(zip(fit, np.exp(best['x']))),
+            'cost'    : best['cost'],
+            'aic'     : n*np.log(2*best['cost']/n) + 2*len(fit)}
+
+def fit_models(data, experiment=('DD', 'AdLib', 'WT'), names=None,
+               **options):
+    """ fit_model (options) for each of Models 1-4 (or names) """
+    if names is None: names = sorted(models)
+    return dict((name, fit_model(data, models[name][0], models[name][1],
+                                 experiment, **options))
+                for name in names)
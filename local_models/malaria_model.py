@@ -38,7 +38,14 @@ from __future__ import division
 
 # python packages
 import numpy as np
-import casadi as cs
+try:
+    import casadi as cs
+except ImportError:
+    cs = None
+
+from local_imports.Backends import NumpyModel
+from local_models import experiment as ex
+from local_models.experiment import WT_period, FB_period
 
 modelversion = 'malaria_model'
 
@@ -56,11 +63,9 @@ y0in = np.array([ 0.05069219,  0.10174506,  2.28099242, 0.01522458,
 # periods so as to get the time right
 gonze_period = 30.27
 malaria_period = 24.2
-WT_period = 23.7
-FB_period = 25.7
 
 
-def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,              malaria_intrinsic):
+def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,              malaria_intrinsic, **options):
     """
     Malaria model of mouse-parasite circadian interation.
     light_schedule = ('DD', 'LD')
@@ -68,94 +73,27 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
     mouse_feeding = ('AdLib', 'SpreadOut')
     mouse_genotype = ('WT', 'FB', 'YY')
     malaria_intrinsic = (True, False)
+    options = mouse_period, forcing, brain_coupling, cycles, malaria_hill
+              overrides (see experiment.setup)
 
     The setup of the experiment is handled within this model.
     """
 
-    # set up signaling in model
-    if mouse_signal=='food':
-        feed_signal=1
-        brain_signal = bs =0
-    elif mouse_signal=='brain':
-        brain_signal = bs = 1
-        feed_signal = 0
-
-    # set up oscillator in malaria
-    if malaria_intrinsic==True:
-        nm = 4
-    elif malaria_intrinsic==False:
-        nm = 2
-
-    # set up mouse genotype
-    if mouse_genotype=='WT':
-        n = 4
-        cryko = 1.
-        mouse_period = WT_period
-    elif mouse_genotype=='FB':
-        n = 4
-        cryko = 1.
-        mouse_period = FB_period
-    elif mouse_genotype=='YY':
-        n = 4
-        cryko = 0.
-        bs = 0 # since we are averaging we don't want to average in the brain signal if there is none!
-        mouse_period = WT_period
+    setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, malaria_intrinsic, **options)
+    feed_signal = setup['feed_signal']
+    bs = setup['bs']
+    nm = setup['nm']
+    n = setup['n']
+    cryko = setup['cryko']
+    mouse_period = setup['mouse_period']
 
     # Time
     t = cs.SX.sym('t')
     
-    # set up light schedule - 10 days
-    if light_schedule=='DD':
-        L = 0
-    elif light_schedule=='LD':
-        L = 0.01*((cs.heaviside(t) - cs.heaviside(t-12) + \
-            cs.heaviside(t-24) - cs.heaviside(t-12-24) + \
-            cs.heaviside(t-48) - cs.heaviside(t-12-48) + \
-            cs.heaviside(t-72) - cs.heaviside(t-12-72) + \
-            cs.heaviside(t-96) - cs.heaviside(t-12-96) + \
-            cs.heaviside(t-120) - cs.heaviside(t-12-120) + \
-            cs.heaviside(t-144) - cs.heaviside(t-12-144) + \
-            cs.heaviside(t-168) - cs.heaviside(t-12-168) + \
-            cs.heaviside(t-192) - cs.heaviside(t-12-192) + \
-            cs.heaviside(t-216) - cs.heaviside(t-12-216)))
-
-    # set up light schedule - 10 days
-    if mouse_feeding=='AdLib':
-        # if dd, mouse feeds on its own period
-        if light_schedule=='DD':
-            if mouse_genotype=="YY":
-                F = 0.005
-            else:
-                t1 = mouse_period/2
-                t2 = mouse_period
-                F = 0.01*((cs.heaviside(t) - cs.heaviside(t-t1) + \
-                    cs.heaviside(t-t2) - cs.heaviside(t-t1-t2) + \
-                    cs.heaviside(t-t2*2) - cs.heaviside(t-t1-t2*2) + \
-                    cs.heaviside(t-t2*3) - cs.heaviside(t-t1-t2*3) + \
-                    cs.heaviside(t-t2*4) - cs.heaviside(t-t1-t2*4) + \
-                    cs.heaviside(t-t2*5) - cs.heaviside(t-t1-t2*5) + \
-                    cs.heaviside(t-t2*6) - cs.heaviside(t-t1-t2*6) + \
-                    cs.heaviside(t-t2*7) - cs.heaviside(t-t1-t2*7) + \
-                    cs.heaviside(t-t2*8) - cs.heaviside(t-t1-t2*8) + \
-                    cs.heaviside(t-t2*9) - cs.heaviside(t-t1-t2*9)))
-        # if ld, mouse feeds on light-dark period
-        elif light_schedule=='LD':
-            t1 = 24/2
-            t2 = 24
-            F = 0.01*(cs.heaviside(t) - cs.heaviside(t-t1) + \
-                cs.heaviside(t-t2) - cs.heaviside(t-t1-t2) + \
-                cs.heaviside(t-t2*2) - cs.heaviside(t-t1-t2*2) + \
-                cs.heaviside(t-t2*3) - cs.heaviside(t-t1-t2*3) + \
-                cs.heaviside(t-t2*4) - cs.heaviside(t-t1-t2*4) + \
-                cs.heaviside(t-t2*5) - cs.heaviside(t-t1-t2*5) + \
-                cs.heaviside(t-t2*6) - cs.heaviside(t-t1-t2*6) + \
-                cs.heaviside(t-t2*7) - cs.heaviside(t-t1-t2*7) + \
-                cs.heaviside(t-t2*8) - cs.heaviside(t-t1-t2*8) + \
-                cs.heaviside(t-t2*9) - cs.heaviside(t-t1-t2*9))
-
-    elif mouse_feeding=='SpreadOut':
-        assert light_schedule=='LD', "Light schedule must be LD for ultradian feeding."
-        F = 0.005
+    # light and feeding schedules
+    L = ex.schedule_cs(t, setup['light'], setup['light_edits'])
+    F = ex.schedule_cs(t, setup['feeding'], setup['feeding_edits'])
 
 
     #############################################################
@@ -232,6 +170,134 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
 
     return fn, siso_cs_to_np(t, L), siso_cs_to_np(t, F)
 
+def malaria_model_numpy(light_schedule, mouse_signal, mouse_feeding,
+                        mouse_genotype, malaria_intrinsic, **options):
+    """
+    Vectorized numpy version of malaria_model for the scipy solver
+    backend, with the same arguments. The jacobian is left to complex-step
+    differentiation, which is cheap at this size. Returns a NumpyModel and
+    numpy light and feeding functions of time.
+    """
+
+    setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, malaria_intrinsic, **options)
+    fs = setup['feed_signal']
+    bs = setup['bs']
+    nm = setup['nm']
+    n = setup['n']
+    cryko = setup['cryko']
+    sm = gonze_period/setup['mouse_period']
+    sp_ = gonze_period/malaria_period
+
+    def L(t): return ex.schedule_np(t, setup['light'],
+                                    setup['light_edits'])
+    def F(t): return ex.schedule_np(t, setup['feeding'],
+                                    setup['feeding_edits'])
+
+    def ode(t, y, p):
+        v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K = p
+        X1, X2, X3, X4, B1, M1, M2, M3, M4 = y
+
+        # mouse mRNA, protein, TF, internal signal
+        dX1 = sm*(cryko*v1*K1**n/(K1**n + X3**n) - v2*X1/(K2+X1)
+                  + vc*K*X4/(Kc + K*X4)) + L(t)
+        dX2 = sm*(k3*X1 - v4*X2/(K4+X2))
+        dX3 = sm*(k5*X2 - v6*X3/(K6+X3))
+        dX4 = sm*(k7*X1 - v8*B1/(K8+X4))
+        # mouse signal from brain to parasite
+        dB1 = sm*(k7*X1 - v8*B1/(K8+B1))
+
+        # parasite states 1, 2, 3, 4 (same as mouse 1-4)
+        dM1 = sp_*(v1*K1**nm/(K1**nm + M3**nm) - v2*M1/(K2+M1)
+                   + (1/(1+bs))*vc*K*M4/(Kc + K*M4)
+                   + (bs/(1+bs))*vc*K*B1/(Kc + K*B1)) + fs*F(t)
+        dM2 = sp_*(k3*M1 - v4*M2/(K4+M2))
+        dM3 = sp_*(k5*M2 - v6*M3/(K6+M3))
+        dM4 = sp_*(k7*M1 - v8*M4/(K8+M4))
+
+        return np.array([dX1, dX2, dX3, dX4, dB1, dM1, dM2, dM3, dM4])
+
+    ylabels = ['X1', 'X2', 'X3', 'X4', 'B1', 'M1', 'M2', 'M3', 'M4']
+    plabels = ['v1', 'K1', 'v2', 'K2', 'k3', 'v4', 'K4', 'k5', 'v6', 'K6',
+               'k7', 'v8', 'K8', 'vc', 'Kc', 'K']
+
+    model = NumpyModel(ode, ylabels, plabels, name="malaria_model")
+
+    return model, L, F
+
+def parasite_model(period=malaria_period):
+    """
+    Free-running intrinsic parasite (nm = 4) with no mouse input: states
+    M1-M4 of malaria_model on their own, with the parasite's own signal
+    as the only coupling. Its limit cycle and phase response curve are
+    the basis of the phase-reduced population model.
+    """
+
+    nm = 4
+    t = cs.SX.sym('t')
+
+    M1 = cs.SX.sym('M1')
+    M2 = cs.SX.sym('M2')
+    M3 = cs.SX.sym('M3')
+    M4 = cs.SX.sym('M4')
+    state_set = cs.vertcat([M1, M2, M3, M4])
+
+    v1  = cs.SX.sym('v1')
+    K1  = cs.SX.sym('K1')
+    v2  = cs.SX.sym('v2')
+    K2  = cs.SX.sym('K2')
+    k3  = cs.SX.sym('k3')
+    v4  = cs.SX.sym('v4')
+    K4  = cs.SX.sym('K4')
+    k5  = cs.SX.sym('k5')
+    v6  = cs.SX.sym('v6')
+    K6  = cs.SX.sym('K6')
+    k7  = cs.SX.sym('k7')
+    v8  = cs.SX.sym('v8')
+    K8  = cs.SX.sym('K8')
+    vc  = cs.SX.sym('vc')
+    Kc  = cs.SX.sym('Kc')
+    K   = cs.SX.sym('K')
+
+    param_set = cs.vertcat([v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K])
+
+    ode = [[]]*4
+    ode[0] = gonze_period/period*(v1*K1**nm/(K1**nm + M3**nm) \
+             - v2*(M1)/(K2+M1) + vc*K*((M4))/(Kc +K*(M4)))
+    ode[1] = gonze_period/period*(k3*(M1) - v4*M2/(K4+M2))
+    ode[2] = gonze_period/period*(k5*M2 - v6*M3/(K6+M3))
+    ode[3] = gonze_period/period*(k7*(M1) - v8*M4/(K8+M4))
+    ode = cs.vertcat(ode)
+
+    fn = cs.SXFunction(cs.daeIn(t=t,x=state_set,p=param_set),
+            cs.daeOut(ode=ode))
+
+    fn.setOption("name","parasite_model")
+
+    return fn
+
+def parasite_model_numpy(period=malaria_period):
+    """ numpy version of parasite_model, for the scipy backend """
+
+    nm = 4
+    sp_ = gonze_period/period
+
+    def ode(t, y, p):
+        v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K = p
+        M1, M2, M3, M4 = y
+        return np.array([
+            sp_*(v1*K1**nm/(K1**nm + M3**nm) - v2*M1/(K2+M1)
+                 + vc*K*M4/(Kc + K*M4)),
+            sp_*(k3*M1 - v4*M2/(K4+M2)),
+            sp_*(k5*M2 - v6*M3/(K6+M3)),
+            sp_*(k7*M1 - v8*M4/(K8+M4))])
+
+    ylabels = ['M1', 'M2', 'M3', 'M4']
+    plabels = ['v1', 'K1', 'v2', 'K2', 'k3', 'v4', 'K4', 'k5', 'v6', 'K6',
+               'k7', 'v8', 'K8', 'vc', 'Kc', 'K']
+
+    return NumpyModel(ode, ylabels, plabels, name="parasite_model")
+
 def siso_cs_to_np(cs_in, cs_out):
     """
     Takes SISO casadi SXFunction and makes a function out of it that works like a numpy function. Input must be SX('t')
@@ -0,0 +1,91 @@
+"""
+Posterior probabilities of Models 1-4 (food or brain signal, intrinsic
+or just-in-time parasites) given host and parasite time series, by
+ABC-SMC.
+
+Each model is simulated through malaria_estimation.Problem, with a
+uniform prior on its default fitted values (the coupling constants, the
+signal strength and, for intrinsic parasites, the mean period) within
+a factor of factor of their defaults, in log space. Simulations are
+reduced to summary statistics in the workers, so only the summaries
+return to the main process: for each series over the second half of
+the record, the mean and the cosine and sine components at period
+(24 h), i.e. the amplitude and phase of the daily rhythm.
+
+    data = {'ts' : ts, 'host' : X1, 'parasite' : mean_M1}
+    res = select_models(data, particles=200, processes=8)
+    res['probabilities']   # {'Model 1' : ..., ...}
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import ABC
+from local_models import malaria_estimation as me
+
+
+def summaries(ts, series, period=24.):
+    """ mean, cosine and sine components at period of each row of series
+    [n, len(ts)], over the second half of ts, [n*3] """
+    late = ts >= (ts[0] + ts[-1])/2
+    t, y = ts[late], np.atleast_2d(series)[:, late]
+    w = 2*np.pi*t/period
+    n = late.sum()
+    return np.hstack([[s.sum()/n, 2*s.dot(np.cos(w))/n,
+                       2*s.dot(np.sin(w))/n] for s in y])
+
+
+class Simulator(object):
+    """ summaries of model m (index into names) at log values theta """
+
+    def __init__(self, data, names, experiment, factor=2.,
+                 problem_options=None):
+        if problem_options is None: problem_options = {}
+        self.names = names
+        self.problems = []
+        for name in names:
+            signal, intrinsic = me.models[name]
+            self.problems.append(me.Problem(
+                data, me.default_fit(signal, intrinsic), signal, intrinsic,
+                experiment, factor=factor, **problem_options))
+
+    def __call__(self, m, theta):
+        problem = self.problems[m]
+        try: out = problem._solve(theta)[0]
+        except RuntimeError: return np.nan*np.ones(3*len(problem.observed))
+        return summaries(problem.ts, out)
+
+
+def select_models(data, experiment=('DD', 'AdLib', 'WT'), names=None,
+                  particles=200, generations=5, quantile=0.5,
+                  budget=np.inf, factor=2., processes=None, seed=None,
+                  problem_options=None):
+    """
+    ABC-SMC posterior probabilities of names (Models 1-4 by default)
+    for data. Distances scale each summary by the spread of the daily
+    rhythm of its series in the data. Returns a dict with the
+    probabilities (None if the budget did not complete a generation),
+    the ABC object (all generations) and the number of simulations
+    spent.
+    """
+    if names is None: names = sorted(me.models)
+    simulator = Simulator(data, names, experiment, factor, problem_options)
+    problem = simulator.problems[0]
+    observed = summaries(problem.ts, [data[key] for key in
+                                      problem.observed])
+    scale = np.repeat([max(np.hypot(*observed[3*i+1:3*i+3]), 1E-12)
+                       for i in range(len(problem.observed))], 3)
+
+    bounds = [np.array(p.bounds).T for p in simulator.problems]
+    abc = ABC.ABCSMC(simulator, bounds, observed,
+                     ABC.scaled_distance(scale), particles,
+                     processes=processes, seed=seed)
+    probabilities = abc.run(generations, quantile=quantile, budget=budget)
+    if probabilities is not None:
+        probabilities = dict(zip(names, probabilities))
+    return {'probabilities' : probabilities,
+            'abc'           : abc,
+            'simulations'   : abc.simulations}
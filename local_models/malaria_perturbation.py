@@ -0,0 +1,163 @@
+"""
+Perturbation experiments on the population model: light pulses, shifts
+of the light-dark and feeding schedules, and restricted feeding windows,
+each over a grid of timings.
+
+Perturbations are schedule edits (see experiment.setup), so every
+variant is the same experiment with different light_edits and
+feeding_edits options. run_perturbations integrates the unperturbed
+experiment once, and continues each variant from the unperturbed state
+at its onset (the shared pre-pulse trajectory) in a pool of processes.
+Workers return only the host X1 and parasite mean M1 series. From
+those, the phase shift of host and parasites relative to the
+unperturbed run and the time they take to resynchronize are found for
+all variants at once.
+
+    experiment = ('DD', 'brain', 'AdLib', 'WT', True)
+    pulses = [light_pulse(t) for t in np.arange(120, 144, 2.)]
+    res = run_perturbations(experiment, pulses, tf=336., processes=8)
+    res['host_shift'], res['parasite_shift']     # h, advances > 0
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import Entrainment as en
+from local_imports.Simulation import Experiment, Snapshot
+from local_imports.Utilities import pool_map
+from local_models import experiment as ex
+from local_models import malaria_pop_model as mpm
+
+
+def light_pulse(onset, duration=1., strength=0.01):
+    """ light at strength from onset for duration (h) """
+    return {'light_edits' : [(onset, onset + duration,
+                              (strength, None, None, 1))]}
+
+def _cycles(tf, start, period):
+    """ cycles of period from start that cover tf """
+    return max(int(np.ceil((tf - start)/period)) + 1, 1)
+
+def schedule_shift(experiment, onset, shift, signals=('light', 'feeding'),
+                   tf=240., **options):
+    """ the periodic light and/or feeding schedules of experiment delayed
+    by shift (h; negative to advance) from onset on, for a run to tf.
+    options are the builder options of the experiment """
+    setup = ex.setup(*experiment, **options)
+    edits = {}
+    for signal in signals:
+        amp, length, period = setup[signal][:3]
+        if length is None: continue     # constant: nothing to shift
+        offset = setup[signal][4] if len(setup[signal]) > 4 else 0.
+        start = offset + shift
+        edits[signal + '_edits'] = [(onset, None,
+                                     (amp, length, period,
+                                      _cycles(tf, start, period), start))]
+    return edits
+
+def feeding_window(onset, start, length, strength=0.01, period=24.,
+                   tf=240.):
+    """ feeding at strength only from start to start+length (h) of every
+    period, from onset on, for a run to tf """
+    return {'feeding_edits' : [(onset, None,
+                                (strength, length, period,
+                                 _cycles(tf, start, period), start))]}
+
+def onset_of(perturbation):
+    """ earliest start of the edits of perturbation """
+    return min(start for key in ('light_edits', 'feeding_edits')
+               for start, end, wave in perturbation.get(key, []))
+
+
+def _integrate(osc, y0, ts):
+    return osc.backend.integrate(y0, osc.param, ts,
+                                 osc.intoptions['int_abstol'],
+                                 osc.intoptions['int_reltol'],
+                                 osc.intoptions['int_maxstepcount'])
+
+def _readouts(sol, weights):
+    """ host X1 and parasite mean M1, [len(sol), 2] """
+    return np.column_stack([sol[:, 0], mpm.population_mean(sol, weights)])
+
+def _continue(task):
+    """ pool worker: readouts of a variant from the snapshot to ts[-1] """
+    experiment, snapshot, ts, weights = task
+    osc = experiment.oscillator(snapshot.y)
+    return _readouts(_integrate(osc, snapshot.y, ts), weights)
+
+
+def run_perturbations(experiment, perturbations, tf=240., dt=0.25,
+                      num_parasites=10, param=mpm.param, y0=None, tol=0.1,
+                      processes=None, builder=mpm.malaria_model_numpy,
+                      **options):
+    """
+    Runs experiment (light_schedule, mouse_signal, mouse_feeding,
+    mouse_genotype, malaria_intrinsic) unperturbed and with each of the
+    perturbations (dicts of schedule edits) from 0 to tf, with
+    num_parasites quadrature parasites and output every dt (and at each
+    onset). options go to the builder; the forcing cycles cover tf unless
+    cycles is given. Returns a dict with
+        ts, onsets             output times, onset of each perturbation
+        host, parasite         X1 and mean M1 [len(ts), K], unperturbed
+                               before each onset
+        base_host, base_parasite   the unperturbed series
+        host_shift, parasite_shift phase shift at tf relative to the
+                               unperturbed run (h, advances positive)
+        host_resync, parasite_resync   time from onset until the phase
+                               difference to the unperturbed run changes
+                               by less than tol (rad) per period (h, nan
+                               if it does not settle)
+    """
+    periods, weights = mpm.quadrature_periods(num_parasites)
+    if y0 is None: y0 = mpm.population_y0(num_parasites)
+    options = dict(options, periods=list(periods))
+    options.setdefault('cycles', ex.forcing_cycles(
+        tf, *experiment, mouse_period=options.get('mouse_period')))
+    onsets = np.array([onset_of(p) for p in perturbations], dtype=float)
+    ts = np.union1d(np.arange(0, tf + dt/2, dt), onsets)
+
+    # shared unperturbed run
+    base = Experiment(builder, experiment, options, param)
+    base_sol = _integrate(base.oscillator(y0), y0, ts)
+    base_out = _readouts(base_sol, weights)
+
+    tasks = []
+    for t, perturbation in zip(onsets, perturbations):
+        i = np.searchsorted(ts, t)
+        variant = Experiment(builder, experiment,
+                             dict(options, **perturbation), param)
+        tasks.append((variant, Snapshot(t, base_sol[i], variant), ts[i:],
+                      weights))
+
+    out = np.repeat(base_out[:, :, None], len(perturbations), axis=2)
+    for k, variant in enumerate(pool_map(_continue, tasks, processes)):
+        out[len(ts) - len(variant):, :, k] = variant
+
+    res = {'ts' : ts, 'onsets' : onsets,
+           'host' : out[:, 0], 'parasite' : out[:, 1],
+           'base_host' : base_out[:, 0], 'base_parasite' : base_out[:, 1]}
+    for name in ['host', 'parasite']:
+        shift, resync = phase_shifts(ts, res[name], res['base_' + name],
+                                     onsets, tol)
+        res[name + '_shift'] = shift
+        res[name + '_resync'] = resync
+    return res
+
+def phase_shifts(ts, series, base, onsets, tol=0.1):
+    """
+    Phase shift at the end of the record of each column of series
+    [T, K] relative to base [T] (h, advances positive, at the period of
+    base), and the time from each onset until the phase difference
+    settles (h, see Entrainment.entrainment_time).
+    """
+    base_phase = en.peak_phase(ts, base)
+    diff = en.phase_lag(en.peak_phase(ts, series), base_phase)
+
+    rows = np.isfinite(base_phase[:, 0])
+    period = 2*np.pi/np.polyfit(ts[rows], base_phase[rows, 0], 1)[0]
+    shift = en.last_finite(diff)*period/(2*np.pi)
+    resync = en.entrainment_time(ts, diff, period, tol) - onsets
+    return shift, np.maximum(resync, 0)
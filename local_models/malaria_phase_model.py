@@ -0,0 +1,195 @@
+"""
+Phase-reduced version of malaria_pop_model.
+
+Each intrinsic parasite (nm = 4) is represented by one phase on the limit
+cycle of the free-running parasite (malaria_model.parasite_model), driven
+through its M1 phase response curve by the host. The host does not see
+the parasites, so its trajectory is integrated once with the 9-state
+malaria_model and shared by the whole population. For a parasite of
+intrinsic period Ti the perturbation to dM1/dt, relative to the
+free-running parasite, is
+    food : F(t)
+    brain: (gonze_period/Ti)*(bs/(1+bs))*(g(B1(t)) - g(M4(phi)))
+where g(x) = vc*K*x/(Kc + K*x) is the coupling term. Concentrations are
+reconstructed from the tabulated limit cycle on demand.
+
+The reduction assumes the forcing is weak relative to the attraction of
+the limit cycle; validate() compares it against the full model for a
+sample of the population. Brain coupling reduces well. Feeding adds up
+to a tenth of the M1 range each cycle, so the amplitude response it
+drives is lost and the reduced phases lag by a few hours.
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import LimitCycle as lc
+from local_imports import PhaseReduction as pr
+from local_models import experiment as ex
+from local_models import malaria_model as mm
+from local_models import malaria_pop_model as mpm
+
+
+def free_parasite(param=mm.param, res=1000):
+    """ Oscillator and PhaseTable of the free-running parasite. It is
+    started from the parasite block of y0in, since far from the cycle M1
+    production can outrun its saturated degradation """
+    parasite = lc.Oscillator(mm.parasite_model_numpy(), param,
+                             y0=mm.y0in[5:9], period_guess=mm.malaria_period)
+    parasite.calc_y0(25*mm.malaria_period, adaptive=True)
+    parasite.find_prc()
+    return parasite, pr.PhaseTable(parasite, res)
+
+
+class PhaseReducedPopulation(object):
+    """
+    Population of parasites with intrinsic periods periods, for the
+    experiment (light_schedule, mouse_signal, mouse_feeding,
+    mouse_genotype) of malaria_pop_model. Parasites must be intrinsic
+    oscillators: just-in-time parasites have no limit cycle to reduce.
+    """
+
+    def __init__(self, light_schedule, mouse_signal, mouse_feeding,
+                 mouse_genotype, periods, param=mm.param, res=1000):
+
+        self.experiment = (light_schedule, mouse_signal, mouse_feeding,
+                           mouse_genotype)
+        self.periods = np.asarray(periods, dtype=float)
+        self.param = param
+        self.setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, True)
+
+        self.parasite, self.table = free_parasite(param, res)
+
+        # parasite i runs at gonze_period/Ti instead of
+        # gonze_period/malaria_period
+        self.scale = mm.gonze_period/self.periods
+        self.omega = (2*np.pi/self.table.T)*mm.malaria_period/self.periods
+
+        # host model, also gives the feeding signal
+        self.host_model, self.L, self.F = mm.malaria_model_numpy(
+            *self.experiment + (True,))
+
+    def __len__(self): return len(self.periods)
+
+    def _coupling(self, x):
+        vc, Kc, K = self.param[13], self.param[14], self.param[15]
+        return vc*K*x/(Kc + K*x)
+
+    def host_trajectory(self, tf, dt):
+        """ host states X1-X4, B1 on a grid of spacing dt/2 covering
+        (0, tf), so every RK4 stage time is a grid point """
+        host = lc.Oscillator(self.host_model, self.param, y0=mm.y0in)
+        numsteps = int(np.ceil(2*tf/dt)) + 1
+        ts, sol = host.int_odes(tf, numsteps=numsteps)
+        return ts, sol[:, :5]
+
+    def initial_phases(self, y0=None):
+        """ phases of the parasite blocks of a population initial
+        condition (mm.y0in for every parasite by default) """
+        if y0 is None: y0 = mm.y0in[5:9]
+        y0 = np.atleast_2d(y0)
+        if len(y0) == 1:
+            return self.table.nearest_phase(y0[0])*np.ones(len(self))
+        return np.array([self.table.nearest_phase(y) for y in y0])
+
+    def _integrate(self, tf, dt, save_every, phi0, index, dtype):
+        """ phase integration for the parasites in index (all if None) """
+
+        omega, scale = self.omega, self.scale
+        if index is not None: omega, scale = omega[index], scale[index]
+        if phi0 is None: phi0 = self.initial_phases()[:len(omega)]
+
+        host_ts, host = self.host_trajectory(tf, dt)
+        B1 = host[:, 4]
+        fs = self.setup['feed_signal']
+        bs = self.setup['bs']
+        F = self.F
+        table = self.table
+
+        if bs: brain = scale*(bs/(1 + bs))
+        prc_m1 = table.prc[:, 0]
+        g_m4 = self._coupling(table.lc[:, 3])
+
+        def dphidt(t, phi):
+            where = table.bracket(phi)
+            u = fs*F(t)
+            if bs:
+                gB1 = self._coupling(np.interp(t, host_ts, B1))
+                u = u + brain*(gB1 - table.interp(g_m4, phi, where))
+            return omega + table.interp(prc_m1, phi, where)*u
+
+        ts, phases = pr.integrate_phases(dphidt, phi0, tf, dt, save_every,
+                                         dtype=dtype)
+        return ts, phases, host_ts, host
+
+    def simulate(self, tf, dt=0.1, save_every=10, phi0=None,
+                 dtype=np.float64):
+        """
+        Integrates the parasite phases to tf, saving every save_every
+        steps of size dt. Sets and returns ts and phases
+        [len(ts), num_parasites]. dtype=np.float32 halves the memory of
+        the stored phases for very large populations.
+        """
+
+        self.dt = dt
+        self.ts, self.phases, self.host_ts, self.host = self._integrate(
+            tf, dt, save_every, phi0, None, dtype)
+        return self.ts, self.phases
+
+    def concentrations(self, state=0, index=None):
+        """ limit-cycle reconstruction of state (index or label of M1-M4)
+        for the simulated phases [len(ts), len(index)] """
+        phases = self.phases if index is None else self.phases[:, index]
+        return self.table.lc_state(phases, state)
+
+    def mean(self, state=0, weights=None):
+        """ population average of state over time, reconstructed in
+        chunks of time points so the full concentration array is never
+        held """
+        out = np.empty(len(self.ts))
+        chunk = max(1, int(1E6//max(len(self), 1)))
+        for i in range(0, len(self.ts), chunk):
+            conc = self.table.lc_state(self.phases[i:i+chunk], state)
+            out[i:i+chunk] = np.average(conc, axis=1, weights=weights)
+        return out
+
+    def validate(self, tf=200., sample=20, seed=None, state=0, dt=0.1,
+                 backend_model=mpm.malaria_model_numpy):
+        """
+        Runs the full malaria_pop_model for a random sample of the
+        population and the reduced model for the same parasites, from
+        the same initial condition. Returns a dict with the times, the
+        full and reduced values of state for each sampled parasite, and
+        the rms error of each parasite and of their mean.
+        """
+
+        index = np.sort(np.random.RandomState(seed).choice(
+            len(self), min(sample, len(self)), replace=False))
+        periods = self.periods[index]
+
+        model = backend_model(*self.experiment + (True,),
+                              periods=periods)[0]
+        full = lc.Oscillator(model, self.param,
+                             y0=mpm.population_y0(len(periods)))
+        sol = full.int_odes(tf, numsteps=int(tf/dt) + 1)[1]
+        state = self.table._index(state)
+        full_vals = sol[:, 5 + state::4]
+
+        ts, phases = self._integrate(tf, dt, 1, None, index,
+                                     np.float64)[:2]
+        red_vals = self.table.lc_state(phases, state)
+        red_vals = np.array([np.interp(full.ts, ts, r)
+                             for r in red_vals.T]).T
+
+        err = red_vals - full_vals
+        return {'index'     : index,
+                'ts'        : full.ts,
+                'full'      : full_vals,
+                'reduced'   : red_vals,
+                'rms'       : np.sqrt((err**2).mean(0)),
+                'rms_mean'  : np.sqrt(((red_vals.mean(1)
+                                        - full_vals.mean(1))**2).mean())}
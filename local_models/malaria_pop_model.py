@@ -37,7 +37,16 @@ from __future__ import division
 
 # python packages
 import numpy as np
-import casadi as cs
+from scipy import sparse
+from scipy.stats import norm
+try:
+    import casadi as cs
+except ImportError:
+    cs = None
+
+from local_imports.Backends import NumpyModel
+from local_models import experiment as ex
+from local_models.experiment import WT_period, FB_period
 
 modelversion = 'malaria_model'
 num_parasites = 100
@@ -55,12 +64,152 @@ y0in = np.hstack([ [0.05069219,  0.10174506,  2.28099242, 0.01522458,
 
 # periods so as to get the time right
 gonze_period = 30.27
-malaria_periods = np.random.normal(24.2, 1.3, num_parasites)
-WT_period = 23.7
-FB_period = 25.7
-
-
-def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,              malaria_intrinsic):
+period_mean = 24.2
+period_sd = 1.3
+malaria_periods = np.random.normal(period_mean, period_sd, num_parasites)
+
+
+def draw_periods(num_parasites, seed=None):
+    """ intrinsic parasite periods, drawn as for malaria_periods but with
+    an optional seed for reproducibility """
+    return np.random.RandomState(seed).normal(period_mean, period_sd,
+                                              num_parasites)
+
+def _van_der_corput(n, base=2):
+    """ first n points of the van der Corput sequence, skipping 0 """
+    out = np.zeros(n)
+    for i in range(n):
+        k, f = i + 1, 1/base
+        while k:
+            out[i] += f*(k % base)
+            k //= base
+            f /= base
+    return out
+
+def quadrature_periods(num_nodes, mean=period_mean, sd=period_sd,
+                       rule='quantile'):
+    """
+    Deterministic stand-in for draw_periods: nodes and normalized weights
+    over the normal period distribution, so population averages carry no
+    sampling noise. rule is
+        'quantile': equally weighted midpoints of num_nodes quantiles
+        'hermite' : Gauss-Hermite nodes and weights
+        'qmc'     : quasi-Monte Carlo (van der Corput) quantiles. nested,
+                    the first n of 2n nodes are the n nodes
+    Gauss-Hermite assumes the trajectory is smooth in the period, which
+    fails near the edge of entrainment, so the quantile rules usually
+    converge faster for these models. Returns (periods, weights).
+    """
+    if rule == 'hermite':
+        nodes, weights = np.polynomial.hermite_e.hermegauss(num_nodes)
+    elif rule == 'quantile':
+        nodes = norm.ppf((np.arange(num_nodes) + 0.5)/num_nodes)
+        weights = np.ones(num_nodes)
+    elif rule == 'qmc':
+        nodes = norm.ppf(_van_der_corput(num_nodes))
+        weights = np.ones(num_nodes)
+    else:
+        raise ValueError("rule must be 'quantile', 'hermite' or 'qmc'")
+    return mean + sd*nodes, weights/weights.sum()
+
+def population_y0(num_parasites):
+    """ y0in for a population of num_parasites """
+    return np.hstack([y0in[:5], np.tile(y0in[5:9], num_parasites)])
+
+def bin_periods(periods, tol=0.01):
+    """
+    Quantizes periods to multiples of tol (h). Parasites share the
+    equations, y0 block and host input, so equal periods give identical
+    trajectories and one representative per bin suffices. Returns the
+    representative periods, their multiplicities as normalized weights
+    for population_mean, and the bin of each original parasite for
+    expand_population.
+    """
+    keys = np.round(np.asarray(periods)/tol).astype(int)
+    keys, inverse, counts = np.unique(keys, return_inverse=True,
+                                      return_counts=True)
+    return keys*tol, counts/counts.sum(), inverse
+
+def expand_population(states, inverse):
+    """ per-parasite trajectory from that of the binned representatives,
+    keeping the host states """
+    blocks = states[:, 5:].reshape(len(states), -1, 4)[:, inverse]
+    return np.hstack([states[:, :5], blocks.reshape(len(states), -1)])
+
+def population_mean(states, weights=None, state=0):
+    """ (weighted) mean over parasites of parasite state (0-3 for M1-M4)
+    from a trajectory of the population model, states[:,5+state::4] """
+    return np.average(states[:, 5+state::4], axis=1, weights=weights)
+
+def mean_readout(num_parasites, weights=None, state=0, host_state=None):
+    """ vector c such that c.y is the population_mean of state, minus
+    host state (0-4 for X1-X4, B1) if given. For Adjoint functionals """
+    if weights is None: weights = np.ones(num_parasites)
+    weights = np.asarray(weights, dtype=float)
+    c = np.zeros(5 + 4*num_parasites)
+    c[5+state::4] = weights/weights.sum()
+    if host_state is not None: c[host_state] -= 1
+    return c
+
+
+def converged_population(light_schedule, mouse_signal, mouse_feeding,
+                         mouse_genotype, malaria_intrinsic, tol=1E-3,
+                         tf=200., numsteps=801, state=0, num_nodes=5,
+                         max_nodes=640, rule='quantile', builder=None,
+                         param=param):
+    """
+    Doubles the number of period nodes from num_nodes until the weighted
+    population mean of parasite state changes by less than tol (largest
+    absolute change over the trajectory) between successive node counts.
+    Parasites do not interact, so with the nested 'qmc' rule only the
+    added nodes are simulated at each doubling. builder is
+    malaria_model_numpy unless given. Returns a dict with the final
+    periods and weights, ts, the mean trajectory, whether tol was met,
+    and the (num_nodes, change) history.
+    """
+    from local_imports.LimitCycle import Oscillator
+
+    if builder is None: builder = malaria_model_numpy
+    experiment = (light_schedule, mouse_signal, mouse_feeding,
+                  mouse_genotype, malaria_intrinsic)
+
+    def simulate(periods):
+        """ trajectories of state for each parasite of periods """
+        model = builder(*experiment, periods=periods)[0]
+        osc = Oscillator(model, param, y0=population_y0(len(periods)))
+        ts, sol = osc.int_odes(tf, numsteps=numsteps)
+        return ts, sol[:, 5+state::4]
+
+    periods, weights = quadrature_periods(num_nodes, rule=rule)
+    ts, traj = simulate(periods)
+    mean = traj.dot(weights)
+    history = []
+    converged = False
+
+    while 2*num_nodes <= max_nodes:
+        num_nodes *= 2
+        periods, weights = quadrature_periods(num_nodes, rule=rule)
+        if rule == 'qmc':
+            traj = np.hstack([traj, simulate(periods[num_nodes//2:])[1]])
+        else:
+            traj = simulate(periods)[1]
+        new_mean = traj.dot(weights)
+        change = np.abs(new_mean - mean).max()
+        history.append((num_nodes, change))
+        mean = new_mean
+        if change < tol:
+            converged = True
+            break
+
+    return {'periods'   : periods,
+            'weights'   : weights,
+            'ts'        : ts,
+            'mean'      : mean,
+            'converged' : converged,
+            'history'   : history}
+
+
+def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,              malaria_intrinsic, periods=None, **options):
     """
     Malaria model of mouse-parasite circadian interation.
     light_schedule = ('DD', 'LD')
@@ -68,94 +217,31 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
     mouse_feeding = ('AdLib', 'Ultradian')
     mouse_genotype = ('WT', 'FB', 'YY')
     malaria_intrinsic = (True, False)
+    periods = intrinsic parasite periods, one per parasite (defaults to
+              malaria_periods)
+    options = mouse_period, forcing, brain_coupling, cycles, malaria_hill
+              overrides (see experiment.setup)
 
     The setup of the experiment is handled within this model.
     """
-
-    # set up signaling in model
-    if mouse_signal=='food':
-        feed_signal=1
-        brain_signal = bs =0
-    elif mouse_signal=='brain':
-        brain_signal = bs = 1
-        feed_signal = 0
-
-    # set up oscillator in malaria
-    if malaria_intrinsic==True:
-        nm = 4
-    elif malaria_intrinsic==False:
-        nm = 2
-
-    # set up mouse genotype
-    if mouse_genotype=='WT':
-        n = 4
-        cryko = 1.
-        mouse_period = WT_period
-    elif mouse_genotype=='FB':
-        n = 4
-        cryko = 1.
-        mouse_period = FB_period
-    elif mouse_genotype=='YY':
-        n = 4
-        cryko = 0.
-        bs = 0 # since we are averaging we don't want to average in the brain signal if there is none!
-        mouse_period = WT_period
+    if periods is None: periods = malaria_periods
+    npar = len(periods)
+
+    setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, malaria_intrinsic, **options)
+    feed_signal = setup['feed_signal']
+    bs = setup['bs']
+    nm = setup['nm']
+    n = setup['n']
+    cryko = setup['cryko']
+    mouse_period = setup['mouse_period']
 
     # Time
     t = cs.SX.sym('t')
     
-    # set up light schedule - 10 days
-    if light_schedule=='DD':
-        L = 0
-    elif light_schedule=='LD':
-        L = 0.01*((cs.heaviside(t) - cs.heaviside(t-12) + \
-            cs.heaviside(t-24) - cs.heaviside(t-12-24) + \
-            cs.heaviside(t-48) - cs.heaviside(t-12-48) + \
-            cs.heaviside(t-72) - cs.heaviside(t-12-72) + \
-            cs.heaviside(t-96) - cs.heaviside(t-12-96) + \
-            cs.heaviside(t-120) - cs.heaviside(t-12-120) + \
-            cs.heaviside(t-144) - cs.heaviside(t-12-144) + \
-            cs.heaviside(t-168) - cs.heaviside(t-12-168) + \
-            cs.heaviside(t-192) - cs.heaviside(t-12-192) + \
-            cs.heaviside(t-216) - cs.heaviside(t-12-216)))
-
-    # set up light schedule - 10 days
-    if mouse_feeding=='AdLib':
-        # if dd, mouse feeds on its own period
-        if light_schedule=='DD':
-            if mouse_genotype=="YY":
-                F = 0.005
-            else:
-                t1 = mouse_period/2
-                t2 = mouse_period
-                F = 0.01*((cs.heaviside(t) - cs.heaviside(t-t1) + \
-                    cs.heaviside(t-t2) - cs.heaviside(t-t1-t2) + \
-                    cs.heaviside(t-t2*2) - cs.heaviside(t-t1-t2*2) + \
-                    cs.heaviside(t-t2*3) - cs.heaviside(t-t1-t2*3) + \
-                    cs.heaviside(t-t2*4) - cs.heaviside(t-t1-t2*4) + \
-                    cs.heaviside(t-t2*5) - cs.heaviside(t-t1-t2*5) + \
-                    cs.heaviside(t-t2*6) - cs.heaviside(t-t1-t2*6) + \
-                    cs.heaviside(t-t2*7) - cs.heaviside(t-t1-t2*7) + \
-                    cs.heaviside(t-t2*8) - cs.heaviside(t-t1-t2*8) + \
-                    cs.heaviside(t-t2*9) - cs.heaviside(t-t1-t2*9)))
-        # if ld, mouse feeds on light-dark period
-        elif light_schedule=='LD':
-            t1 = 24/2
-            t2 = 24
-            F = 0.01*(cs.heaviside(t) - cs.heaviside(t-t1) + \
-                cs.heaviside(t-t2) - cs.heaviside(t-t1-t2) + \
-                cs.heaviside(t-t2*2) - cs.heaviside(t-t1-t2*2) + \
-                cs.heaviside(t-t2*3) - cs.heaviside(t-t1-t2*3) + \
-                cs.heaviside(t-t2*4) - cs.heaviside(t-t1-t2*4) + \
-                cs.heaviside(t-t2*5) - cs.heaviside(t-t1-t2*5) + \
-                cs.heaviside(t-t2*6) - cs.heaviside(t-t1-t2*6) + \
-                cs.heaviside(t-t2*7) - cs.heaviside(t-t1-t2*7) + \
-                cs.heaviside(t-t2*8) - cs.heaviside(t-t1-t2*8) + \
-                cs.heaviside(t-t2*9) - cs.heaviside(t-t1-t2*9))
-
-    elif mouse_feeding=='SpreadOut':
-        assert light_schedule=='LD', "Light schedule must be LD for ultradian feeding."
-        F = 0.005
+    # light and feeding schedules
+    L = ex.schedule_cs(t, setup['light'], setup['light_edits'])
+    F = ex.schedule_cs(t, setup['feeding'], setup['feeding_edits'])
 
 
     #############################################################
@@ -175,7 +261,7 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
     state_dict = {'X1':X1, 'X2':X2, 'X3':X3, 'X4':X4, 'B1':B1}
     
     # build parasite states
-    for pi in range(num_parasites):
+    for pi in range(npar):
         M1 = cs.SX.sym('M1_'+str(pi))
         M2 = cs.SX.sym('M2_'+str(pi))
         M3 = cs.SX.sym('M3_'+str(pi))
@@ -209,7 +295,7 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
     param_set = cs.vertcat([v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K])
 
     # oscillators
-    ode = [[]]*EqCount
+    ode = [[]]*(5 + 4*npar)
     
     # mouse mRNA, protein, TF, internal signal
     ode[0] = gonze_period/mouse_period*(cryko*v1*K1**n/(K1**n + X3**n) \
@@ -222,20 +308,20 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
     # mouse signal from brain to parasite
     ode[4] = gonze_period/mouse_period*(k7*(X1) - v8*B1/(K8+B1))
 
-    for pi in range(num_parasites):
+    for pi in range(npar):
         idx = pi*4+5
         M1 = state_dict['M1_'+str(pi)]
         M2 = state_dict['M2_'+str(pi)]
         M3 = state_dict['M3_'+str(pi)]
         M4 = state_dict['M4_'+str(pi)]
         # parasite states 1, 2, 3, 4 (same as mouse 1-4)
-        ode[idx] = gonze_period/malaria_periods[pi]*(v1*K1**nm/(K1**nm + M3**nm) \
+        ode[idx] = gonze_period/periods[pi]*(v1*K1**nm/(K1**nm + M3**nm) \
                 - v2*(M1)/(K2+M1) + (1/(1+bs))*vc*K*((M4))/(Kc +K*(M4)) \
                 + (bs/(1+bs))*vc*K*((B1))/(Kc +K*(B1)) ) \
                 + feed_signal*F
-        ode[idx+1] = gonze_period/malaria_periods[pi]*(k3*(M1) - v4*M2/(K4+M2))
-        ode[idx+2] = gonze_period/malaria_periods[pi]*(k5*M2 - v6*M3/(K6+M3))
-        ode[idx+3] = gonze_period/malaria_periods[pi]*(k7*(M1) - v8*M4/(K8+M4))
+        ode[idx+1] = gonze_period/periods[pi]*(k3*(M1) - v4*M2/(K4+M2))
+        ode[idx+2] = gonze_period/periods[pi]*(k5*M2 - v6*M3/(K6+M3))
+        ode[idx+3] = gonze_period/periods[pi]*(k7*(M1) - v8*M4/(K8+M4))
 
     ode = cs.vertcat(ode)
 
@@ -246,6 +332,166 @@ def malaria_model(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
 
     return fn, siso_cs_to_np(t, L), siso_cs_to_np(t, F)
 
+def malaria_model_numpy(light_schedule, mouse_signal, mouse_feeding,
+                        mouse_genotype, malaria_intrinsic, periods=None,
+                        **options):
+    """
+    Vectorized numpy version of malaria_model for the scipy solver
+    backend, with the same arguments. Parasites are handled as one
+    [num_parasites, 4] block rather than symbol by symbol, and the sparse
+    jacobian is supplied analytically. Returns a NumpyModel and numpy
+    light and feeding functions of time.
+    """
+
+    setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, malaria_intrinsic, **options)
+    fs = setup['feed_signal']
+    bs = setup['bs']
+    nm = setup['nm']
+    n = setup['n']
+    cryko = setup['cryko']
+    sm = gonze_period/setup['mouse_period']
+    if periods is None: periods = malaria_periods
+    sp_ = gonze_period/np.asarray(periods)
+    npar = len(sp_)
+    neq = 5 + 4*npar
+
+    # self-coupling and brain-signal weights in the parasite
+    a = 1/(1+bs)
+    b = bs/(1+bs)
+
+    def L(t): return ex.schedule_np(t, setup['light'],
+                                    setup['light_edits'])
+    def F(t): return ex.schedule_np(t, setup['feeding'],
+                                    setup['feeding_edits'])
+
+    def ode(t, y, p):
+        v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K = p
+        X1, X2, X3, X4, B1 = y[:5]
+        M = y[5:].reshape((npar, 4) + y.shape[1:])
+        M1, M2, M3, M4 = M[:,0], M[:,1], M[:,2], M[:,3]
+        s = sp_.reshape((npar,) + (1,)*(y.ndim-1))
+
+        dy = np.empty(y.shape, dtype=np.result_type(y, np.asarray(p)))
+        # mouse mRNA, protein, TF, internal signal
+        dy[0] = sm*(cryko*v1*K1**n/(K1**n + X3**n) - v2*X1/(K2+X1)
+                    + vc*K*X4/(Kc + K*X4)) + L(t)
+        dy[1] = sm*(k3*X1 - v4*X2/(K4+X2))
+        dy[2] = sm*(k5*X2 - v6*X3/(K6+X3))
+        dy[3] = sm*(k7*X1 - v8*B1/(K8+X4))
+        # mouse signal from brain to parasite
+        dy[4] = sm*(k7*X1 - v8*B1/(K8+B1))
+
+        # parasite states 1, 2, 3, 4 (same as mouse 1-4)
+        dM = dy[5:].reshape(M.shape)
+        dM[:,0] = s*(v1*K1**nm/(K1**nm + M3**nm) - v2*M1/(K2+M1)
+                     + a*vc*K*M4/(Kc + K*M4) + b*vc*K*B1/(Kc + K*B1)) \
+                  + fs*F(t)
+        dM[:,1] = s*(k3*M1 - v4*M2/(K4+M2))
+        dM[:,2] = s*(k5*M2 - v6*M3/(K6+M3))
+        dM[:,3] = s*(k7*M1 - v8*M4/(K8+M4))
+        return dy
+
+    # sparsity pattern: mouse block, then 10 entries per parasite block
+    host_rows = [0, 0, 0, 1, 1, 2, 2, 3, 3, 3, 4, 4]
+    host_cols = [0, 2, 3, 0, 1, 1, 2, 0, 3, 4, 0, 4]
+    base = 5 + 4*np.arange(npar)[:,None]
+    par_rows = base + np.array([0, 0, 0, 0, 1, 1, 2, 2, 3, 3])
+    par_cols = np.hstack([base + np.array([0, 2, 3]), 4 + 0*base,
+                          base + np.array([0, 1, 1, 2, 0, 3])])
+    rows = np.hstack([host_rows, par_rows.ravel()])
+    cols = np.hstack([host_cols, par_cols.ravel()])
+
+    def jac(t, y, p):
+        v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K = p
+        X1, X2, X3, X4, B1 = y[:5]
+        M = y[5:].reshape(npar, 4)
+        M1, M2, M3, M4 = M[:,0], M[:,1], M[:,2], M[:,3]
+
+        host = [-sm*v2*K2/(K2+X1)**2,
+                -sm*cryko*v1*K1**n*n*X3**(n-1)/(K1**n + X3**n)**2,
+                sm*vc*K*Kc/(Kc + K*X4)**2,
+                sm*k3, -sm*v4*K4/(K4+X2)**2,
+                sm*k5, -sm*v6*K6/(K6+X3)**2,
+                sm*k7, sm*v8*B1/(K8+X4)**2, -sm*v8/(K8+X4),
+                sm*k7, -sm*v8*K8/(K8+B1)**2]
+
+        par = np.empty((npar, 10), dtype=np.result_type(y, np.asarray(p)))
+        par[:,0] = -sp_*v2*K2/(K2+M1)**2
+        par[:,1] = -sp_*v1*K1**nm*nm*M3**(nm-1)/(K1**nm + M3**nm)**2
+        par[:,2] = sp_*a*vc*K*Kc/(Kc + K*M4)**2
+        par[:,3] = sp_*b*vc*K*Kc/(Kc + K*B1)**2
+        par[:,4] = sp_*k3
+        par[:,5] = -sp_*v4*K4/(K4+M2)**2
+        par[:,6] = sp_*k5
+        par[:,7] = -sp_*v6*K6/(K6+M3)**2
+        par[:,8] = sp_*k7
+        par[:,9] = -sp_*v8*K8/(K8+M4)**2
+
+        vals = np.hstack([host, par.ravel()])
+        return sparse.csr_matrix((vals, (rows, cols)), shape=(neq, neq))
+
+    ylabels = ['X1', 'X2', 'X3', 'X4', 'B1']
+    for pi in range(npar):
+        ylabels += ['M1_'+str(pi), 'M2_'+str(pi), 'M3_'+str(pi),
+                    'M4_'+str(pi)]
+    plabels = ['v1', 'K1', 'v2', 'K2', 'k3', 'v4', 'K4', 'k5', 'v6', 'K6',
+               'k7', 'v8', 'K8', 'vc', 'Kc', 'K']
+
+    model = NumpyModel(ode, ylabels, plabels, jac=jac, name="malaria_model")
+
+    return model, L, F
+
+def parasite_propensities(light_schedule, mouse_signal, mouse_feeding,
+                          mouse_genotype, malaria_intrinsic, host_ts, B1,
+                          periods=None, param=param, **options):
+    """
+    Birth and death propensities of the parasite states for the
+    stochastic integrators, for the experiment of malaria_model_numpy.
+    Each parasite state has one production and one degradation term of
+    its ODE. The host is deterministic and does not see the parasites,
+    so its brain signal enters as B1 sampled at host_ts. Returns
+    birth(t, M) and death(t, M) for a [num_parasites, 4] block M.
+    """
+
+    setup = ex.setup(light_schedule, mouse_signal, mouse_feeding,
+                              mouse_genotype, malaria_intrinsic, **options)
+    fs = setup['feed_signal']
+    bs = setup['bs']
+    nm = setup['nm']
+    if periods is None: periods = malaria_periods
+    s = gonze_period/np.asarray(periods)
+    a = 1/(1+bs)
+    b = bs/(1+bs)
+    v1,K1,v2,K2,k3,v4,K4,k5,v6,K6,k7,v8,K8,vc,Kc,K = param
+
+    def F(t): return ex.schedule_np(t, setup['feeding'],
+                                    setup['feeding_edits'])
+
+    def birth(t, M):
+        B1t = np.interp(t, host_ts, B1)
+        out = np.empty(M.shape)
+        out[:,0] = (v1*K1**nm/(K1**nm + M[:,2]**nm)
+                    + a*vc*K*M[:,3]/(Kc + K*M[:,3])
+                    + b*vc*K*B1t/(Kc + K*B1t))
+        out[:,1] = k3*M[:,0]
+        out[:,2] = k5*M[:,1]
+        out[:,3] = k7*M[:,0]
+        out *= s[:,None]
+        out[:,0] += fs*F(t)
+        return out
+
+    def death(t, M):
+        out = np.empty(M.shape)
+        out[:,0] = v2*M[:,0]/(K2+M[:,0])
+        out[:,1] = v4*M[:,1]/(K4+M[:,1])
+        out[:,2] = v6*M[:,2]/(K6+M[:,2])
+        out[:,3] = v8*M[:,3]/(K8+M[:,3])
+        out *= s[:,None]
+        return out
+
+    return birth, death
+
 def siso_cs_to_np(cs_in, cs_out):
     """
     Takes SISO casadi SXFunction and makes a function out of it that works like a numpy function. Input must be SX('t')
@@ -0,0 +1,118 @@
+"""
+Global sensitivity of malaria_pop_model scenarios to the 16 kinetic
+parameters (v1 ... K), by Morris screening and Sobol indices.
+
+Each sample runs one experiment for a small quadrature population of
+parasites and reports, over the last window hours,
+    host_period      mean period of the mouse clock (h)
+    parasite_period  weighted mean period of the parasites (h)
+    lag              weighted circular mean lag of the parasite M1 peaks
+                     behind the mouse X1 peak (h)
+    synchrony        order parameter R of the final parasite lags
+Samples whose oscillations are lost, or whose integration fails, give
+nan. The model is built once per process and experiment, and only the
+parameters vary between samples.
+
+    res = morris(trajectories=20, processes=4)
+    res['mu_star'][:, output_names.index('lag')]
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import LimitCycle as lc
+from local_imports import Entrainment as en
+from local_imports import GlobalSensitivity as gs
+from local_models import experiment as ex
+from local_models import malaria_model as mm
+from local_models import malaria_pop_model as mpm
+
+output_names = ['host_period', 'parasite_period', 'lag', 'synchrony']
+
+_models = {}
+
+
+def bounds(spread=0.2, param=mm.param):
+    """ [16, 2] box of param/(1 + spread) to param*(1 + spread) """
+    param = np.asarray(param, dtype=float)
+    return np.array([param/(1 + spread), param*(1 + spread)]).T
+
+def _scenario_model(experiment, num_parasites, tf):
+    """ population model and quadrature weights, cached per process """
+    key = (experiment, num_parasites, tf)
+    if key not in _models:
+        periods, weights = mpm.quadrature_periods(num_parasites)
+        model = mpm.malaria_model_numpy(
+            *experiment + (True,), periods=periods,
+            cycles=ex.forcing_cycles(tf, *experiment + (True,)))[0]
+        _models[key] = model, weights
+    return _models[key]
+
+def _period(ts, phase):
+    """ mean period of each phase column over its finite values """
+    ok = np.isfinite(phase)
+    first = np.argmax(ok, 0)
+    last = len(ts) - 1 - np.argmax(ok[::-1], 0)
+    cols = np.arange(phase.shape[1])
+    gain = phase[last, cols] - phase[first, cols]
+    return np.where(gain > 0, 2*np.pi*(ts[last] - ts[first])
+                    /np.where(gain > 0, gain, 1), np.nan)
+
+def scenario_outputs(p, experiment=('DD', 'food', 'AdLib', 'WT'),
+                     num_parasites=8, tf=480., dt=0.25, window=120.):
+    """ output_names values for parameters p (see module docstring) """
+    model, weights = _scenario_model(tuple(experiment), num_parasites, tf)
+    osc = lc.Oscillator(model, list(p),
+                        y0=mpm.population_y0(num_parasites))
+    try:
+        ts, sol = osc.int_odes(tf, numsteps=int(tf/dt) + 1)
+
+        late = ts >= tf - window
+        res = en.analyze(ts[late], sol[late], weights)
+        host_period = _period(ts[late], res['host_phase'][:, None])[0]
+        parasite_period = np.average(
+            _period(ts[late], res['parasite_phase']), weights=weights)
+    except (RuntimeError, ValueError, ArithmeticError):
+        # failed solves: nan rows are dropped by the estimators
+        return np.full(len(output_names), np.nan)
+
+    # mean and synchrony of the final lags to the host
+    z = np.exp(1j*res['final_lag']).dot(weights)/np.sum(weights)
+    lag_hours = -np.angle(z)*host_period/(2*np.pi)
+    synchrony = np.abs(z)
+
+    return np.array([host_period, parasite_period, lag_hours, synchrony])
+
+def morris(trajectories=10, levels=4, spread=0.2, log=True, seed=None,
+           processes=None, param=mm.param, **options):
+    """
+    Morris screening of scenario_outputs (options) over bounds(spread).
+    Returns the plan X, the outputs Y and mu, mu_star and sigma [16, 4]
+    per parameter and output, in output units per unit of the (log)
+    parameter range.
+    """
+    box = bounds(spread, param)
+    U = gs.morris_plan(len(box), trajectories, levels, seed)
+    X = gs.scale(U, box, log)
+    Y = gs.evaluate(scenario_outputs, X, processes, **options)
+    res = gs.morris_indices(U, Y, trajectories)
+    res.update(X=X, Y=Y)
+    return res
+
+def sobol(n=128, spread=0.2, log=True, seed=None, processes=None,
+          resamples=100, param=mm.param, **options):
+    """
+    First-order and total Sobol indices [16, 4] of scenario_outputs
+    (options) over bounds(spread), from n*(16 + 2) runs, with bootstrap
+    95% half-widths. Returns also the plan X and outputs Y.
+    """
+    box = bounds(spread, param)
+    U = gs.sobol_plan(len(box), n, seed)
+    X = gs.scale(U, box, log)
+    Y = gs.evaluate(scenario_outputs, X, processes, **options)
+    res = gs.sobol_indices(Y, len(box), resamples, seed)
+    res.update(X=X, Y=Y)
+    return res
@@ -0,0 +1,97 @@
+"""
+Stochastic version of malaria_pop_model.
+
+Parasite states carry intrinsic noise from their production and
+degradation reactions (malaria_pop_model.parasite_propensities) at a
+system volume: larger volumes are quieter. The host stays deterministic;
+it does not see the parasites, so its trajectory is integrated once per
+experiment and cached in each process. Outputs use the layout of the
+deterministic population model (host states, then M1-M4 of each
+parasite), so population_mean and the plotting code apply unchanged.
+
+    simulate     : one realization, Euler-Maruyama chemical Langevin
+                   ('cle') or tau-leaping ('tau')
+    realizations : many seeded realizations across processes
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import LimitCycle as lc
+from local_imports import Stochastic as st
+from local_models import malaria_pop_model as mpm
+
+# host trajectories by (experiment, tf, dt, param), per process
+_host_cache = {}
+
+
+def host_trajectory(experiment, tf, dt, param=mpm.param):
+    """ deterministic host states X1-X4, B1 on a grid of spacing dt from
+    0 to tf, for experiment (light, signal, feeding, genotype,
+    intrinsic) """
+    key = (tuple(experiment), tf, dt, tuple(param))
+    if key not in _host_cache:
+        model = mpm.malaria_model_numpy(*experiment, periods=[])[0]
+        host = lc.Oscillator(model, param, y0=mpm.y0in[:5])
+        _host_cache[key] = host.int_odes(tf,
+                                         numsteps=int(np.ceil(tf/dt)) + 1)
+    return _host_cache[key]
+
+def simulate(light_schedule, mouse_signal, mouse_feeding, mouse_genotype,
+             malaria_intrinsic, periods=None, tf=200., method='cle',
+             dt=0.01, volume=1000., seed=None, save_every=100,
+             param=mpm.param):
+    """
+    One realization from y0in, with the parasites of periods
+    (malaria_periods by default). dt is the Euler-Maruyama step or the
+    leap. Returns ts and states [len(ts), 5 + 4*num_parasites].
+    """
+
+    experiment = (light_schedule, mouse_signal, mouse_feeding,
+                  mouse_genotype, malaria_intrinsic)
+    if periods is None: periods = mpm.malaria_periods
+    periods = np.asarray(periods)
+
+    host_ts, host = host_trajectory(experiment, tf, dt, param)
+    birth, death = mpm.parasite_propensities(*experiment, host_ts=host_ts,
+                                             B1=host[:,4], periods=periods,
+                                             param=param)
+
+    M0 = np.tile(mpm.y0in[5:9], (len(periods), 1))
+    integrators = {'cle' : st.chemical_langevin, 'tau' : st.tau_leap}
+    ts, M = integrators[method](birth, death, M0, tf, dt, volume, seed,
+                                save_every)
+
+    host_out = np.array([np.interp(ts, host_ts, h) for h in host.T]).T
+    return ts, np.hstack([host_out, M.reshape(len(ts), -1)])
+
+def _realization(task):
+    """ pool worker: simulate(**task) """
+    return simulate(**task)
+
+def realizations(light_schedule, mouse_signal, mouse_feeding,
+                 mouse_genotype, malaria_intrinsic, num_realizations=10,
+                 seed=None, processes=None, **kwargs):
+    """
+    num_realizations independent realizations of simulate, each with its
+    own seed drawn reproducibly from seed, over a pool of processes.
+    kwargs are passed to simulate. Returns ts and states
+    [num_realizations, len(ts), 5 + 4*num_parasites].
+    """
+
+    experiment = dict(light_schedule=light_schedule,
+                      mouse_signal=mouse_signal,
+                      mouse_feeding=mouse_feeding,
+                      mouse_genotype=mouse_genotype,
+                      malaria_intrinsic=malaria_intrinsic)
+    tasks = []
+    for s in st.realization_seeds(seed, num_realizations):
+        task = dict(experiment, seed=s)
+        task.update(kwargs)
+        tasks.append(task)
+
+    out = st.run_realizations(_realization, tasks, processes)
+    return out[0][0], np.array([states for ts, states in out])
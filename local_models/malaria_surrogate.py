@@ -0,0 +1,89 @@
+"""
+Emulators of the run_population scenarios (Model x Case) for what-if
+queries near the standard parameters.
+
+scenario_outputs runs one scenario of malaria_pop_model with some
+values changed and reports, over the last window hours,
+    lag        lag of the peaks of the parasite mean M1 behind the mouse
+               X1 peaks (h, wrapped to within half a period)
+    amplitude  peak-to-trough range of the parasite mean M1
+    synchrony  order parameter R of the parasite phases
+Values can be any of the kinetic parameters (malaria_estimation.plabels),
+period_mean, period_sd, forcing, brain_coupling and nm (the parasite
+Hill coefficient). scenario_emulator trains a Surrogate.Emulator over a
+box of them.
+
+    emu = scenario_emulator('Model 4', 'Case1', ['vc', 'K', 'period_sd'],
+                            [[0.3, 0.5], [0.4, 0.6], [0.8, 2.]],
+                            processes=8)
+    mean, std, simulated = emu([[0.42, 0.55, 1.5]], tol=0.25)
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import Entrainment as en
+from local_imports import LimitCycle as lc
+from local_imports.Surrogate import Emulator
+from local_models import experiment as ex
+from local_models import malaria_estimation as me
+from local_models import malaria_model as mm
+from local_models import malaria_pop_model as mpm
+
+output_names = ['lag', 'amplitude', 'synchrony']
+
+# experiments            geno  light feeding, as in run_population
+cases = {"Case1": ['WT', 'DD', 'AdLib'],
+         "Case2": ['WT', 'LD', 'AdLib'],
+         "Case3": ['WT', 'LD', 'SpreadOut'],
+         "Case4": ['FB', 'DD', 'AdLib'],
+         "Case5": ['YY', 'DD', 'AdLib']}
+
+
+def scenario_outputs(x, names, model='Model 4', case='Case1',
+                     num_parasites=10, tf=200., dt=0.25, window=72.):
+    """ output_names of scenario (model, case) with names set to x """
+    values = dict(zip(me.plabels, mm.param))
+    values.update(period_mean=mpm.period_mean, period_sd=mpm.period_sd,
+                  forcing=0.01, brain_coupling=1., nm=None)
+    values.update(zip(names, x))
+
+    signal, intrinsic = me.models[model]
+    geno, light, feeding = cases[case]
+    experiment = (light, signal, feeding, geno, intrinsic)
+    periods, weights = mpm.quadrature_periods(
+        num_parasites, values['period_mean'], values['period_sd'])
+    model = mpm.malaria_model_numpy(
+        *experiment, periods=list(periods), forcing=values['forcing'],
+        brain_coupling=values['brain_coupling'], malaria_hill=values['nm'],
+        cycles=ex.forcing_cycles(tf, *experiment))[0]
+
+    osc = lc.Oscillator(model, [values[n] for n in me.plabels],
+                        y0=mpm.population_y0(num_parasites))
+    ts, sol = osc.int_odes(tf, numsteps=int(round(tf/dt)) + 1)
+    late = ts >= tf - window
+    ts, sol = ts[late], sol[late]
+    mean = mpm.population_mean(sol, weights)
+    host = en.peak_phase(ts, sol[:, 0])[:, 0]
+    lag = en.last_finite(en.phase_lag(en.peak_phase(ts, mean), host))[0]
+    parasites = en.peak_phase(ts, sol[:, 5::4])
+    R = en.order_parameter(parasites, weights)[0]
+    defined = np.isfinite(parasites).all(1)
+
+    # host period from the slope of its phase, to express the lag in h
+    rows = np.isfinite(host)
+    period = (2*np.pi/np.polyfit(ts[rows], host[rows], 1)[0]
+              if rows.sum() > 1 else np.nan)
+    return np.array([-lag*period/(2*np.pi), mean.max() - mean.min(),
+                     R[defined][-1] if defined.any() else np.nan])
+
+def scenario_emulator(model, case, names, bounds, samples=64, log=False,
+                      seed=None, processes=None, **options):
+    """ Emulator of scenario_outputs (options) for (model, case) over
+    bounds [len(names), 2] of names """
+    options.update(names=list(names), model=model, case=case)
+    return Emulator(scenario_outputs, bounds, samples, log, seed,
+                    processes, **options)
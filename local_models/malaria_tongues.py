@@ -0,0 +1,80 @@
+"""
+Entrainment of the parasite by the mouse over mouse period and signal
+strength, for Tongues.TongueMap.
+
+entrainment_cell simulates malaria_model in DD with the mouse period
+and the strength of the entraining signal (the feeding amplitude for
+food-entrained models, the brain signal weight bs for brain-entrained
+ones) and classifies 1:1 locking of the parasite to the mouse clock from
+the phase lag between their peaks. The forcing runs for the whole
+simulation.
+
+    tmap = tongue_map('food', (20., 28.), (0., 0.02), processes=4)
+    xs, ys, locked = tmap.as_arrays()
+
+jha
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import LimitCycle as lc
+from local_imports import Entrainment as en
+from local_imports.Tongues import TongueMap
+from local_models import malaria_model as mm
+from local_models import malaria_pop_model as mpm
+
+
+def entrainment_cell(mouse_period, strength, signal='food',
+                     malaria_intrinsic=True, tf=720., dt=0.25, tol=0.1,
+                     parasite_period=None):
+    """
+    Locking of the parasite to a mouse of period mouse_period through
+    signal at strength. parasite_period replaces the intrinsic period of
+    the parasite (malaria_period), through malaria_pop_model. Returns a
+    dict: locked, the final phase lag of the parasite behind the mouse
+    (h), the locking time (h, nan if not locked) and the ratio of
+    parasite to mouse peaks.
+    """
+
+    options = {'mouse_period' : mouse_period,
+               'cycles'       : int(np.ceil(tf/mouse_period)) + 1}
+    if signal == 'food': options['forcing'] = strength
+    else: options['brain_coupling'] = strength
+
+    if parasite_period is None:
+        model = mm.malaria_model_numpy('DD', signal, 'AdLib', 'WT',
+                                       malaria_intrinsic, **options)[0]
+    else:
+        model = mpm.malaria_model_numpy('DD', signal, 'AdLib', 'WT',
+                                        malaria_intrinsic,
+                                        periods=[parasite_period],
+                                        **options)[0]
+    osc = lc.Oscillator(model, mm.param, y0=mm.y0in)
+    ts, sol = osc.int_odes(tf, numsteps=int(tf/dt) + 1)
+
+    phases = en.peak_phase(ts, sol[:, [0, 5]])
+    lag = en.phase_lag(phases[:, 1:], phases[:, 0])
+    lock_time = en.entrainment_time(ts, lag, mouse_period, tol)[0]
+
+    # cycles of parasite per cycle of mouse over the last third of the
+    # run; a steady lag alone would also pass for 2:1 or 1:2 locking
+    late = phases[ts > 2*tf/3]
+    cycles = np.nanmax(late, 0) - np.nanmin(late, 0) if \
+        np.isfinite(late).any(0).all() else np.zeros(2)
+    ratio = cycles[1]/cycles[0] if cycles[0] > 0 else np.nan
+    locked = bool(np.isfinite(lock_time) and abs(ratio - 1) < 0.05)
+
+    return {'locked'    : locked,
+            'lag'       : -en.last_finite(lag)[0]*mouse_period/(2*np.pi),
+            'lock_time' : lock_time if locked else np.nan,
+            'ratio'     : ratio}
+
+def tongue_map(signal, period_range, strength_range, n0=8, max_level=3,
+               processes=None, **kwargs):
+    """ adaptive TongueMap of entrainment_cell for signal ('food' or
+    'brain'); kwargs go to entrainment_cell """
+    kwargs['signal'] = signal
+    return TongueMap(entrainment_cell, period_range, strength_range, n0,
+                     max_level, processes, **kwargs).run()
@@ -0,0 +1,234 @@
+"""
+Benchmarks for model construction, integration and limit-cycle analysis
+as a function of parasite population size.
+
+For each population size (parasite periods drawn with a fixed seed) and
+each solver backend, times:
+    malaria_model construction
+    Oscillator construction
+    int_odes(200) for each of the experiment cases
+    calc_y0, find_prc, findARC_whole
+and, once, the import of the compute modules in a fresh interpreter,
+which fails if they pull in matplotlib (plotting is kept to PlotOptions,
+ColorMapCreator and the figure scripts, so pool workers stay light).
+The limit-cycle stages run on Model 4 (brain-entrained, intrinsic
+parasites) in DD, which is autonomous, and only up to --max-lc-parasites,
+since the monodromy and ARC calculations are dense in the state count.
+
+Results go to results/benchmarks/latest.json. If a baseline exists it is
+compared stage by stage, and the script exits with status 1 when any
+stage is slower than the baseline by more than --threshold.
+
+    python run_benchmarks.py                       # time, compare
+    python run_benchmarks.py --save-baseline       # time, store as baseline
+    python run_benchmarks.py --sizes 10 100 --backends scipy
+"""
+
+# common imports
+from __future__ import division
+
+# python packages
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import time, strftime
+
+# local imports
+from local_imports import LimitCycle as lc
+from local_models import malaria_pop_model as mpm
+
+# experiments            geno  light feeding
+experiments = {"Case1": ['WT', 'DD', 'AdLib'],
+               "Case2": ['WT', 'LD', 'AdLib'],
+               "Case3": ['WT', 'LD', 'SpreadOut'],
+               "Case4": ['FB', 'DD', 'AdLib'],
+               "Case5": ['YY', 'DD', 'AdLib']
+               }
+
+# model 4, case 1: autonomous, so it has a limit cycle to analyze
+lc_scenario = ('DD', 'brain', 'AdLib', 'WT', True)
+
+builders = {'casadi': mpm.malaria_model,
+            'scipy' : mpm.malaria_model_numpy}
+
+outdir = 'results/benchmarks'
+
+# what a pool worker imports to integrate and analyze the models
+core_modules = ['local_imports.LimitCycle', 'local_imports.Utilities',
+                'local_imports.Backends', 'local_imports.Simulation',
+                'local_models.malaria_model', 'local_models.malaria_pop_model']
+
+
+def timed(fn, repeats=1):
+    """ best wall time of fn over repeats, its last output, and a status
+    string ('ok' or the error raised) """
+    best = None
+    out = None
+    for i in range(repeats):
+        start = time()
+        try:
+            out = fn()
+        except Exception as e:
+            return best, None, 'error: %s' % e
+        elapsed = time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out, 'ok'
+
+def stage_counters(osc, operation):
+    """ solver counters of the last recorded call to operation """
+    recs = osc.stats.query(operation, toplevel=True)
+    if not recs: return {}
+    return dict((k, v) for k, v in recs[-1].items()
+                if k in ('nsteps', 'nfevals', 'njevals'))
+
+def bench_import(repeats):
+    """ cold import of core_modules, which must not load matplotlib """
+    code = ('import sys, time; t = time.time(); ' +
+            '; '.join('import ' + m for m in core_modules) +
+            '; print(time.time() - t); ' +
+            'print(any(m.startswith("matplotlib") for m in sys.modules))')
+    best, status = None, 'ok'
+    for i in range(repeats):
+        try:
+            out = subprocess.check_output([sys.executable, '-c', code])
+        except subprocess.CalledProcessError as e:
+            status = 'error: %s' % e
+            break
+        elapsed, plotting = out.split()[-2:]
+        if plotting == b'True': status = 'error: imports matplotlib'
+        best = float(elapsed) if best is None else min(best, float(elapsed))
+    print('%8s %6s %-14s %-6s %s %s' % ('', '', 'import', '',
+          '%.3f' % best if best is not None else '-', status))
+    return [{'stage' : 'import', 'num_parasites' : 0, 'backend' : None,
+             'case' : None, 'time' : best, 'status' : status}]
+
+def bench_size(num_parasites, backend, seed, repeats, max_lc):
+    """ all stages for one population size and backend """
+
+    periods = mpm.draw_periods(num_parasites, seed)
+    y0 = mpm.population_y0(num_parasites)
+    build = builders[backend]
+    results = []
+
+    def add(stage, elapsed, status, case=None, **extra):
+        rec = {'stage' : stage, 'num_parasites' : num_parasites,
+               'backend' : backend, 'case' : case, 'time' : elapsed,
+               'status' : status}
+        rec.update(extra)
+        results.append(rec)
+        print('%8s %6d %-14s %-6s %s %s' % (backend, num_parasites, stage,
+              case or '', '%.3f' % elapsed if elapsed is not None else '-',
+              status))
+
+    # construction of the model and the oscillator
+    args = lc_scenario
+    elapsed, model, status = timed(lambda: build(*args, periods=periods)[0],
+                                   repeats)
+    add('model', elapsed, status)
+    if model is None: return results
+    elapsed, osc, status = timed(lambda: lc.Oscillator(model, mpm.param,
+                                                       y0=y0), repeats)
+    add('oscillator', elapsed, status)
+
+    # integration of each experiment
+    for case in sorted(experiments.keys()):
+        geno, lcyc, fcyc = experiments[case]
+        try:
+            model = build(lcyc, 'brain', fcyc, geno, True, periods=periods)[0]
+            osc = lc.Oscillator(model, mpm.param, y0=y0)
+        except Exception as e:
+            add('int_odes', None, 'error: %s' % e, case)
+            continue
+        elapsed, out, status = timed(lambda: osc.int_odes(200), repeats)
+        add('int_odes', elapsed, status, case, **stage_counters(osc,
+                                                               'int_odes'))
+
+    # limit cycle analysis
+    if num_parasites > max_lc:
+        for stage in ['calc_y0', 'find_prc', 'findARC_whole']:
+            add(stage, None, 'skipped')
+        return results
+
+    model = build(*lc_scenario, periods=periods)[0]
+    osc = lc.Oscillator(model, mpm.param, y0=y0, period_guess=mpm.WT_period)
+    elapsed, out, status = timed(osc.calc_y0)
+    add('calc_y0', elapsed, status, **stage_counters(osc, 'calc_y0'))
+    if status != 'ok': return results
+    elapsed, out, status = timed(osc.find_prc)
+    add('find_prc', elapsed, status, **stage_counters(osc, 'find_prc'))
+    if status != 'ok': return results
+    elapsed, out, status = timed(osc.findARC_whole)
+    add('findARC_whole', elapsed, status)
+
+    return results
+
+def compare(results, baseline, threshold):
+    """ stages slower than the baseline by more than threshold (as a
+    ratio), as (record, baseline time) pairs """
+    key = lambda r: (r['stage'], r['num_parasites'], r['backend'],
+                     r['case'])
+    base = dict((key(r), r) for r in baseline['results']
+                if r['status'] == 'ok')
+    slower = []
+    for r in results:
+        b = base.get(key(r))
+        if b is None or r['status'] != 'ok': continue
+        if r['time'] > threshold*b['time']:
+            slower.append((r, b['time']))
+    return slower
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--backends', nargs='+', default=['casadi', 'scipy'],
+                        choices=sorted(builders.keys()))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--max-lc-parasites', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=1.5)
+    parser.add_argument('--baseline', default=outdir+'/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true')
+    opts = parser.parse_args()
+
+    results = bench_import(opts.repeats)
+    for backend in opts.backends:
+        for num_parasites in opts.sizes:
+            results += bench_size(num_parasites, backend, opts.seed,
+                                  opts.repeats, opts.max_lc_parasites)
+
+    out = {'meta' : {'date' : strftime('%Y-%m-%d %H:%M:%S'),
+                     'python' : platform.python_version(),
+                     'machine' : platform.platform(),
+                     'seed' : opts.seed,
+                     'repeats' : opts.repeats},
+           'results' : results}
+
+    if not os.path.isdir(outdir): os.makedirs(outdir)
+    with open(outdir+'/latest.json', 'w') as f:
+        json.dump(out, f, indent=1)
+
+    if opts.save_baseline:
+        with open(opts.baseline, 'w') as f:
+            json.dump(out, f, indent=1)
+        print('Saved baseline to ' + opts.baseline)
+
+    elif os.path.exists(opts.baseline):
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, opts.threshold)
+        for r, tb in slower:
+            print('REGRESSION %s %s N=%d %s: %.3f s vs baseline %.3f s' % (
+                  r['backend'], r['stage'], r['num_parasites'],
+                  r['case'] or '', r['time'], tb))
+        if slower: sys.exit(1)
+        print('No stage slower than %.2fx baseline.' % opts.threshold)
+
+    if results[0]['status'] != 'ok':
+        print('IMPORT %s' % results[0]['status'])
+        sys.exit(1)
@@ -11,7 +11,15 @@ from matplotlib import gridspec
 from local_imports import LimitCycle as lc
 from local_imports import PlotOptions as plo
 from local_imports import Utilities as uts
-from local_models.malaria_pop_model import param, y0in, malaria_model
+from local_imports import Backends as bk
+from local_imports.SolverStats import SolverStats
+from local_models.malaria_pop_model import (param, y0in, malaria_model,
+                                            malaria_model_numpy,
+                                            malaria_periods,
+                                            quadrature_periods,
+                                            converged_population,
+                                            bin_periods,
+                                            population_y0, population_mean)
 
 def plot_L_F(ts, L, F, ax, light='DD'):
     """ plots bars for light (black-white) and feeding (geen-white)
@@ -58,6 +66,43 @@ experiments = {"Case1": ['WT', 'DD', 'AdLib'],
                "Case5": ['YY', 'DD', 'AdLib']
                }
 
+# pick whichever solver stack is faster at this population size
+builders = {'casadi': malaria_model, 'scipy': malaria_model_numpy}
+probe = dict((name, builder('DD', 'food', 'AdLib', 'WT', True)[0])
+             for name, builder in builders.items())
+backend, timings = bk.fastest_backend(probe, param, y0in)
+build_model = builders[backend]
+
+# timing and solver metrics for every scenario
+stats = SolverStats()
+
+# parasite population: 'random' uses the randomly drawn malaria_periods,
+# 'quadrature' weighted nodes over the same distribution, which gives a
+# noise-free population mean from far fewer parasites, and 'converged'
+# as few nodes as keep each scenario's mean within population_tol
+population = 'random'
+num_nodes = 20
+population_tol = 1E-3
+if population == 'quadrature':
+    periods, weights = quadrature_periods(num_nodes)
+else:
+    periods, weights = malaria_periods, None
+
+# simulate one parasite per bin_tol (h) of period, weighted by the bin
+# count; None to simulate every random parasite
+bin_tol = None
+if population == 'random' and bin_tol is not None:
+    periods, weights = bin_periods(periods, bin_tol)[:2]
+
+def scenario_population(lcyc, signal, fcyc, geno, osc):
+    """ parasite periods and weights for one scenario """
+    if population == 'converged':
+        conv = converged_population(lcyc, signal, fcyc, geno, osc,
+                                    tol=population_tol,
+                                    builder=build_model)
+        return conv['periods'], conv['weights']
+    return periods, weights
+
 
 # single-figure: just-in-time
 plo.PlotOptions(ticks='in')
@@ -74,8 +119,13 @@ for mi, model in enumerate(['Model 1', 'Model 2']):
         geno = experiments[case][0]
         lcyc = experiments[case][1]
         fcyc = experiments[case][2]
-        ODEs, L, F = malaria_model(lcyc, signal, fcyc, geno, osc)
-        model4_case1 = lc.Oscillator(ODEs, param, y0=y0in)
+        pops, pop_weights = scenario_population(lcyc, signal, fcyc, geno, osc)
+        ODEs, L, F = build_model(lcyc, signal, fcyc, geno, osc,
+                                 periods=pops)
+        stats.scenario = model+'/'+case
+        model4_case1 = lc.Oscillator(ODEs, param,
+                                     y0=population_y0(len(pops)),
+                                     stats=stats)
         ts, states = model4_case1.int_odes(200)
 
         # plot
@@ -84,7 +134,7 @@ for mi, model in enumerate(['Model 1', 'Model 2']):
         plot_L_F(ts, L, F, ax, light=lcyc)
         ax.plot(ts/24, states[:,5::4]/0.28, color='pink', alpha=0.1)
         ax.plot(ts/24, states[:,0]/0.28, color='f', label='Mouse Clock')
-        ax.plot(ts/24, states[:,5::4].mean(1)/0.28, ls=':', lw=1.5, color='h', label='Parasite mean')
+        ax.plot(ts/24, population_mean(states, pop_weights)/0.28, ls=':', lw=1.5, color='h', label='Parasite mean')
         ax.set_ylim([0,2.6])
         ax.set_yticks([0,0.5,1.])
         ax.set_xlim([0,8])
@@ -118,8 +168,13 @@ for mi, model in enumerate(['Model 3', 'Model 4']):
         geno = experiments[case][0]
         lcyc = experiments[case][1]
         fcyc = experiments[case][2]
-        ODEs, L, F = malaria_model(lcyc, signal, fcyc, geno, osc)
-        model4_case1 = lc.Oscillator(ODEs, param, y0=y0in)
+        pops, pop_weights = scenario_population(lcyc, signal, fcyc, geno, osc)
+        ODEs, L, F = build_model(lcyc, signal, fcyc, geno, osc,
+                                 periods=pops)
+        stats.scenario = model+'/'+case
+        model4_case1 = lc.Oscillator(ODEs, param,
+                                     y0=population_y0(len(pops)),
+                                     stats=stats)
         ts, states = model4_case1.int_odes(200)
 
         # plot
@@ -128,7 +183,7 @@ for mi, model in enumerate(['Model 3', 'Model 4']):
         plot_L_F(ts, L, F, ax, light=lcyc)
         ax.plot(ts/24, states[:,5::4]/0.28, color='pink', alpha=0.1)
         ax.plot(ts/24, states[:,0]/0.28, color='f', label='Mouse Clock')
-        ax.plot(ts/24, states[:,5::4].mean(1)/0.28, ls=':', lw=1.5, color='h', label='Parasite mean')
+        ax.plot(ts/24, population_mean(states, pop_weights)/0.28, ls=':', lw=1.5, color='h', label='Parasite mean')
         ax.set_ylim([0,2.6])
         ax.set_yticks([0,0.5,1.])
         ax.set_xlim([0,8])
@@ -146,6 +201,7 @@ for mi, model in enumerate(['Model 3', 'Model 4']):
 
 plt.tight_layout(**plo.layout_pad)
 plt.savefig('results/many/endogenous.pdf')
+stats.to_json('results/many/solver_stats.json')
 
 
 
@@ -168,7 +224,7 @@ plt.savefig('results/many/endogenous.pdf')
 #         geno = experiments[case][0]
 #         lcyc = experiments[case][1]
 #         fcyc = experiments[case][2]
-#         ODEs, L, F = malaria_model(lcyc, signal, fcyc, geno, osc)
+#         ODEs, L, F = build_model(lcyc, signal, fcyc, geno, osc)
 #         model4_case1 = lc.Oscillator(ODEs, param, y0=y0in)
 #         ts, states = model4_case1.int_odes(200)
 
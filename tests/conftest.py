@@ -0,0 +1,10 @@
+"""
+The tests import local_imports and local_models from the repository
+root, and are run from there with python -m pytest.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
@@ -0,0 +1,85 @@
+"""
+ABC-SMC importance weights: against the formula for a small population,
+and by the posterior recovering the prior when every particle is
+accepted.
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from local_imports import ABC
+
+
+def smc(particles=50, batch=None, seed=0):
+    bounds = [[[0., 1.]], [[0., 2.], [0., 1.]]]
+    sim = Shared(bounds)
+    return ABC.ABCSMC(sim, bounds, [0.5, 0.], lambda s, o: sim.distance(s),
+                      particles, batch=batch, processes=1, seed=seed)
+
+
+class Shared(object):
+    """ one-parameter summary for models of different dimension """
+
+    def __init__(self, bounds): self.bounds = bounds
+
+    def __call__(self, m, theta): return np.array([theta[0], m])
+
+    def distance(self, summaries): return np.abs(summaries[:, 0] - 0.5)
+
+
+def test_first_generation_weights_are_uniform():
+    abc = smc()
+    assert np.allclose(abc._weights([0, 1, 1], [[0.2], [0.1, 0.3],
+                                                [1.5, 0.9]]), 1)
+
+
+def test_weights_are_prior_over_proposal_density():
+    abc = smc()
+    var = np.array([0.04, 0.01])
+    abc.generations = [{
+        'model_proposal' : np.array([0.25, 0.75]),
+        'populations'    : {1 : {'theta' : np.array([[1., 0.5],
+                                                     [0.5, 0.2]]),
+                                 'w'     : np.array([0.6, 0.4]),
+                                 'var'   : var,
+                                 'inside' : 0.7}}}]
+    theta = np.array([0.9, 0.4])
+    kern = [np.exp(-0.5*(((theta - t)**2)/var).sum())
+            / np.sqrt(np.prod(2*np.pi*var))
+            for t in ([1., 0.5], [0.5, 0.2])]
+    prior = 1/(2*2.*1.)
+    expected = prior*0.7/(0.75*(0.6*kern[0] + 0.4*kern[1]))
+    assert np.allclose(abc._weights([1], [theta]), expected)
+
+
+def test_posterior_is_prior_without_rejection():
+    # epsilon = inf accepts everything, so after resampling and
+    # perturbation the importance weights must restore the prior
+    abc = smc(particles=2000, seed=1)
+    abc.run(3, epsilons=[np.inf]*3)
+    gen = abc.generations[-1]
+    assert np.allclose(gen['probabilities'], 0.5, atol=0.05)
+    theta = np.array([t[0] for t in gen['thetas']])
+    w = gen['weights']
+    for m, mean in [(0, 0.5), (1, 1.)]:
+        sel = gen['models'] == m
+        assert np.isclose(w[sel].dot(theta[sel])/w[sel].sum(), mean,
+                          atol=0.06)
+
+
+def test_rejection_concentrates_posterior():
+    abc = smc(particles=200, seed=2)
+    probabilities = abc.run(3, quantile=0.3)
+    assert np.allclose(probabilities.sum(), 1)
+    gen = abc.generations[-1]
+    assert gen['epsilon'] < abc.generations[0]['distances'].max()
+    assert (gen['distances'] <= gen['epsilon']).all()
+
+
+def test_no_acceptance():
+    abc = smc(particles=10, batch=5)
+    with pytest.raises(RuntimeError):
+        abc.generation(-1., max_simulations=20)
+    assert abc.run(2, epsilons=[-1., -1.], budget=20) is None
@@ -0,0 +1,64 @@
+"""
+Adjoint gradients against central differences of the functional.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import Adjoint
+from local_imports.Backends import NumpyModel
+from local_imports.LimitCycle import Oscillator
+
+PARAM = [0.8, 1.1, 0.3]
+Y0 = [1.2, -0.4]
+TF = 15.
+
+
+def van_der_pol(t, y, p):
+    """ forced van der Pol oscillator; vectorized, complex-safe """
+    x, v = y[0], y[1]
+    return np.array([v, p[0]*(1 - x**2)*v - p[1]*x + p[2]*np.sin(t)])
+
+
+def oscillator(param=PARAM):
+    model = NumpyModel(van_der_pol, ['x', 'v'], ['mu', 'k', 'a'])
+    osc = Oscillator(model, list(param), y0=list(Y0))
+    osc.intoptions.update(int_abstol=1E-11, int_reltol=1E-10)
+    return osc
+
+
+def value(functional, param=PARAM, y0=Y0):
+    """ G by integrating the forward solution on a fine grid """
+    osc = oscillator(param)
+    ts, sol = osc.int_odes(TF, y0=list(y0), numsteps=6001)
+    running = np.array([functional.running(t, y) for t, y in zip(ts, sol)])
+    return np.trapz(running, ts) + functional.final(sol[-1])
+
+
+def differences(functional, h=1E-5):
+    """ central differences of G in the parameters and in y0 """
+    dp = [(value(functional, np.add(PARAM, h*e)) -
+           value(functional, np.subtract(PARAM, h*e)))/(2*h)
+          for e in np.eye(len(PARAM))]
+    dy = [(value(functional, y0=np.add(Y0, h*e)) -
+           value(functional, y0=np.subtract(Y0, h*e)))/(2*h)
+          for e in np.eye(len(Y0))]
+    return np.array(dp), np.array(dy)
+
+
+def check(functional):
+    res = Adjoint.gradient(oscillator(), functional, TF, numsteps=2000,
+                           abstol=1E-10, reltol=1E-9)
+    dp, dy = differences(functional)
+    assert np.isclose(res['G'], value(functional), rtol=1E-5)
+    assert np.allclose(res['dGdp'], dp, rtol=1E-4, atol=1E-5)
+    assert np.allclose(res['dGdy0'], dy, rtol=1E-4, atol=1E-5)
+
+
+def test_gradient_of_final_state():
+    check(Adjoint.linear([1., -0.5], final=True))
+
+
+def test_gradient_of_running_cost():
+    check(Adjoint.tracking([1., 0.], np.cos))
@@ -0,0 +1,62 @@
+"""
+Fixed points of circle maps built from a sinusoidal PRC, where the phase
+flow dphi/ds = Tf*(omega + sin(phi) u) has known stationary points.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports.CircleMap import CircleMap
+from local_imports.PhaseReduction import PhaseTable
+
+
+def sine_table(res=512):
+    """ PhaseTable of a one-state oscillator with PRC sin(phi) """
+    table = PhaseTable.__new__(PhaseTable)
+    table.T, table.res, table.ylabels = 2*np.pi, res, ['x']
+    table.phis = np.linspace(0, 2*np.pi, res, endpoint=False)
+    table.lc = np.cos(table.phis)[:, None]
+    table.prc = np.sin(table.phis)[:, None]
+    return table
+
+
+def constant(u):
+    return lambda s, phi: u*np.ones(phi.shape)
+
+
+def test_stationary_point_of_the_flow():
+    # 0.5 + sin(phi) = 0: stable where cos(phi) < 0, at 7pi/6, and a
+    # phase error there shrinks by exp(cos(phi)) over one unit of s
+    cmap = CircleMap(sine_table(), 0.5, 1., constant(1.), res=256,
+                     steps=400)
+    phase, multiplier = cmap.fixed_points(p=0)
+    assert np.allclose(phase, 7*np.pi/6, atol=1E-3)
+    assert np.allclose(multiplier, np.exp(-np.sqrt(3)/2), atol=1E-2)
+
+
+def test_locked_phase_is_attracting():
+    # omega near one cycle per forcing period, modulated by a periodic
+    # drive: the 1:1 fixed point is where every phase ends up
+    def drive(s, phi): return 0.8*np.cos(2*np.pi*s)*np.ones(phi.shape)
+    cmap = CircleMap(sine_table(), [1.02, 1.5], 2*np.pi, drive, res=256)
+    phase, multiplier = cmap.fixed_points()
+
+    assert np.isfinite(phase[0]) and abs(multiplier[0]) < 1
+    mapped = cmap(np.nan_to_num(phase)[:, None])[0, 0]
+    assert np.isclose(mapped, phase[0] + 2*np.pi, atol=1E-3)
+    starts = np.tile(np.linspace(0, 6, 5), (2, 1))
+    ends = np.mod(cmap.iterate(starts, 200)[-1, 0], 2*np.pi)
+    assert np.allclose(ends, phase[0], atol=1E-3)
+
+    # too fast to lock
+    assert np.isnan(phase[1]) and np.isnan(multiplier[1])
+    assert cmap.rotation_number()[1].mean() > 1.1
+
+
+def test_unforced_rotation_has_no_fixed_points():
+    cmap = CircleMap(sine_table(), [0.9, 1.1], 2*np.pi, constant(0.),
+                     res=64)
+    phase, multiplier = cmap.fixed_points()
+    assert np.isnan(phase).all() and np.isnan(multiplier).all()
+    assert np.allclose(cmap.rotation_number().mean(1), [0.9, 1.1])
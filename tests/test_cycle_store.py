@@ -0,0 +1,98 @@
+"""
+CycleStore entries of a Brusselator limit cycle: restored without
+solving, missed by any other build, tolerances or backend, and the warm
+start of the BVP from the nearest stored parameters.
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from local_imports.Backends import NumpyModel, ScipyBackend
+from local_imports.CycleStore import CycleStore
+from local_imports.LimitCycle import Oscillator
+
+PARAM = [1., 3.]
+BUILD = {'builder' : 'brusselator', 'args' : [], 'kwargs' : {}}
+
+
+def brusselator(t, y, p):
+    x, v = y[0], y[1]
+    return np.array([p[0] - (p[1] + 1)*x + x**2*v, p[1]*x - x**2*v])
+
+MODEL = NumpyModel(brusselator, ['x', 'y'], ['a', 'b'])
+
+
+class Other(ScipyBackend):
+    name = 'other'
+
+
+def oscillator(store, param=PARAM, build=BUILD, y0=None, **kwargs):
+    return Oscillator(MODEL, list(param), y0=y0, period_guess=7.,
+                      store=store, build=build, **kwargs)
+
+
+def unsolvable(*args, **kwargs):
+    raise RuntimeError("no solve expected")
+
+
+def test_round_trip_restores_interpolants(tmpdir, monkeypatch):
+    store = CycleStore(str(tmpdir))
+    osc = oscillator(store)
+    osc.limit_cycle()
+    osc.find_prc()
+
+    # a second oscillator of the same model restores without solving
+    monkeypatch.setattr(Oscillator, 'burn_trans', unsolvable)
+    monkeypatch.setattr(Oscillator, 'solve_bvp', unsolvable)
+    copy = oscillator(store)
+    assert np.array_equal(copy.y0, osc.y0) and copy.T == osc.T
+    assert np.array_equal(copy.sol, osc.sol)
+    assert np.array_equal(copy.sPRC, osc.sPRC)
+    t = np.linspace(0, 2*osc.T, 7)
+    assert np.allclose(copy.lc(t), osc.lc(t))
+    assert np.allclose(copy.sPRC_interp(t), osc.sPRC_interp(t))
+    assert np.allclose(copy.pPRC_interp(t), osc.pPRC_interp(t))
+    assert np.allclose(copy.rel_pPRC, osc.rel_pPRC)
+
+
+def test_other_builds_tolerances_and_backends_miss(tmpdir):
+    store = CycleStore(str(tmpdir))
+    oscillator(store)
+    y0 = [1., 3.]
+    assert store.load(oscillator(store, y0=y0))
+
+    rebuilt = dict(BUILD, kwargs={'cycles' : 3})
+    assert not store.load(oscillator(store, build=rebuilt, y0=y0))
+    tight = oscillator(store, y0=y0)
+    tight.intoptions['int_reltol'] = 1E-10
+    assert not store.load(tight)
+    other = oscillator(store, y0=y0, backend=Other(MODEL))
+    assert not store.load(other)
+
+
+def test_warm_start_from_nearest_entry(tmpdir, monkeypatch):
+    store = CycleStore(str(tmpdir))
+    near = oscillator(store, [1., 3.])
+    oscillator(store, [1., 4.])
+    param = [1., 3.1]
+    probe = oscillator(store, param, y0=[1., 3.])
+    assert store.nearest(probe)['T'] == near.T
+
+    # no burn-in: the BVP is solved from the entry at b = 3
+    monkeypatch.setattr(Oscillator, 'burn_trans', unsolvable)
+    warm = oscillator(store, param, warm_start=True)
+    # ... to the limit cycle of the new parameters
+    assert warm.T != near.T
+    end = warm.int_odes(warm.T, numsteps=2)[1][-1]
+    assert np.allclose(end, warm.y0, atol=1E-6)
+    assert store.load(warm)
+
+    # a failed BVP leaves y0 as it was and reports the miss
+    monkeypatch.setattr(Oscillator, 'solve_bvp', unsolvable)
+    y0 = np.array([1., 2.])
+    failed = oscillator(store, [1., 3.2], y0=y0, warm_start=True)
+    assert not store.restore(failed, warm_start=True)
+    assert np.array_equal(failed.y0, y0)
+    assert not store.load(failed)
@@ -0,0 +1,105 @@
+"""
+Phases, lags, synchrony and entrainment times of sines with known
+offsets.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import Entrainment as en
+
+
+def test_order_parameter_of_known_phases():
+    phases = np.array([[0., 0.], [0., np.pi], [0., np.pi/2]])
+    R, psi = en.order_parameter(phases)
+    assert np.allclose(R, [1., 0., np.sqrt(0.5)])
+    assert np.isclose(psi[0], 0) and np.isclose(psi[2], np.pi/4)
+    R, psi = en.order_parameter(phases, [3., 1.])
+    assert np.isclose(R[1], 0.5) and np.isclose(psi[1], 0)
+
+
+def test_order_parameter_ignores_undefined_phases():
+    # before a column's first peak and after its last, its phase is NaN
+    nan = np.nan
+    phases = np.array([[1., nan], [1., 1.], [nan, 2.], [nan, nan]])
+    for weights in (None, [0.5, 0.5], [1., 3.]):
+        R, psi = en.order_parameter(phases, weights)
+        assert np.allclose(R[[0, 1, 2]], 1)
+        assert np.allclose(psi[[0, 1, 2]], [1., 1., 2.])
+        assert np.isnan(R[3]) and np.isnan(psi[3])
+
+
+def sines(ts, offsets, period=24.):
+    """ columns cos(2pi (t - offset)/period), peaking at offset + k period """
+    return np.cos(2*np.pi*(ts[:, None] - np.asarray(offsets))/period)
+
+
+def test_peak_phase_of_shifted_columns():
+    ts = np.arange(0, 120.25, 0.25)
+    offsets = [3., 10., 17.5]
+    phase = en.peak_phase(ts, sines(ts, offsets))
+    for c, offset in enumerate(offsets):
+        defined = np.isfinite(phase[:, c])
+        # 0 at the first peak and 2pi k at the later ones, linear between
+        t = ts[defined]
+        assert np.isclose(t[0], offset, atol=0.25)
+        assert np.allclose(phase[defined, c], 2*np.pi*(t - offset)/24.,
+                           atol=1E-3)
+        assert t[-1] <= offset + 96 + 1E-3
+
+
+def test_lag_of_shifted_sines():
+    ts = np.arange(0, 120.25, 0.25)
+    host = en.peak_phase(ts, sines(ts, [2.])[:, 0])
+    parasites = en.peak_phase(ts, sines(ts, [8., -4.]))
+    lag = en.phase_lag(parasites, host)
+    # a parasite peaking 6 h after the host lags by a quarter cycle; the
+    # second peaks 6 h before it (its first peak is at 20 h)
+    final = en.last_finite(lag)
+    assert np.allclose(final, [-np.pi/2, np.pi/2], atol=1E-3)
+
+
+def test_last_finite():
+    nan = np.nan
+    x = np.array([[1., nan, nan], [2., 5., nan], [nan, 6., nan],
+                  [nan, nan, nan]])
+    last = en.last_finite(x)
+    assert np.array_equal(last[:2], [2., 6.]) and np.isnan(last[2])
+    assert np.array_equal(en.last_finite(np.arange(3.)), [2.])
+
+
+def test_entrainment_time_of_a_settling_lag():
+    ts = np.arange(0, 240.5, 0.5)
+    # drifts linearly until 100 h, then holds
+    steady = np.where(ts < 100, 0.02*(ts - 100), 0.)
+    lag = np.column_stack([steady, 0.01*ts, steady])
+    lag[:20, 2] = np.nan     # undefined before the first peak
+    lag[-100:, 2] = np.nan   # and after the last
+    window, tol = 24., 0.1
+    time = en.entrainment_time(ts, lag, window, tol)
+    # the change over a window falls below tol once the window starts
+    # within tol/0.02 = 5 h of the end of the drift
+    assert np.allclose(time[[0, 2]], 95., atol=0.5)
+    # a drift of 0.24 rad per window never settles
+    assert np.isnan(time[1])
+    # a lag steady for less than two windows at the end is not entrained
+    short = np.where(ts < 200, 0.02*(ts - 200), 0.)
+    assert np.isnan(en.entrainment_time(ts, short, window, tol)[0])
+
+
+def test_analyze_population():
+    ts = np.arange(0, 240.25, 0.25)
+    host = sines(ts, [0.])
+    parasites = sines(ts, [6., 6., 6.])
+    states = np.zeros((len(ts), 5 + 4*3))
+    states[:, :1] = host
+    states[:, 5::4] = parasites
+    res = en.analyze(ts, states, weights=[1., 2., 1.])
+    assert np.allclose(res['final_lag'], -np.pi/2, atol=1E-3)
+    defined = np.isfinite(res['R'])
+    assert np.allclose(res['R'][defined], 1)
+    assert np.isnan(res['R'][0])
+    # the lag is constant from the first host peak at 24 h (a peak at
+    # the first sample is not found)
+    assert np.allclose(res['entrainment_time'], 24., atol=0.5)
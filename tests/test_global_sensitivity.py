@@ -0,0 +1,88 @@
+"""
+Morris and Sobol estimators on functions with known indices.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports import GlobalSensitivity as gs
+
+A = np.array([4., -2., 1., 0.])
+
+
+def linear(X):
+    """ two outputs, A.x and 3 - 2 A.x """
+    y = X.dot(A)
+    return np.column_stack([y, 3 - 2*y])
+
+
+def test_morris_plan_is_one_at_a_time():
+    k, r, levels = 4, 6, 4
+    X = gs.morris_plan(k, r, levels, seed=0).reshape(r, k + 1, k)
+    steps = np.diff(X, axis=1)
+    # each step moves exactly one factor, by delta, each factor once
+    moved = np.abs(steps) > 1E-12
+    assert (moved.sum(2) == 1).all()
+    assert (moved.sum(1) == 1).all()
+    delta = levels/(2*(levels - 1))
+    assert np.allclose(np.abs(steps[moved]), delta)
+    assert ((X >= 0) & (X <= 1)).all()
+
+
+def test_morris_indices_of_linear_function():
+    k, r = len(A), 8
+    X = gs.morris_plan(k, r, seed=1)
+    out = gs.morris_indices(X, linear(X), r)
+    assert np.allclose(out['mu'][:, 0], A)
+    assert np.allclose(out['mu_star'][:, 0], np.abs(A))
+    assert np.allclose(out['sigma'], 0)
+    assert np.allclose(out['mu'][:, 1], -2*A)
+
+
+def test_morris_sigma_flags_interactions():
+    k, r = 3, 20
+    X = gs.morris_plan(k, r, seed=2)
+    Y = X[:, 0]*X[:, 1] + X[:, 2]
+    out = gs.morris_indices(X, Y, r)
+    assert (out['sigma'][:2, 0] > 0.05).all()
+    assert np.isclose(out['sigma'][2, 0], 0)
+
+
+def test_sobol_indices_of_additive_function():
+    # uniform inputs: S1 = ST = A_i^2/sum(A^2)
+    k, n = len(A), 4096
+    X = gs.sobol_plan(k, n, seed=3)
+    assert X.shape == (n*(k + 2), k)
+    out = gs.sobol_indices(linear(X), k, resamples=50, seed=4)
+    expected = A**2/(A**2).sum()
+    for S in (out['S1'], out['ST']):
+        assert np.allclose(S[:, 0], expected, atol=0.03)
+        assert np.allclose(S[:, 1], expected, atol=0.03)
+    assert (out['S1_conf'] < 0.1).all()
+
+
+def test_sobol_total_index_includes_interaction():
+    # y = x0 x1: no first-order effect beyond the means, but large
+    # total indices
+    k, n = 2, 8192
+    X = gs.sobol_plan(k, n, seed=5) - 0.5
+    out = gs.sobol_indices(X[:, 0]*X[:, 1], k, resamples=0)
+    assert np.allclose(out['S1'][:, 0], 0, atol=0.05)
+    assert np.allclose(out['ST'][:, 0], 1, atol=0.05)
+
+
+def test_sobol_drops_failed_samples():
+    k, n = len(A), 2048
+    X = gs.sobol_plan(k, n, seed=6)
+    Y = linear(X)
+    Y[::37] = np.nan
+    out = gs.sobol_indices(Y, k, resamples=0)
+    assert np.isfinite(out['S1']).all()
+    assert np.allclose(out['ST'][:, 0], A**2/(A**2).sum(), atol=0.05)
+
+
+def test_scale_log():
+    U = np.array([[0., 0.5, 1.]]).T
+    assert np.allclose(gs.scale(U, [[1., 100.]], log=True).ravel(),
+                       [1., 10., 100.])
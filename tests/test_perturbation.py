@@ -0,0 +1,65 @@
+"""
+Phase shifts and resynchronization times of perturbation experiments:
+a null pulse, shifts of the light-dark schedule of known size and sign,
+and resync times measured from each onset.
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from local_models import malaria_perturbation as mp
+
+LD = ('LD', 'brain', 'AdLib', 'WT', True)
+DD = ('DD', 'brain', 'AdLib', 'WT', True)
+
+
+def test_null_pulse_shifts_nothing():
+    pulses = [mp.light_pulse(50., 1., 0.), mp.light_pulse(74., 1., 0.)]
+    res = mp.run_perturbations(DD, pulses, tf=192., num_parasites=2,
+                               processes=1)
+    for name in ['host', 'parasite']:
+        assert np.allclose(res[name + '_shift'], 0, atol=1E-4)
+        assert np.array_equal(res[name + '_resync'], [0., 0.])
+
+
+@pytest.fixture(scope='module')
+def shifted():
+    """ light schedule advanced 6 h at 48 and 72 h, and delayed 6 h at
+    48 h """
+    tf = 480.
+    shifts = [mp.schedule_shift(LD, onset, shift, ('light',), tf=tf)
+              for onset, shift in [(48., -6.), (72., -6.), (48., 6.)]]
+    return mp.run_perturbations(LD, shifts, tf=tf, num_parasites=2,
+                                processes=1)
+
+
+def test_schedule_shift_moves_the_host_with_it(shifted):
+    # the entrained host follows the schedule: advances are positive
+    assert np.allclose(shifted['host_shift'], [6., 6., -6.], atol=0.05)
+    assert np.array_equal(shifted['onsets'], [48., 72., 48.])
+
+
+def test_resync_is_measured_from_the_onset(shifted):
+    # the same shift a day later (at the same phase of the entrained
+    # host) takes as long to settle after its own onset
+    resync = shifted['host_resync']
+    assert np.isfinite(resync).all() and (resync > 24).all()
+    assert np.isclose(resync[0], resync[1], atol=0.5)
+
+
+def test_phase_shifts_of_shifted_sines():
+    ts = np.arange(0, 240.25, 0.25)
+    base = np.cos(2*np.pi*ts/24.)
+    onsets = np.array([60., 84., 60.])
+    # phase jumps at the onsets: 3 h advance, same a day later, 3 h delay
+    jumps = np.array([3., 3., -3.])
+    late = ts[:, None] >= onsets
+    series = np.cos(2*np.pi*(ts[:, None] + jumps*late)/24.)
+    shift, resync = mp.phase_shifts(ts, series, base, onsets)
+    assert np.allclose(shift, jumps, atol=1E-3)
+    # settled by the first peak after the jump, from each onset: 69 h
+    # for the advance at 60 h, 93 h a day later, 75 h for the delay
+    assert resync[0] == resync[1]
+    assert 0 < resync[0] <= 9 and resync[0] < resync[2] <= 15
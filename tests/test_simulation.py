@@ -0,0 +1,48 @@
+"""
+Continuing a run from a Snapshot gives the same trajectory as
+integrating the whole run at once.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports.Simulation import (Experiment, continue_from,
+                                      run_to_snapshot)
+from local_models import malaria_perturbation as mp
+from local_models import malaria_pop_model as mpm
+
+EXPERIMENT = ('LD', 'brain', 'AdLib', 'WT', True)
+
+
+def experiment(**edits):
+    options = dict(edits, periods=[23., 25.], cycles=6)
+    return Experiment(mpm.malaria_model_numpy, EXPERIMENT, options,
+                      mpm.param)
+
+
+def test_continuation_matches_full_run():
+    base = experiment()
+    y0 = mpm.population_y0(2)
+    snapshot, ts0, sol0 = run_to_snapshot(base, y0, 48., numsteps=193)
+    ts1, sol1 = continue_from(snapshot, base, 120., numsteps=289)
+
+    ts, sol = base.oscillator(y0).int_odes(120., numsteps=481)
+    assert np.allclose(ts0, ts[:193]) and np.allclose(ts1, ts[192:])
+    assert np.allclose(sol0, sol[:193], rtol=1E-5, atol=1E-7)
+    assert np.allclose(sol1, sol[192:], rtol=1E-5, atol=1E-7)
+
+
+def test_variant_continued_from_shared_phase():
+    # a pulse after the snapshot: the variant continued from the shared
+    # unperturbed phase is the variant integrated from the start
+    y0 = mpm.population_y0(2)
+    variant = experiment(**mp.light_pulse(60., 2.))
+    snapshot = run_to_snapshot(experiment(), y0, 48., numsteps=193)[0]
+    ts1, sol1 = continue_from(snapshot, variant, 120., numsteps=289)
+
+    ts, sol = variant.oscillator(y0).int_odes(120., numsteps=481)
+    assert np.allclose(sol1, sol[192:], rtol=1E-5, atol=1E-7)
+
+    unperturbed = experiment().oscillator(y0).int_odes(120., numsteps=481)
+    assert not np.allclose(sol1[-1], unperturbed[1][-1], rtol=1E-3)
@@ -0,0 +1,73 @@
+"""
+TrajectoryStore round trips of the int_odes layout.
+"""
+
+from __future__ import division
+
+import pickle
+
+import numpy as np
+
+from local_imports.Storage import TrajectoryStore
+
+
+def states(ts, num_parasites):
+    """ distinct values for every time, state and parasite """
+    columns = 5 + 4*num_parasites
+    return ts[:, None] + np.arange(columns)[None, :]/100.
+
+
+def test_write_and_read_back(tmpdir):
+    ts = np.arange(6.)
+    y = states(ts, 3)
+    store = TrajectoryStore.create(str(tmpdir), 3, 10, experiment='DD')
+    store.write(ts[:2], y[:2])
+    store.write(ts[2:], y[2:])
+    assert len(store) == 6
+    assert np.array_equal(store.to_states(), y)
+    assert np.array_equal(store.to_states(slice(1, 5, 2)), y[1:5:2])
+    assert np.array_equal(store.host_state(4), y[:, 4])
+    # parasite 1 holds columns 9-12, state M2 of all parasites 6, 10, 14
+    assert np.array_equal(store.parasite(1), y[:, 9:13].T)
+    assert np.array_equal(store.state(1), y[:, [6, 10, 14]].T)
+
+    reopened = TrajectoryStore(str(tmpdir))
+    assert reopened.meta['experiment'] == 'DD'
+    assert np.array_equal(reopened.to_states(), y)
+
+
+def test_weighted_mean_over_chunks(tmpdir):
+    ts = np.arange(4.)
+    y = states(ts, 5)
+    store = TrajectoryStore.create(str(tmpdir), 5, 4)
+    store.write(ts, y)
+    weights = np.array([1., 2., 3., 4., 5.])
+    expected = y[:, 5::4].dot(weights)/weights.sum()
+    assert np.allclose(store.mean(0, weights, chunk=2), expected)
+    assert np.allclose(store.mean(0), y[:, 5::4].mean(1))
+
+
+def test_pickles_as_its_path(tmpdir):
+    ts = np.arange(3.)
+    store = TrajectoryStore.create(str(tmpdir), 2, 3, dtype=np.float32)
+    store.write(ts, states(ts, 2))
+    data = pickle.dumps(store)
+    assert len(data) < 1000
+    copy = pickle.loads(data)
+    assert copy.mode == 'r+'
+    assert np.allclose(copy.to_states(), states(ts, 2), atol=1E-6)
+
+
+def test_resize_keeps_the_filled_rows(tmpdir):
+    ts = np.arange(4.)
+    y = states(ts, 2)
+    store = TrajectoryStore.create(str(tmpdir), 2, 4)
+    store.write(ts, y)
+    store.resize(8)
+    assert store.numsteps == 8
+    store.write(ts + 4, states(ts + 4, 2))
+    assert np.array_equal(store.to_states(), states(np.arange(8.), 2))
+
+    store.resize(3)
+    assert len(store) == 3
+    assert np.array_equal(TrajectoryStore(str(tmpdir)).to_states(), y[:3])
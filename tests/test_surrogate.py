@@ -0,0 +1,78 @@
+"""
+GaussianProcess predictions on smooth functions of the unit cube, and
+the Emulator falling back to simulation where it is unsure.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports.Estimation import latin_hypercube
+from local_imports.Surrogate import Emulator, GaussianProcess
+
+
+def smooth(x):
+    """ two outputs of different scale """
+    x = np.atleast_2d(x)
+    y = np.sin(3*x[:, 0]) + x[:, 1]**2
+    return np.column_stack([y, 100*np.cos(2*x[:, 0])])
+
+
+def simulate(x):
+    return smooth(x)[0]
+
+
+def test_predict_interpolates_the_design():
+    X = latin_hypercube(20, 2, 0)
+    gp = GaussianProcess(X, smooth(X), optimize=False)
+    mean, std = gp.predict(X)
+    assert np.allclose(mean, smooth(X), atol=1E-3*np.ptp(smooth(X), 0))
+    assert (std < 1E-2*gp.sd).all()
+
+
+def test_predict_matches_the_posterior_formula():
+    X = latin_hypercube(12, 2, 1)
+    Y = smooth(X)
+    gp = GaussianProcess(X, Y, noise=1E-4, optimize=False)
+    Xs = np.random.RandomState(2).rand(5, 2)
+    mean, std = gp.predict(Xs)
+
+    K = gp._kernel(X, X) + 1E-4*np.eye(len(X))
+    Ks = gp._kernel(Xs, X)
+    Z = (Y - Y.mean(0))/Y.std(0)
+    expected = Y.mean(0) + Y.std(0)*Ks.dot(np.linalg.solve(K, Z))
+    var = 1 + 1E-4 - (Ks*np.linalg.solve(K, Ks.T).T).sum(1)
+    assert np.allclose(mean, expected)
+    assert np.allclose(std, Y.std(0)*np.sqrt(var)[:, None])
+
+
+def test_optimized_gp_generalizes():
+    X = latin_hypercube(40, 2, 3)
+    gp = GaussianProcess(X, smooth(X))
+    Xs = np.random.RandomState(4).rand(200, 2)
+    mean, std = gp.predict(Xs)
+    error = np.abs(mean - smooth(Xs))
+    assert (error < 0.01*np.ptp(smooth(X), 0)).all()
+    # the standard deviation is an honest scale of the error
+    assert (error < 4*std + 1E-6).mean() > 0.95
+
+
+def test_nan_runs_are_dropped():
+    X = latin_hypercube(15, 2, 5)
+    Y = smooth(X)
+    Y[3, 1] = np.nan
+    gp = GaussianProcess(X, Y, optimize=False)
+    assert len(gp.X) == 14
+    assert np.isfinite(gp.predict(X)[0]).all()
+
+
+def test_emulator_simulates_uncertain_queries():
+    bounds = [[0., 1.], [0., 1.]]
+    emu = Emulator(simulate, bounds, samples=10, seed=6, processes=1)
+    n = len(emu.gp.X)
+    X = np.array([[0.5, 0.5], [3., 3.]])    # the second is far outside
+    mean, std, simulated = emu(X, tol=[0.05, 5.])
+    assert not simulated[0] and simulated[1]
+    assert np.allclose(mean[1], smooth(X[1]))
+    assert (std[1] == 0).all()
+    assert len(emu.gp.X) == n + 1
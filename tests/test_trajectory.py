@@ -0,0 +1,58 @@
+"""
+Hermite Trajectory: exact on cubics, and peaks, crossings and periods of
+a sampled sine within the interpolation error.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from local_imports.Trajectory import Trajectory
+
+
+def sine(ts, period=24.):
+    """ Trajectory of [sin, cos] of period through nodes ts """
+    w = 2*np.pi/period
+    ys = np.column_stack([np.sin(w*ts), np.cos(w*ts)])
+    dys = w*np.column_stack([np.cos(w*ts), -np.sin(w*ts)])
+    return Trajectory(ts, ys, dys, ylabels=['s', 'c'])
+
+
+def test_exact_on_cubics():
+    ts = np.array([0., 0.7, 1.5, 3., 3.2, 5.])
+    f = lambda t: t**3/3 - 2*t**2 + 3*t
+    df = lambda t: (t - 1)*(t - 3)
+    traj = Trajectory(ts, f(ts)[:, None], df(ts)[:, None])
+    t = np.linspace(0, 5, 101)
+    assert np.allclose(traj(t, 0), f(t))
+    assert traj(t).shape == (101, 1)
+    assert np.allclose(traj(t)[:, 0], f(t))
+    # maximum at 1 and minimum at 3, where f' = (t - 1)(t - 3) vanishes
+    assert np.allclose(traj.peaks(0), ([1.], [f(1.)]))
+    assert np.allclose(traj.extrema(0, 'min'), ([3.], [f(3.)]))
+
+
+def test_peaks_of_a_sine():
+    ts = np.arange(0, 120.5, 1.5)
+    traj = sine(ts)
+    times, values = traj.peaks('s')
+    assert np.allclose(times, 6 + 24*np.arange(5), atol=1E-3)
+    assert np.allclose(values, 1, atol=1E-5)
+    assert np.isclose(traj.period('s'), 24., atol=1E-3)
+    times = traj.extrema('c', 'min')[0]
+    assert np.allclose(times, 12 + 24*np.arange(5), atol=1E-3)
+
+
+def test_peak_on_a_node_is_found_once():
+    traj = sine(np.arange(0, 48.5, 2.))    # nodes at the peaks 6 and 30
+    assert np.allclose(traj.peaks(0)[0], [6., 30.], atol=1E-6)
+
+
+def test_crossings_of_a_sine():
+    traj = sine(np.arange(0, 72.5, 2.5))
+    up = traj.crossings('s', 0.5, direction=1)
+    down = traj.crossings('s', 0.5, direction=-1)
+    both = traj.crossings('s', 0.5)
+    assert np.allclose(up, [2., 26., 50.], atol=1E-3)
+    assert np.allclose(down, [10., 34., 58.], atol=1E-3)
+    assert np.allclose(both, np.sort(np.hstack([up, down])))